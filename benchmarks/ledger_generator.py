@@ -0,0 +1,178 @@
+import hashlib
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from open_crypto_tax.core import Validator, NUM_GAS_TX_ALLOWED
+
+# relative frequency of each kind of ledger row
+ROW_KINDS = {
+    "swap": 0.30,
+    "buy": 0.14,
+    "sell": 0.12,
+    "gas": 0.16,
+    "income": 0.12,
+    "gift_to_me": 0.04,
+    "gift_from_me": 0.04,
+    "business_income": 0.04,
+    "usd_fee_buy": 0.04,
+}
+ASSETS = ["ETH", "BNB", "UNI", "SUSHI", "LINK", "AAVE", "CAKE", "MKR", "CRV", "PUNK"]
+FEE_CHAINS = ["ETH", "BSC"]
+FEE_CHAIN_PROBABILITIES = [0.7, 0.3]
+START_TIMESTAMP = 1546300800  # 01/01/2019 00:00:00 UTC
+ROW_SPACING = 600  # seconds between ledger rows
+START_BLOCK = {"ETH": 6988615, "BSC": 500000}
+BLOCK_TIME = {"ETH": 13, "BSC": 3}
+LONDON_BLOCK = 12965000  # ETH receipts after this block carry effectiveGasPrice
+DATE_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+
+
+def fake_tx_hash(seed: int, row: int, slot: int):
+    return "0x" + hashlib.sha256(f"{seed}:{row}:{slot}".encode()).hexdigest()
+
+
+def generate_ledger(num_rows: int, seed: int = 0):
+    """
+    Generates a synthetic, valid, unchecked ledger in the Validator input schema
+    :param num_rows: int number of ledger rows
+    :param seed: int random seed; the same seed always generates the same ledger
+    :return: tuple of:
+                ledger: pd.DataFrame unchecked input data
+                receipts: pd.DataFrame of chain, tx_hash, block_number, gas_used, effective_gas_price, gas_price
+                          for every fee tx referenced by the ledger
+    """
+    rng = np.random.RandomState(seed)
+    kinds = rng.choice(list(ROW_KINDS.keys()), size=num_rows, p=list(ROW_KINDS.values()))
+    timestamps = START_TIMESTAMP + np.arange(num_rows, dtype="int64") * ROW_SPACING
+    df = pd.DataFrame(np.nan, index=range(num_rows), columns=Validator.input_columns, dtype=object)
+    df["Date"] = pd.to_datetime(timestamps, unit="s").strftime(DATE_FORMAT)
+    buy_asset_index = rng.randint(0, len(ASSETS), num_rows)
+    # offset by at least one, so an asset is never swapped for itself
+    sell_asset_index = (buy_asset_index + rng.randint(1, len(ASSETS), num_rows)) % len(ASSETS)
+    buy_assets = np.array(ASSETS)[buy_asset_index]
+    sell_assets = np.array(ASSETS)[sell_asset_index]
+    buy_qty = np.round(rng.lognormal(0.0, 1.0, num_rows), 6)
+    sell_qty = np.round(rng.lognormal(0.0, 1.0, num_rows), 6)
+    buy_spot = np.round(rng.lognormal(4.0, 1.5, num_rows), 4)
+    sell_spot = np.round(rng.lognormal(4.0, 1.5, num_rows), 4)
+    half = rng.rand(num_rows) < 0.5
+
+    def _set(mask, column, values):
+        df.loc[mask, column] = values[mask] if isinstance(values, np.ndarray) else values
+
+    has_buy = np.isin(kinds, ["swap", "buy", "income", "gift_to_me", "business_income", "usd_fee_buy"])
+    has_sell = np.isin(kinds, ["swap", "sell", "gift_from_me"])
+    _set(has_buy, "BuyAsset", buy_assets)
+    _set(has_buy, "BuyQty", buy_qty)
+    _set(has_sell, "SellAsset", sell_assets)
+    _set(has_sell, "SellQty", sell_qty)
+    # swaps - one side is priced, the other is "equal"
+    swap = kinds == "swap"
+    _set(swap & half, "BuySpotPriceUSD", buy_spot)
+    _set(swap & half, "SellTotalUSD", "equal")
+    _set(swap & ~half, "SellSpotPriceUSD", sell_spot)
+    _set(swap & ~half, "BuyTotalUSD", "equal")
+    _set(swap & half, "BookFeeWith", "buy")
+    _set(swap & ~half, "BookFeeWith", "sell")
+    # buys and sells - priced by spot price or total
+    for kind, side, spot, qty in [("buy", "Buy", buy_spot, buy_qty), ("usd_fee_buy", "Buy", buy_spot, buy_qty),
+                                  ("sell", "Sell", sell_spot, sell_qty)]:
+        mask = kinds == kind
+        _set(mask & half, f"{side}SpotPriceUSD", spot)
+        _set(mask & ~half, f"{side}TotalUSD", np.round(spot * qty, 2))
+    _set(kinds == "usd_fee_buy", "AuxUSDFee", np.round(rng.uniform(0.5, 20.0, num_rows), 2))
+    # income and gifts
+    _set(kinds == "income", "IsOrdinaryIncome", 1.0)
+    _set(kinds == "income", "BuySpotPriceUSD", buy_spot)
+    _set(kinds == "business_income", "IsBusinessIncome1", 1.0)
+    _set(kinds == "business_income", "BuySpotPriceUSD", buy_spot)
+    _set(kinds == "gift_to_me", "IsGiftToMe", 1.0)
+    _set(kinds == "gift_to_me", "GiftBasisUSD", np.round(buy_spot * buy_qty, 2))
+    _set(kinds == "gift_from_me", "IsGiftFromMe", 1.0)
+    _set(kinds == "gift_from_me", "SellSpotPriceUSD", sell_spot)
+    _set(kinds == "gas", "BookFeeWith", "gas")
+    df.loc[has_buy | has_sell, "Purchased From"] = "synthetic"
+    # fee txs - gas rows always have some, most trades and income have one or two
+    can_have_fees = np.isin(kinds, ["swap", "buy", "sell", "gas", "income", "gift_from_me"])
+    num_fee_txs = np.where(kinds == "gas", rng.randint(1, 4, num_rows), rng.choice([0, 1, 1, 2], size=num_rows))
+    num_fee_txs = np.where(can_have_fees, np.minimum(num_fee_txs, NUM_GAS_TX_ALLOWED), 0)
+    fee_chains = rng.choice(FEE_CHAINS, size=num_rows, p=FEE_CHAIN_PROBABILITIES)
+    receipts = []
+    for slot in range(0, int(num_fee_txs.max()) if num_rows > 0 else 0):
+        rows = np.nonzero(num_fee_txs > slot)[0]
+        hashes = [fake_tx_hash(seed, row, slot) for row in rows]
+        df.loc[rows, f"FeeChain{slot + 1}"] = fee_chains[rows]
+        df.loc[rows, f"FeeTx{slot + 1}"] = hashes
+        receipts.append(pd.DataFrame({"chain": fee_chains[rows], "tx_hash": hashes, "row": rows}))
+    receipts = pd.concat(receipts, ignore_index=True) if len(receipts) > 0 else \
+        pd.DataFrame({"chain": [], "tx_hash": [], "row": []})
+    # all fee txs of a row land in the same block, like an approve + swap
+    _start_block = receipts["chain"].map(START_BLOCK).to_numpy(dtype="int64")
+    _block_time = receipts["chain"].map(BLOCK_TIME).to_numpy(dtype="int64")
+    receipts["block_number"] = _start_block + (timestamps[receipts["row"]] - START_TIMESTAMP) // _block_time
+    receipts["gas_used"] = rng.randint(21000, 400000, len(receipts))
+    receipts["gas_price"] = rng.randint(1, 200, len(receipts)).astype("int64") * 1000000000
+    # only post-London ETH receipts carry effectiveGasPrice
+    _post_london = (receipts["chain"] == "BSC") | (receipts["block_number"] >= LONDON_BLOCK)
+    receipts["effective_gas_price"] = receipts["gas_price"].where(_post_london)
+    return df, receipts.drop(columns=["row"])
+
+
+def generate_gains_input(num_rows: int, seed: int = 0):
+    """
+    Generates a synthetic gains input (generate_reports.py schema) whose sells are always covered by earlier buys
+    :param num_rows: int number of rows
+    :param seed: int random seed
+    :return: pd.DataFrame gains input data
+    """
+    rng = np.random.RandomState(seed)
+    assets = rng.choice(ASSETS, size=num_rows)
+    # ETH pays every gas fee, so start with a large ETH buy
+    assets[0] = "ETH"
+    timestamps = START_TIMESTAMP + np.arange(num_rows, dtype="int64") * ROW_SPACING
+    qty = np.round(rng.lognormal(0.0, 1.0, num_rows), 6)
+    qty[0] = 10.0 + num_rows * 0.01
+    # within each asset, alternate buys and sells of half the previous buy
+    nth = pd.Series(assets).groupby(assets).cumcount().to_numpy()
+    is_sell = (nth % 2 == 1)
+    prev_qty = pd.Series(qty).groupby(assets).shift(1).to_numpy()
+    qty_change = np.where(is_sell, -0.5 * np.nan_to_num(prev_qty), qty)
+    spot = np.round(rng.lognormal(4.0, 1.5, num_rows), 4)
+    has_gas = rng.rand(num_rows) < 0.5
+    fee_qty = np.where(has_gas, np.round(rng.uniform(0.0001, 0.005, num_rows), 6), 0.0)
+    return pd.DataFrame({
+        "Date": pd.to_datetime(timestamps, unit="s").strftime(DATE_FORMAT),
+        "Asset": assets,
+        "Type": np.where(is_sell, "Sell", np.where(rng.rand(num_rows) < 0.1, "income_non_business", "Buy")),
+        "Qty Change": qty_change,
+        "Spot Price USD": spot,
+        "TxnFeeAsset": np.where(has_gas, "ETH", ""),
+        "TxnFee(ASSET)": fee_qty,
+        "TxnFee(USD)": np.round(fee_qty * 2000.0, 4),
+        "Tx Receipts": "",
+        "Purchased From": "synthetic",
+        "Other": "",
+    })
+
+
+def write_ledger(num_rows: int, out_dir: Path, seed: int = 0):
+    """
+    Writes a synthetic ledger, its receipts fixture (served by the mock server) and a gains input to out_dir
+    :return: tuple of Paths of (ledger csv, receipts fixture csv, gains input csv)
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    ledger, receipts = generate_ledger(num_rows, seed)
+    ledger_file = out_dir / f"ledger_{num_rows}.csv"
+    receipts_file = out_dir / f"receipts_{num_rows}.csv"
+    gains_file = out_dir / f"gains_input_{num_rows}.csv"
+    ledger.to_csv(ledger_file, index=False)
+    receipts.to_csv(receipts_file, index=False)
+    generate_gains_input(num_rows, seed).to_csv(gains_file, index=False)
+    return ledger_file, receipts_file, gains_file
+
+
+if __name__ == "__main__":
+    # e.g. python -m benchmarks.ledger_generator 100000 out/benchmarks
+    argvs = sys.argv
+    write_ledger(int(argvs[1]), Path(argvs[2]) if len(argvs) >= 3 else Path("out/benchmarks"))
@@ -0,0 +1,203 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from mock_server import MockDataset, MockServer
+
+STAGES = ["validate", "resolve_fees", "process_tokentax", "balances", "gains", "prices"]
+DEFAULT_SIZES = [1000, 100000, 1000000]
+NUM_PRICE_SAMPLES = 100  # subgraph price lookups timed by the prices stage
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def max_rss_mb():
+    # linux reports kilobytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure_environment(server: MockServer):
+    # must happen before web3_api and subgraph_api are imported, since they connect at import time
+    os.environ.update(server.env())
+
+
+class StageTimer:
+    def __init__(self, server: MockServer, verbose: bool):
+        self.server = server
+        self.verbose = verbose
+        self.results = []
+        self.metrics = dict()  # run metrics report per ledger size
+
+    @contextlib.contextmanager
+    def time(self, stage: str, num_rows: int):
+        _requests = self.server.num_requests
+        with open(os.devnull, "w") as devnull, \
+                contextlib.redirect_stdout(sys.stdout if self.verbose else devnull):
+            _start = time.perf_counter()
+            yield
+            _seconds = time.perf_counter() - _start
+        result = {
+            "stage": stage,
+            "rows": num_rows,
+            "seconds": _seconds,
+            "rows_per_second": num_rows / _seconds if _seconds > 0 else None,
+            "rpc_requests": self.server.num_requests - _requests,
+            "max_rss_mb": max_rss_mb(),
+        }
+        self.results.append(result)
+        print(f"[INFO] {num_rows:>9} rows  {stage:<17} {_seconds:10.3f}s  "
+              f"({result['rpc_requests']} http requests)")
+
+
+def run_size(num_rows: int, stages: list, workdir: Path, server: MockServer, timer: StageTimer,
+             num_workers: int, seed: int):
+    # imported here so env is configured first
+    import pandas as pd
+    from web3_api import caches
+    from open_crypto_tax import Validator, Processor
+    from open_crypto_tax.gains import generate_gains_report
+    from subgraph_api import SubgraphQuery
+    from metrics import Metrics
+    from .ledger_generator import write_ledger
+
+    print(f"[INFO] generating synthetic ledger of {num_rows} rows")
+    ledger_file, receipts_file, gains_file = write_ledger(num_rows, workdir / "ledgers", seed)
+    receipts = pd.read_csv(receipts_file)
+    # the ledger's fee txs are served exactly as generated, everything else comes from the mock dataset
+    server.dataset = MockDataset(receipts, seed)
+    # every size starts with cold caches
+    for _db in [caches.db, caches.token_db, caches.block_db, caches.price_db]:
+        _db.deldb()
+    Metrics.reset()
+    valid_file = workdir / f"input_valid_{num_rows}.csv"
+    if "validate" in stages:
+        with timer.time("validate", num_rows):
+            Validator(ledger_file).process(valid_file)
+    processor = None
+    if "resolve_fees" in stages or "process_tokentax" in stages or "balances" in stages:
+        if not valid_file.exists():
+            raise LookupError(f"{valid_file} missing - the validate stage must run before processing stages")
+        processor = Processor(valid_file)
+    if "resolve_fees" in stages:
+        with timer.time("resolve_fees", num_rows):
+            processor.resolve_fees()
+    if "process_tokentax" in stages:
+        with timer.time("process_tokentax", num_rows):
+            processor.process_tokentax(num_workers=num_workers)
+    if "balances" in stages:
+        if processor.df_tt is None:
+            processor.process_tokentax(num_workers=num_workers)
+        with timer.time("balances", num_rows):
+            processor.generate_balances_from_tokentax(workdir / f"balances_{num_rows}.csv")
+    if "gains" in stages:
+        df_gains = pd.read_csv(gains_file)
+        with timer.time("gains", num_rows):
+            generate_gains_report(df_gains)
+    if "prices" in stages:
+        _blocks = sorted(set(receipts.loc[receipts["chain"] == "ETH", "block_number"]))
+        _sample = _blocks[::max(len(_blocks) // NUM_PRICE_SAMPLES, 1)][:NUM_PRICE_SAMPLES]
+        with timer.time("prices", len(_sample)):
+            for block_number in _sample:
+                SubgraphQuery.get_eth_price_at_block(block_number)
+    timer.metrics[str(num_rows)] = Metrics.report()
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """
+    Compares stage timings against a baseline results file
+    :return: list of (stage, rows, baseline seconds, seconds) that regressed by more than threshold
+    """
+    _baseline = {(r["stage"], r["rows"]): r["seconds"] for r in baseline["results"]}
+    regressions = []
+    for r in results["results"]:
+        _key = (r["stage"], r["rows"])
+        if _key not in _baseline:
+            continue
+        _ratio = r["seconds"] / _baseline[_key] if _baseline[_key] > 0 else 1.0
+        print(f"[INFO] {r['rows']:>9} rows  {r['stage']:<17} {_baseline[_key]:10.3f}s -> {r['seconds']:10.3f}s "
+              f"({_ratio:.2f}x)")
+        if _ratio > threshold:
+            regressions.append((r["stage"], r["rows"], _baseline[_key], r["seconds"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times each pipeline stage on synthetic ledgers against "
+                                                 "the local mock RPC and subgraph server")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for process_tokentax")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", type=Path, default=None, help="defaults to a new temp directory")
+    parser.add_argument("--output", type=Path, default=Path("out/benchmark_results.json"))
+    parser.add_argument("--compare", type=Path, default=None, help="baseline results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.10,
+                        help="slowdown ratio vs. baseline reported as a regression")
+    parser.add_argument("--verbose", action="store_true", help="show pipeline output while timing")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the mock server adds to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="probability of the mock server answering HTTP 500")
+    parser.add_argument("--rate-limit", type=float, default=None,
+                        help="requests per second the mock server allows before answering HTTP 429")
+    args = parser.parse_args()
+    output = args.output.resolve()
+    baseline_file = args.compare.resolve() if args.compare is not None else None
+    workdir = (args.workdir or Path(tempfile.mkdtemp(prefix="oct_bench_"))).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    # caches are written to the working directory, keep them out of the repo
+    sys.path.insert(0, str(REPO_ROOT))
+    os.chdir(workdir)
+
+    server = MockServer(MockDataset(seed=args.seed), latency=args.latency, error_rate=args.error_rate,
+                        rate_limit=args.rate_limit, seed=args.seed).start()
+    configure_environment(server)
+    timer = StageTimer(server, args.verbose)
+    for num_rows in args.sizes:
+        run_size(num_rows, args.stages, workdir, server, timer, args.workers, args.seed)
+    server.stop()
+
+    import pandas as pd
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "workers": args.workers,
+            "seed": args.seed,
+            "mock_latency": args.latency,
+            "mock_error_rate": args.error_rate,
+            "mock_rate_limit": args.rate_limit,
+        },
+        "results": timer.results,
+        "metrics": timer.metrics,
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[INFO] benchmark results written: {output}")
+    if baseline_file is not None:
+        with open(baseline_file) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if len(regressions) > 0:
+            print(f"[ERROR] {len(regressions)} stage(s) regressed more than {args.threshold}x vs. baseline")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2 @@
+from .cache_store import LazyPickleDB, FEE_CACHE_FILE, TOKEN_CACHE_FILE, BLOCK_CACHE_FILE, PRICE_CACHE_FILE, \
+    db, token_db, block_db, price_db
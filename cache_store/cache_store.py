@@ -0,0 +1,73 @@
+import json
+import os
+import pickledb
+
+FEE_CACHE_FILE = "_txfee_cache.db"
+# token symbol and decimals never change, so they are cached across runs
+TOKEN_CACHE_FILE = "_token_cache.db"
+# block timestamps are immutable, so they are cached across runs
+BLOCK_CACHE_FILE = "_block_cache.db"
+# gas asset prices at a block never change, so they are cached across runs
+PRICE_CACHE_FILE = "_price_cache.db"
+STATS_SUFFIX = ".stats.json"  # sidecar file with cumulative hit/miss counts of a cache
+
+
+class LazyPickleDB:
+    """
+    pickledb database that is only loaded from disk when first used.
+    Counts hits and misses of get(), which are added to a sidecar stats file on every dump().
+    """
+
+    def __init__(self, location: str):
+        self.location = location
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        if self._db is None:
+            self._db = pickledb.load(self.location, False)
+        return self._db
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+    def get(self, key):
+        value = self.load().get(key)
+        if value is False:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def dump(self):
+        # written compactly, and atomically so an interrupted run never leaves a truncated cache
+        _tmp_file = self.location + ".tmp"
+        with open(_tmp_file, "w") as f:
+            json.dump(self.load().db, f, separators=(",", ":"))
+        os.replace(_tmp_file, self.location)
+        if self.hits + self.misses > 0:
+            _stats = self.get_lifetime_stats()
+            _stats["hits"] += self.hits
+            _stats["misses"] += self.misses
+            with open(self.location + STATS_SUFFIX, "w") as f:
+                json.dump(_stats, f)
+            self.hits = 0
+            self.misses = 0
+        return True
+
+    def get_lifetime_stats(self):
+        """
+        :return: dict of hits and misses across all runs (excluding those not yet dumped)
+        """
+        try:
+            with open(self.location + STATS_SUFFIX) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"hits": 0, "misses": 0}
+
+
+db = LazyPickleDB(FEE_CACHE_FILE)
+token_db = LazyPickleDB(TOKEN_CACHE_FILE)
+block_db = LazyPickleDB(BLOCK_CACHE_FILE)
+price_db = LazyPickleDB(PRICE_CACHE_FILE)
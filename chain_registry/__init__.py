@@ -0,0 +1 @@
+from .chain_registry import Chain, ChainRegistry, PriceSource, get_chain, get_registry, set_registry
@@ -0,0 +1,153 @@
+import json
+import os
+
+# chains are declared in a json file; the default one ships with the repo
+CHAIN_REGISTRY_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ref", "chains.json")
+CHAIN_REGISTRY_ENV_VAR = "CHAIN_REGISTRY_FILE"  # path of another registry file
+# defaults of optional chain settings
+DEFAULT_GAS_ASSET_DECIMALS = 18
+DEFAULT_RPC_BATCH_SIZE = 100  # max calls sent in a single JSON-RPC batch request
+DEFAULT_MULTICALL_BATCH_SIZE = 500  # max calls aggregated into a single eth_call
+DEFAULT_LOGS_BLOCK_RANGE = 2000  # max blocks spanned by a single eth_getLogs request
+# Multicall3 is deployed at the same address on most EVM chains
+DEFAULT_MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+
+class PriceSource:
+    """
+    Subgraph pair pricing a chain's gas asset in USD, over a block range (both ends included, None is open)
+    """
+
+    def __init__(self, name: str, endpoint_env_var: str, pair: str, price_field: str, from_block: int = None,
+                 to_block: int = None):
+        """
+        :param name: str name of the subgraph client (e.g. BSC_V1), used in metrics
+        :param endpoint_env_var: str env var holding the subgraph endpoint
+        :param pair: str pair id of the gas asset and a USD stablecoin
+        :param price_field: str pair field holding the gas asset price, token0Price or token1Price
+        """
+        self.name = name
+        self.endpoint_env_var = endpoint_env_var
+        self.pair = pair
+        self.price_field = price_field
+        self.from_block = from_block
+        self.to_block = to_block
+
+    def covers_block(self, block_number: int):
+        return (self.from_block is None or self.from_block <= block_number) and \
+            (self.to_block is None or block_number <= self.to_block)
+
+
+class Chain:
+
+    def __init__(self, name: str, chain_id: int, rpc_env_var: str, gas_asset: str, price_sources: list,
+                 rpc_endpoints: list = None, poa: bool = False, gas_asset_decimals: int = DEFAULT_GAS_ASSET_DECIMALS,
+                 rpc_batch_size: int = DEFAULT_RPC_BATCH_SIZE,
+                 multicall_batch_size: int = DEFAULT_MULTICALL_BATCH_SIZE,
+                 logs_block_range: int = DEFAULT_LOGS_BLOCK_RANGE,
+                 multicall_address: str = DEFAULT_MULTICALL3_ADDRESS):
+        """
+        :param rpc_env_var: str env var listing the chain's comma separated RPC endpoints
+        :param price_sources: list of PriceSource of the gas asset
+        :param rpc_endpoints: list of str (optional) RPC endpoints used if rpc_env_var is not set
+        :param poa: bool True for proof of authority chains (e.g. BSC), whose blocks carry extra data
+        """
+        self.name = name
+        self.chain_id = chain_id
+        self.rpc_env_var = rpc_env_var
+        self.rpc_endpoints = rpc_endpoints or []
+        self.poa = poa
+        self.gas_asset = gas_asset
+        self.gas_asset_decimals = gas_asset_decimals
+        self.rpc_batch_size = rpc_batch_size
+        self.multicall_batch_size = multicall_batch_size
+        self.logs_block_range = logs_block_range
+        self.multicall_address = multicall_address
+        self.price_sources = price_sources
+
+    def get_rpc_endpoints(self):
+        """
+        :return: str comma separated RPC endpoints, from rpc_env_var, else from the registry file
+        """
+        return os.environ.get(self.rpc_env_var) or ",".join(self.rpc_endpoints)
+
+    def get_price_source(self, block_number: int):
+        """
+        :return: PriceSource of the gas asset covering block_number
+        """
+        for _source in self.price_sources:
+            if _source.covers_block(block_number):
+                return _source
+        raise ValueError(f"No gas asset price source of chain {self.name} covers block number {block_number}")
+
+
+class ChainRegistry:
+    """
+    Chains supported by RPC, fee and price lookups, declared in a json file keyed by chain name, e.g.
+    {"ETH": {"chain_id": 1, "rpc_env_var": "HTTP_PROVIDER_ETH", "gas_asset": "ETH", "price_sources": [...]}}
+    """
+
+    def __init__(self, chains: dict):
+        """
+        :param chains: dict of chain name -> Chain
+        """
+        self.chains = chains
+
+    def __contains__(self, name: str):
+        return name in self.chains
+
+    def __iter__(self):
+        return iter(self.chains.values())
+
+    @property
+    def names(self):
+        return list(self.chains.keys())
+
+    def get_chain(self, name: str):
+        if name not in self.chains:
+            raise KeyError(f"Chain {name} not registered! Registered chains: {', '.join(self.names)}")
+        return self.chains[name]
+
+    @staticmethod
+    def read(registry_file):
+        """
+        :param registry_file: Path json chain registry
+        :return: ChainRegistry
+        """
+        with open(registry_file) as f:
+            _config = json.load(f)
+        chains = dict()
+        for name, _chain in _config.items():
+            try:
+                _chain = dict(_chain)
+                _sources = [PriceSource(**_source) for _source in _chain.pop("price_sources", [])]
+                chains[name] = Chain(name=name, price_sources=_sources, **_chain)
+            except TypeError as e:
+                raise ValueError(f"[ERROR] invalid entry of chain {name} in {registry_file}: {e}") from e
+        return ChainRegistry(chains)
+
+
+_registry = None
+
+
+def get_registry():
+    """
+    :return: ChainRegistry set by set_registry, else read from the file named by CHAIN_REGISTRY_ENV_VAR,
+             else from CHAIN_REGISTRY_FILE (read once)
+    """
+    global _registry
+    if _registry is None:
+        _registry = ChainRegistry.read(os.environ.get(CHAIN_REGISTRY_ENV_VAR) or CHAIN_REGISTRY_FILE)
+    return _registry
+
+
+def set_registry(registry: ChainRegistry):
+    global _registry
+    _registry = registry
+
+
+def get_chain(name: str):
+    """
+    :return: Chain registered as name, raises KeyError if there is none
+    """
+    return get_registry().get_chain(name)
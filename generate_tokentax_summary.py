@@ -1,21 +1,32 @@
 import sys
 from pathlib import Path
 import open_crypto_tax
+from metrics import Metrics
 
 
 # This script generates a valid input file from an unchecked one
-def main(_input_valid: Path, _output_file: Path, _output_balances_file: Path):
+def main(_input_valid: Path, _output_file: Path, _output_balances_file: Path, _num_workers: int = 1):
     # new Validator object
     processor = open_crypto_tax.Processor(_input_valid, True)
     # process the loaded inputs
-    processor.process_tokentax()
+    processor.process_tokentax(num_workers=_num_workers)
     processor.generate_tokentax_summary(_output_file)
     processor.generate_balances_from_tokentax(_output_balances_file)
     print("[INFO] generate tokentax summary complete (: enjoy!")
 
 
 argvs = sys.argv
+if not 2 <= len(argvs) <= 4:
+    print("[ERROR] usage: python generate_tokentax_summary.py <input_valid> [output_file] [num_workers]")
+    sys.exit(1)
 input_valid = Path(argvs[1])
-output_file = Path(argvs[2]) if len(argvs) == 3 else Path("out/summary_tokentax.csv")
+output_file = Path(argvs[2]) if len(argvs) >= 3 else Path("out/summary_tokentax.csv")
+num_workers = 1
+if len(argvs) == 4:
+    if not argvs[3].isdigit() or int(argvs[3]) < 1:
+        print(f"[ERROR] num_workers must be a positive integer, got: {argvs[3]}")
+        sys.exit(1)
+    num_workers = int(argvs[3])
 output_balances_file = Path("out/summary_tokentax_balances.csv")
-main(input_valid, output_file, output_balances_file)
+with Metrics.run("generate_tokentax_summary"):
+    main(input_valid, output_file, output_balances_file, num_workers)
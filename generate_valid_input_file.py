@@ -1,6 +1,7 @@
 import sys
 from pathlib import Path
 import open_crypto_tax
+from metrics import Metrics
 
 
 # This script generates a valid input file from an unchecked one
@@ -15,4 +16,5 @@ def main(_unchecked_input: Path, _sheet_name: str = "input"):
 argvs = sys.argv
 unchecked_input = Path(argvs[1])
 sheet_name = argvs[2] if len(argvs) == 3 else None
-main(unchecked_input, sheet_name)
+with Metrics.run("generate_valid_input_file"):
+    main(unchecked_input, sheet_name)
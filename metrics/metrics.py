@@ -0,0 +1,189 @@
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+# upper bounds (ms) of the call latency histogram buckets; slower calls land in a final "inf" bucket
+LATENCY_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+NUM_PROFILE_FUNCTIONS = 30  # hottest functions (by cumulative time) included in a run report
+
+_lock = threading.Lock()
+_stages = defaultdict(lambda: {"calls": 0, "seconds": 0.0})
+_calls = dict()  # (kind, chain, method) -> dict of call stats
+_caches = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+
+def _new_call_stats():
+    return {"requests": 0, "calls": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0,
+            "histogram_ms": [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+
+
+class Metrics:
+    """
+    Process-wide run metrics: wall time per stage, RPC/GraphQL request counts and latency
+    histograms per chain and method, and cache hits and misses per cache.
+    Metrics recorded in worker processes are not collected.
+    """
+
+    @staticmethod
+    @contextlib.contextmanager
+    def stage(name: str):
+        """
+        Times a pipeline stage, e.g. with Metrics.stage("validate"): ...
+        :param name: str stage name; time of repeated stages adds up
+        """
+        _start = time.perf_counter()
+        try:
+            yield
+        finally:
+            _seconds = time.perf_counter() - _start
+            with _lock:
+                _stages[name]["calls"] += 1
+                _stages[name]["seconds"] += _seconds
+
+    @staticmethod
+    def timed(name: str):
+        """
+        Decorator timing every call of a function as stage name
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with Metrics.stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def record_call(kind: str, chain: str, method: str, seconds: float, num_calls: int = 1, error: bool = False):
+        """
+        Records one request to a remote endpoint
+        :param kind: str "rpc" or "graphql"
+        :param chain: str e.g. ETH, BSC
+        :param method: str e.g. eth_getTransactionReceipt
+        :param seconds: float request latency
+        :param num_calls: int calls carried by the request (> 1 for batch requests)
+        :param error: bool True if the request failed
+        """
+        _bucket = len(LATENCY_BUCKETS_MS)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if seconds * 1000.0 <= bound:
+                _bucket = i
+                break
+        with _lock:
+            _stats = _calls.setdefault((kind, chain, method), _new_call_stats())
+            _stats["requests"] += 1
+            _stats["calls"] += num_calls
+            _stats["errors"] += int(error)
+            _stats["seconds"] += seconds
+            _stats["max_seconds"] = max(_stats["max_seconds"], seconds)
+            _stats["histogram_ms"][_bucket] += 1
+
+    @staticmethod
+    def cache_hit(cache: str, count: int = 1):
+        with _lock:
+            _caches[cache]["hits"] += count
+
+    @staticmethod
+    def cache_miss(cache: str, count: int = 1):
+        with _lock:
+            _caches[cache]["misses"] += count
+
+    @staticmethod
+    def reset():
+        with _lock:
+            _stages.clear()
+            _calls.clear()
+            _caches.clear()
+
+    @staticmethod
+    def report():
+        """
+        :return: dict of everything recorded so far, JSON serializable
+        """
+        with _lock:
+            stages = {name: dict(s) for name, s in _stages.items()}
+            calls = []
+            for (kind, chain, method), s in sorted(_calls.items()):
+                calls.append({
+                    "kind": kind,
+                    "chain": chain,
+                    "method": method,
+                    "requests": s["requests"],
+                    "calls": s["calls"],
+                    "errors": s["errors"],
+                    "seconds": s["seconds"],
+                    "mean_ms": 1000.0 * s["seconds"] / s["requests"],
+                    "max_ms": 1000.0 * s["max_seconds"],
+                    "histogram_ms": {str(bound): n for bound, n in
+                                     zip(LATENCY_BUCKETS_MS + ["inf"], s["histogram_ms"])},
+                })
+            caches = dict()
+            for name, c in _caches.items():
+                _total = c["hits"] + c["misses"]
+                caches[name] = {"hits": c["hits"], "misses": c["misses"],
+                                "hit_rate": c["hits"] / _total if _total > 0 else None}
+        return {"stages": stages, "calls": calls, "caches": caches}
+
+    @staticmethod
+    def write_report(report_file: Path, extra: dict = None):
+        """
+        Writes the run report as JSON
+        :param report_file: Path of output json file
+        :param extra: dict of additional top level entries (e.g. profile)
+        """
+        report = Metrics.report()
+        report.update(extra or {})
+        report_file = Path(report_file)
+        report_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(report_file, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] run report written: {report_file}")
+
+    @staticmethod
+    @contextlib.contextmanager
+    def run(name: str, report_file: Path = None, profile_file: Path = None):
+        """
+        Times a whole script run as stage name and writes its report on exit.
+        Reports and profiles are only written when a file is given, or set via the
+        METRICS_REPORT_FILE and PROFILE_FILE env vars.
+        :param name: str run (script) name
+        :param report_file: (optional) Path of the JSON run report
+        :param profile_file: (optional) Path of cProfile stats (readable with pstats / snakeviz);
+                             the hottest functions are also listed in the run report
+        """
+        report_file = report_file or os.environ.get("METRICS_REPORT_FILE") or None
+        profile_file = profile_file or os.environ.get("PROFILE_FILE") or None
+        profiler = cProfile.Profile() if profile_file is not None else None
+        if profiler is not None:
+            profiler.enable()
+        try:
+            with Metrics.stage(name):
+                yield
+        finally:
+            extra = {"run": name}
+            if profiler is not None:
+                profiler.disable()
+                Path(profile_file).parent.mkdir(parents=True, exist_ok=True)
+                profiler.dump_stats(str(profile_file))
+                print(f"[INFO] profile written: {profile_file}")
+                extra["profile"] = Metrics._top_functions(profiler)
+            if report_file is not None:
+                Metrics.write_report(report_file, extra)
+
+    @staticmethod
+    def _top_functions(profiler: cProfile.Profile):
+        _stats = pstats.Stats(profiler, stream=io.StringIO())
+        rows = []
+        for (filename, line, func), (_, num_calls, tottime, cumtime, _) in _stats.stats.items():
+            rows.append({"function": f"{filename}:{line}({func})", "calls": num_calls,
+                         "tottime": tottime, "cumtime": cumtime})
+        rows.sort(key=lambda r: r["cumtime"], reverse=True)
+        return rows[:NUM_PROFILE_FUNCTIONS]
@@ -0,0 +1 @@
+from .mock_server import MockDataset, MockServer
@@ -0,0 +1,41 @@
+import argparse
+import time
+import pandas as pd
+from .mock_server import MockDataset, MockServer
+
+
+def main():
+    # e.g. python -m mock_server --port 8545 --latency 0.05 --error-rate 0.01 --rate-limit 50
+    parser = argparse.ArgumentParser(description="Serves deterministic JSON-RPC and subgraph data for offline runs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8545)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="max random seconds added to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a HTTP 500 response")
+    parser.add_argument("--error-code", type=int, default=None,
+                        help="JSON-RPC error code (e.g. -32005) answered with HTTP 200 instead of the HTTP 500s")
+    parser.add_argument("--rate-limit", type=float, default=None, help="requests per second before HTTP 429")
+    parser.add_argument("--max-batch-size", type=int, default=1000)
+    parser.add_argument("--max-logs-block-range", type=int, default=2000)
+    parser.add_argument("--receipts", default=None,
+                        help="csv of recorded receipts (chain,tx_hash,block_number,gas_used,gas_price,"
+                             "effective_gas_price) served instead of generated ones")
+    args = parser.parse_args()
+    dataset = MockDataset(pd.read_csv(args.receipts) if args.receipts is not None else None, seed=args.seed)
+    server = MockServer(dataset, args.host, args.port, latency=args.latency, jitter=args.jitter,
+                        error_rate=args.error_rate, rate_limit=args.rate_limit, max_batch_size=args.max_batch_size,
+                        max_logs_block_range=args.max_logs_block_range, seed=args.seed,
+                        error_code=args.error_code).start()
+    print("[INFO] mock server running, point the pipeline at it with:")
+    for key, value in server.env().items():
+        print(f"{key}={value}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
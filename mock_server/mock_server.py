@@ -0,0 +1,512 @@
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from eth_abi import decode_abi, encode_abi, encode_single
+
+CHAIN_IDS = {"ETH": 1, "BSC": 56}
+GENESIS_TIMESTAMP = {"ETH": 1438269973, "BSC": 1598671449}
+BLOCK_TIME = {"ETH": 13, "BSC": 3}
+LATEST_BLOCK = {"ETH": 14000000, "BSC": 14000000}
+LONDON_BLOCK = {"ETH": 12965000, "BSC": 0}  # first block whose receipts carry effectiveGasPrice
+TXS_PER_BLOCK = 8  # generated txs in every block
+MULTICALL3_ADDRESS = "0xca11bde05977b3631167028862be2a173976ca11"
+SELECTORS = {
+    "aggregate3": "82ad56cb",
+    "getEthBalance": "4d2301cc",
+    "symbol": "95d89b41",
+    "decimals": "313ce567",
+    "balanceOf": "70a08231",
+}
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+TOKENS = {
+    # address: (symbol, decimals)
+    "0x6b3595068778dd592e39a122f4f5a5cf09c90fe2": ("SUSHI", 18),
+    "0x1f9840a85d5af5b3d1b779b8ebd1ae6cae2e6b5a": ("UNI", 18),
+    "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48": ("USDC", 6),
+    "0xdac17f958d2ee523a2206206994597c13d831ec7": ("USDT", 6),
+    "0x2260fac5e5542a773aa44fbcfedf7c193bc2c599": ("WBTC", 8),
+}
+
+
+def _digest(*parts):
+    return hashlib.sha256(":".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def _hex(value: int):
+    return hex(int(value))
+
+
+class MockDataset:
+    """
+    Deterministic chain and subgraph data: every block, tx, receipt, log, balance and price
+    is derived from its chain and number/hash, so any tx hash resolves to the same data on every run.
+    Recorded receipts (e.g. the benchmark fixtures) may be overlaid on top.
+    """
+
+    def __init__(self, recorded_receipts=None, seed: int = 0):
+        self.seed = seed
+        self.recorded = dict()
+        self.recorded_block_txs = defaultdict(list)
+        self.latest_block = dict(LATEST_BLOCK)
+        self._lock = threading.Lock()
+        if recorded_receipts is not None:
+            self.add_recorded_receipts(recorded_receipts)
+
+    def add_recorded_receipts(self, receipts):
+        """
+        :param receipts: pd.DataFrame of chain, tx_hash, block_number, gas_used, gas_price, effective_gas_price
+                         (effective_gas_price null for legacy receipts)
+        """
+        for chain, tx_hash, block_number, gas_used, gas_price, effective_gas_price in zip(
+                receipts["chain"], receipts["tx_hash"], receipts["block_number"], receipts["gas_used"],
+                receipts["gas_price"], receipts["effective_gas_price"]):
+            # NaN effective gas price marks a legacy receipt
+            _effective_gas_price = None if effective_gas_price != effective_gas_price else int(effective_gas_price)
+            self.recorded[(chain, tx_hash.lower())] = (int(block_number), int(gas_used), int(gas_price),
+                                                       _effective_gas_price)
+            self.recorded_block_txs[(chain, int(block_number))].append(tx_hash.lower())
+            self.latest_block[chain] = max(self.latest_block[chain], int(block_number))
+
+    # blocks
+    def block_hash(self, chain: str, number: int):
+        # the block number is readable from its hash, so blocks can be looked up by hash
+        return "0x" + f"{number:016x}" + _digest(self.seed, chain, "block", number)[:48]
+
+    def block_number_from_hash(self, block_hash: str):
+        return int(block_hash[2:18], 16)
+
+    def block_timestamp(self, chain: str, number: int):
+        return GENESIS_TIMESTAMP[chain] + number * BLOCK_TIME[chain]
+
+    def block_tx_hashes(self, chain: str, number: int):
+        return [self.generated_tx_hash(chain, number, i) for i in range(0, TXS_PER_BLOCK)] + \
+            list(self.recorded_block_txs.get((chain, number), []))
+
+    def get_block(self, chain: str, number: int, full_transactions: bool):
+        if number < 0 or number > self.latest_block[chain]:
+            return None
+        _tx_hashes = self.block_tx_hashes(chain, number)
+        block = {
+            "number": _hex(number),
+            "hash": self.block_hash(chain, number),
+            "parentHash": self.block_hash(chain, number - 1) if number > 0 else "0x" + "00" * 32,
+            "timestamp": _hex(self.block_timestamp(chain, number)),
+            "miner": "0x" + _digest(chain, "miner")[:40],
+            "difficulty": "0x0",
+            "totalDifficulty": "0x0",
+            "extraData": "0x" + "00" * 32,
+            "size": _hex(1000 + 100 * len(_tx_hashes)),
+            "gasLimit": _hex(30000000),
+            "gasUsed": _hex(sum(self._tx_values(chain, h)[1] for h in _tx_hashes)),
+            "logsBloom": "0x" + "00" * 256,
+            "mixHash": "0x" + "00" * 32,
+            "nonce": "0x" + "00" * 8,
+            "receiptsRoot": "0x" + _digest(chain, number, "receipts")[:64],
+            "sha3Uncles": "0x" + "00" * 32,
+            "stateRoot": "0x" + _digest(chain, number, "state")[:64],
+            "transactionsRoot": "0x" + _digest(chain, number, "txs")[:64],
+            "uncles": [],
+            "transactions": [self.get_transaction(chain, h) for h in _tx_hashes] if full_transactions else _tx_hashes,
+        }
+        if number >= LONDON_BLOCK[chain]:
+            block["baseFeePerGas"] = _hex(self._base_fee(chain, number))
+        return block
+
+    # txs
+    def generated_tx_hash(self, chain: str, number: int, index: int):
+        # generated tx hashes embed their block number (first 8 bytes) and index
+        return "0x" + f"{number:016x}" + f"{index:04x}" + _digest(self.seed, chain, "tx", number, index)[:44]
+
+    def _tx_values(self, chain: str, tx_hash: str):
+        """
+        :return: tuple of block number, gas used, gas price, effective gas price (None if pre-London)
+        """
+        tx_hash = tx_hash.lower()
+        if (chain, tx_hash) in self.recorded:
+            return self.recorded[(chain, tx_hash)]
+        _d = int(_digest(self.seed, chain, tx_hash), 16)
+        if self.is_generated_tx_hash(chain, tx_hash):
+            number = int(tx_hash[2:18], 16)
+        else:
+            # any other hash is placed in a derived block, which lists it from then on
+            number = _d % self.latest_block[chain]
+            with self._lock:
+                if tx_hash not in self.recorded_block_txs[(chain, number)]:
+                    self.recorded_block_txs[(chain, number)].append(tx_hash)
+        gas_used = 21000 + _d % 300000
+        if number >= LONDON_BLOCK[chain]:
+            _effective = self._base_fee(chain, number) + (_d >> 20) % 3000000000
+            return number, gas_used, _effective, _effective
+        return number, gas_used, 1000000000 * (1 + (_d >> 20) % 150), None
+
+    def is_generated_tx_hash(self, chain: str, tx_hash: str):
+        # a generated tx hash is recognized by re-generating it from its embedded block number and index
+        try:
+            number = int(tx_hash[2:18], 16)
+            index = int(tx_hash[18:22], 16)
+        except ValueError:
+            return False
+        if number > self.latest_block[chain] or index >= TXS_PER_BLOCK:
+            return False
+        return tx_hash == self.generated_tx_hash(chain, number, index)
+
+    def _base_fee(self, chain: str, number: int):
+        return int(30000000000 + 20000000000 * math.sin(number / 5000.0))
+
+    def tx_index(self, chain: str, tx_hash: str, number: int):
+        _tx_hashes = self.block_tx_hashes(chain, number)
+        return _tx_hashes.index(tx_hash) if tx_hash in _tx_hashes else 0
+
+    def get_transaction(self, chain: str, tx_hash: str):
+        tx_hash = tx_hash.lower()
+        number, gas_used, gas_price, effective_gas_price = self._tx_values(chain, tx_hash)
+        _d = _digest(self.seed, chain, tx_hash, "tx")
+        tx = {
+            "hash": tx_hash,
+            "blockHash": self.block_hash(chain, number),
+            "blockNumber": _hex(number),
+            "transactionIndex": _hex(self.tx_index(chain, tx_hash, number)),
+            "from": "0x" + _d[:40],
+            "to": "0x" + _d[24:64],
+            "gas": _hex(gas_used * 2),
+            "gasPrice": _hex(gas_price),
+            "input": "0x",
+            "nonce": _hex(int(_d[:6], 16)),
+            "value": _hex(int(_d[:12], 16) * 1000000),
+            "v": "0x1",
+            "r": "0x" + _d[:64],
+            "s": "0x" + _d[::-1][:64],
+            "type": "0x0" if effective_gas_price is None else "0x2",
+        }
+        if effective_gas_price is not None:
+            tx["maxFeePerGas"] = _hex(gas_price * 2)
+            tx["maxPriorityFeePerGas"] = _hex(gas_price - self._base_fee(chain, number))
+        return tx
+
+    def get_receipt(self, chain: str, tx_hash: str):
+        tx_hash = tx_hash.lower()
+        number, gas_used, gas_price, effective_gas_price = self._tx_values(chain, tx_hash)
+        _tx = self.get_transaction(chain, tx_hash)
+        receipt = {
+            "transactionHash": tx_hash,
+            "transactionIndex": _tx["transactionIndex"],
+            "blockHash": _tx["blockHash"],
+            "blockNumber": _tx["blockNumber"],
+            "from": _tx["from"],
+            "to": _tx["to"],
+            "contractAddress": None,
+            "cumulativeGasUsed": _hex(gas_used),
+            "gasUsed": _hex(gas_used),
+            "logs": self.get_tx_logs(chain, tx_hash, number),
+            "logsBloom": "0x" + "00" * 256,
+            "status": "0x1",
+            "type": _tx["type"],
+        }
+        if effective_gas_price is not None:
+            receipt["effectiveGasPrice"] = _hex(effective_gas_price)
+        return receipt
+
+    # logs - every tx emits one ERC20 Transfer of a known token
+    def get_tx_logs(self, chain: str, tx_hash: str, number: int):
+        _d = _digest(self.seed, chain, tx_hash, "log")
+        _token = list(TOKENS.keys())[int(_d[:2], 16) % len(TOKENS)]
+        _tx_index = self.tx_index(chain, tx_hash, number)
+        return [{
+            "address": _token,
+            "topics": [TRANSFER_TOPIC, "0x" + "00" * 12 + _d[:40], "0x" + "00" * 12 + _d[24:64]],
+            "data": "0x" + f"{int(_d[40:56], 16):064x}",
+            "blockNumber": _hex(number),
+            "blockHash": self.block_hash(chain, number),
+            "transactionHash": tx_hash,
+            "transactionIndex": _hex(_tx_index),
+            "logIndex": _hex(_tx_index),
+            "removed": False,
+        }]
+
+    def get_logs(self, chain: str, from_block: int, to_block: int, address=None, topics=None):
+        _addresses = None
+        if address is not None:
+            _addresses = set(a.lower() for a in (address if isinstance(address, list) else [address]))
+        logs = []
+        for number in range(from_block, to_block + 1):
+            for tx_hash in self.block_tx_hashes(chain, number):
+                for log in self.get_tx_logs(chain, tx_hash, number):
+                    if _addresses is not None and log["address"] not in _addresses:
+                        continue
+                    if topics and topics[0] is not None and log["topics"][0] not in \
+                            (topics[0] if isinstance(topics[0], list) else [topics[0]]):
+                        continue
+                    logs.append(log)
+        return logs
+
+    # state
+    def get_balance(self, chain: str, address: str, number: int):
+        return int(_digest(self.seed, chain, address.lower(), "balance", number // 10000)[:16], 16)
+
+    def get_token_balance(self, chain: str, token: str, owner: str, number: int):
+        return int(_digest(self.seed, chain, token.lower(), owner.lower(), "balanceOf", number // 10000)[:16], 16)
+
+    def get_token(self, token: str):
+        token = token.lower()
+        if token in TOKENS:
+            return TOKENS[token]
+        return "TKN" + token[2:6].upper(), 18
+
+    def eth_call(self, chain: str, to: str, data: str, number: int):
+        """
+        :return: tuple of (success, return data bytes)
+        """
+        to = to.lower()
+        _selector = data[2:10]
+        _args = bytes.fromhex(data[10:])
+        if to == MULTICALL3_ADDRESS and _selector == SELECTORS["aggregate3"]:
+            (_calls,) = decode_abi(["(address,bool,bytes)[]"], _args)
+            _results = [self.eth_call(chain, target, "0x" + call_data.hex(), number)
+                        for target, _allow_failure, call_data in _calls]
+            return True, encode_abi(["(bool,bytes)[]"], [_results])
+        if to == MULTICALL3_ADDRESS and _selector == SELECTORS["getEthBalance"]:
+            (_addr,) = decode_abi(["address"], _args)
+            return True, encode_single("uint256", self.get_balance(chain, _addr, number))
+        if _selector == SELECTORS["symbol"]:
+            return True, encode_single("string", self.get_token(to)[0])
+        if _selector == SELECTORS["decimals"]:
+            return True, encode_single("uint8", self.get_token(to)[1])
+        if _selector == SELECTORS["balanceOf"]:
+            (_owner,) = decode_abi(["address"], _args)
+            return True, encode_single("uint256", self.get_token_balance(chain, to, _owner, number))
+        return False, b""
+
+    # subgraph
+    def get_price(self, chain: str, number: int):
+        _base = 2000.0 if chain == "ETH" else 300.0
+        return round(_base * (1.0 + 0.5 * math.sin(number / 200000.0)), 6)
+
+
+class MockServer:
+    """
+    Local stand-in for JSON-RPC providers (/rpc/<chain>) and price subgraphs (/subgraph/<chain>),
+    serving a MockDataset with configurable latency, errors and rate limits.
+    GET /stats returns request counts per chain, method and status.
+    """
+
+    def __init__(self, dataset: MockDataset = None, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, rate_limit: float = None,
+                 max_batch_size: int = 1000, max_logs_block_range: int = 2000, seed: int = 0,
+                 error_code: int = None):
+        """
+        :param latency: float seconds added to every request
+        :param jitter: float max extra random seconds added to every request
+        :param error_rate: float probability of answering a request with HTTP 500
+        :param rate_limit: float requests per second allowed before answering HTTP 429 (None for unlimited)
+        :param max_batch_size: int max calls per JSON-RPC batch
+        :param max_logs_block_range: int max block range of eth_getLogs
+        :param error_code: int (optional) JSON-RPC error code (e.g. -32005) answered with HTTP 200 to the requests
+                           failed per error_rate, instead of HTTP 500
+        """
+        self.dataset = dataset or MockDataset(seed=seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.rate_limit = rate_limit
+        self.max_batch_size = max_batch_size
+        self.max_logs_block_range = max_logs_block_range
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = rate_limit or 0.0
+        self._last_refill = time.monotonic()
+        self.num_requests = 0
+        self.stats = defaultdict(int)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    return self._send(200, server.get_stats())
+                return self._send(404, {"error": "not found"})
+
+            def do_POST(self):
+                _body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                _parts = self.path.strip("/").split("/")
+                _status, _response = server.handle(_parts[0], _parts[1] if len(_parts) > 1 else "", _body)
+                self._send(_status, _response)
+
+            def _send(self, status: int, response):
+                _data = json.dumps(response).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(_data)))
+                self.end_headers()
+                self.wfile.write(_data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, kind: str, chain: str):
+        """
+        :param kind: str "rpc" or "subgraph"
+        :param chain: str e.g. ETH, BSC, BSC_V1
+        """
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/{kind}/{chain}"
+
+    def env(self):
+        """
+        :return: dict of env vars pointing web3_api and subgraph_api at this server
+        """
+        return {
+            "HTTP_PROVIDER_ETH": self.url("rpc", "ETH"),
+            "HTTP_PROVIDER_BSC": self.url("rpc", "BSC"),
+            "UNISWAP_SUBGRAPH_HTTP_ENDPOINT": self.url("subgraph", "ETH"),
+            "PANCAKESWAP_V2_SUBGRAPH_HTTP_ENDPOINT": self.url("subgraph", "BSC"),
+            "PANCAKESWAP_V1_SUBGRAPH_HTTP_ENDPOINT": self.url("subgraph", "BSC_V1"),
+            "SUBGRAPH_FETCH_SCHEMA": "false",
+        }
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def get_stats(self):
+        with self._lock:
+            return {"requests": self.num_requests, "counts": dict(self.stats)}
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _take_rate_limit_token(self):
+        if self.rate_limit is None:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._last_refill) * self.rate_limit)
+            self._last_refill = now
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+    def handle(self, kind: str, chain: str, body: bytes):
+        """
+        :return: tuple of (http status, response json)
+        """
+        with self._lock:
+            self.num_requests += 1
+            _fail = self._random.random() < self.error_rate
+            _delay = self.latency + self._random.random() * self.jitter
+        if _delay > 0:
+            time.sleep(_delay)
+        if not self._take_rate_limit_token():
+            self._count(f"{chain}:http_429")
+            return 429, {"error": "rate limited"}
+        if _fail and self.error_code is not None and kind == "rpc":
+            self._count(f"{chain}:rpc_error_{self.error_code}")
+            return 200, {"jsonrpc": "2.0", "id": None,
+                         "error": {"code": self.error_code, "message": "injected failure"}}
+        if _fail:
+            self._count(f"{chain}:http_500")
+            return 500, {"error": "injected failure"}
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return 400, {"error": "invalid json"}
+        if kind == "rpc":
+            if chain not in CHAIN_IDS:
+                return 404, {"error": f"unknown chain {chain}"}
+            if isinstance(request, list):
+                if len(request) > self.max_batch_size:
+                    self._count(f"{chain}:batch_too_large")
+                    return 200, {"jsonrpc": "2.0", "id": None,
+                                 "error": {"code": -32600, "message": f"batch larger than {self.max_batch_size}"}}
+                self._count(f"{chain}:batch")
+                return 200, [self.handle_rpc(chain, r) for r in request]
+            return 200, self.handle_rpc(chain, request)
+        if kind == "subgraph":
+            return 200, self.handle_graphql(chain, request)
+        return 404, {"error": "not found"}
+
+    def _block_param(self, chain: str, block):
+        if block is None or block in ["latest", "pending", "safe", "finalized"]:
+            return self.dataset.latest_block[chain]
+        if block == "earliest":
+            return 0
+        return int(block, 16)
+
+    def handle_rpc(self, chain: str, request: dict):
+        method = request.get("method")
+        params = request.get("params") or []
+        self._count(f"{chain}:{method}")
+        _dataset = self.dataset
+        try:
+            if method == "web3_clientVersion":
+                result = "OpenCryptoTax/MockServer"
+            elif method == "eth_chainId":
+                result = _hex(CHAIN_IDS[chain])
+            elif method == "net_version":
+                result = str(CHAIN_IDS[chain])
+            elif method == "eth_blockNumber":
+                result = _hex(_dataset.latest_block[chain])
+            elif method == "eth_getBlockByNumber":
+                result = _dataset.get_block(chain, self._block_param(chain, params[0]), bool(params[1]))
+            elif method == "eth_getBlockByHash":
+                result = _dataset.get_block(chain, _dataset.block_number_from_hash(params[0]), bool(params[1]))
+            elif method == "eth_getTransactionByHash":
+                result = _dataset.get_transaction(chain, params[0])
+            elif method == "eth_getTransactionReceipt":
+                result = _dataset.get_receipt(chain, params[0])
+            elif method == "eth_getBlockReceipts":
+                _number = self._block_param(chain, params[0])
+                result = [_dataset.get_receipt(chain, h) for h in _dataset.block_tx_hashes(chain, _number)]
+            elif method == "eth_getBalance":
+                result = _hex(_dataset.get_balance(chain, params[0], self._block_param(chain, params[1])))
+            elif method == "eth_getLogs":
+                _filter = params[0]
+                _from = self._block_param(chain, _filter.get("fromBlock"))
+                _to = self._block_param(chain, _filter.get("toBlock"))
+                if _to - _from + 1 > self.max_logs_block_range:
+                    return {"jsonrpc": "2.0", "id": request.get("id"),
+                            "error": {"code": -32005,
+                                      "message": f"block range exceeds {self.max_logs_block_range} blocks"}}
+                result = _dataset.get_logs(chain, _from, _to, _filter.get("address"), _filter.get("topics"))
+            elif method == "eth_call":
+                _number = self._block_param(chain, params[1] if len(params) > 1 else "latest")
+                success, return_data = _dataset.eth_call(chain, params[0]["to"], params[0].get("data", "0x"),
+                                                         _number)
+                if not success:
+                    return {"jsonrpc": "2.0", "id": request.get("id"),
+                            "error": {"code": 3, "message": "execution reverted"}}
+                result = "0x" + return_data.hex()
+            else:
+                return {"jsonrpc": "2.0", "id": request.get("id"),
+                        "error": {"code": -32601, "message": f"method {method} not supported by mock server"}}
+        except (KeyError, IndexError, ValueError, TypeError) as e:
+            return {"jsonrpc": "2.0", "id": request.get("id"),
+                    "error": {"code": -32602, "message": f"invalid params: {e}"}}
+        return {"jsonrpc": "2.0", "id": request.get("id"), "result": result}
+
+    def handle_graphql(self, chain: str, request: dict):
+        # only the pair(id:, block:) price queries used by subgraph_api are supported
+        _query = request.get("query", "")
+        self._count(f"subgraph_{chain}:query")
+        if "__schema" in _query:
+            return {"errors": [{"message": "introspection not supported by mock server - "
+                                           "set SUBGRAPH_FETCH_SCHEMA=false"}]}
+        _variables = request.get("variables") or {}
+        _price = str(self.dataset.get_price("ETH" if chain == "ETH" else "BSC", int(_variables["block_number"])))
+        return {"data": {"pair": {"token0Price": _price, "token1Price": _price}}}
@@ -1 +1,14 @@
-from .core import Validator, Processor
+import importlib
+
+# core pulls in pandas (and web3 once fees are looked up), so it is only imported when one of its names is used
+_LAZY_ATTRS = {
+    "Validator": ".core",
+    "Processor": ".core",
+}
+__all__ = list(_LAZY_ATTRS.keys())
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        return getattr(importlib.import_module(_LAZY_ATTRS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
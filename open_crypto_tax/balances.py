@@ -0,0 +1,70 @@
+import csv
+from collections import defaultdict
+from pathlib import Path
+from metrics import Metrics
+from units import Units
+
+BALANCE_EPSILON = 0.000001  # balances smaller than this are treated as dust and not written
+
+
+def accumulate_balances(rows, balances: defaultdict = None, first_line: int = 2):
+    """
+    Totals up each asset/currency of TokenTax rows - positive and negative - exactly, in integer base units
+    :param rows: iterable of dicts with the TokenTax columns (BuyAmount, BuyCurrency, ...), in file order
+    :param balances: defaultdict(int) (optional) running balances to add to, e.g. of earlier chunks
+    :param first_line: int file line of the first row, used in error messages
+    :return: defaultdict mapping currency to int balance in base units (see Units.get_decimals)
+    """
+    # use a default dict to track all balances - positive and negative
+    dd = balances if balances is not None else defaultdict(int)
+    line = first_line
+    for index, row in enumerate(rows):
+        try:
+            line = index + first_line
+            # add buys
+            if not row["BuyCurrency"] == "":
+                dd[row["BuyCurrency"]] += Units.to_base_units(row["BuyAmount"], Units.get_decimals(row["BuyCurrency"]))
+            # subtract sells
+            if not row["SellCurrency"] == "":
+                dd[row["SellCurrency"]] -= Units.to_base_units(row["SellAmount"], Units.get_decimals(row["SellCurrency"]))
+            # subtract fees
+            if not row["FeeCurrency"] == "":
+                dd[row["FeeCurrency"]] -= Units.to_base_units(row["FeeAmount"], Units.get_decimals(row["FeeCurrency"]))
+        except BaseException as err:
+            print(f"[ERROR] error while processing line {line}")
+            raise
+    return dd
+
+
+def format_balances(balances: dict):
+    """
+    :param balances: dict mapping currency to int balance in base units, from accumulate_balances
+    :return: dict mapping currency to exact decimal str balance, without dust balances
+    """
+    formatted = dict()
+    for key, val in balances.items():
+        _decimals = Units.get_decimals(key)
+        if not abs(val) < Units.to_base_units(BALANCE_EPSILON, _decimals, round_excess=True):
+            formatted[key] = Units.format_base_units(val, _decimals)
+    return formatted
+
+
+def write_balances(balances: dict, output_filename: Path):
+    # one "currency, balance" line per non-dust balance, written as exact decimals
+    with open(output_filename, 'w') as f:
+        for key, val in format_balances(balances).items():
+            f.write("%s, %s\n" % (key, val))
+
+
+@Metrics.timed("balances")
+def generate_balances_from_tokentax_file(tokentax_file: Path, output_filename: Path):
+    """
+    Generates a balances file from an existing TokenTax csv (as written by Processor.generate_tokentax_summary),
+    using only the standard library
+    :param tokentax_file: Path TokenTax csv
+    :param output_filename: Path output balances file
+    """
+    with open(tokentax_file, newline="") as f:
+        balances = accumulate_balances(csv.DictReader(f))
+    write_balances(balances, output_filename)
+    print(f"[INFO] balances file generated from tokentax summary: {output_filename}")
@@ -0,0 +1,89 @@
+import csv
+from collections import defaultdict
+from pathlib import Path
+from .core import Processor
+from .fee_index import write_fee_tx_duplicates
+
+
+class BatchJob:
+    def __init__(self, client: str, input_valid: Path, output_dir: Path):
+        """
+        :param client: str client (wallet owner) name, used in logs
+        :param input_valid: Path valid input file of the client
+        :param output_dir: Path directory receiving the client's TokenTax summary and balances
+        """
+        self.client = client
+        self.input_valid = input_valid
+        self.output_dir = output_dir
+
+
+def load_manifest(manifest_file: Path):
+    """
+    Loads a batch manifest csv with columns client, input_valid and (optional) output_dir.
+    Relative paths are relative to the manifest; output_dir defaults to out/<client>.
+    :param manifest_file: Path manifest csv
+    :return: list of BatchJob
+    """
+    manifest_file = Path(manifest_file)
+    jobs = []
+    with open(manifest_file, newline="") as f:
+        for row in csv.DictReader(f):
+            _client = row["client"].strip()
+            _output_dir = (row.get("output_dir") or "").strip() or str(Path("out") / _client)
+            jobs.append(BatchJob(_client,
+                                 manifest_file.parent / row["input_valid"].strip(),
+                                 manifest_file.parent / _output_dir))
+    if len(set(job.client for job in jobs)) < len(jobs):
+        raise ValueError(f"duplicate client names in manifest {manifest_file}")
+    return jobs
+
+
+def run_batch(jobs: list, num_workers: int = 1):
+    """
+    Generates TokenTax summaries and balances for many clients in one process.
+    Fee txs of all clients are looked up together, so a tx shared by clients is fetched once, and
+    fee, token and price caches are loaded once. Rows of every client are translated by one
+    long-lived worker pool.
+    :param jobs: list of BatchJob
+    :param num_workers: int number of worker processes (1 translates rows in this process)
+    :return: list of clients whose run failed
+    """
+    processors = dict()
+    failed = []
+    for job in jobs:
+        try:
+            processors[job.client] = Processor(job.input_valid)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[ERROR] unable to load input of client {job.client}: {e}")
+            failed.append(job.client)
+    # one bulk fee lookup for the union of every client's fee txs
+    chain_to_fee_txs = defaultdict(list)
+    for processor in processors.values():
+        for _fee_chain, _fee_txs in processor.get_fee_txs_by_chain().items():
+            chain_to_fee_txs[_fee_chain].extend(_fee_txs)
+    fee_map = Processor.resolve_fee_txs(chain_to_fee_txs)
+    print(f"[INFO] resolved {len(fee_map)} unique fee txs for {len(processors)} clients")
+    executor = Processor.create_tokentax_executor(num_workers, fee_map) if num_workers > 1 else None
+    try:
+        for job in jobs:
+            if job.client not in processors:
+                continue
+            processor = processors[job.client]
+            print(f"[INFO] processing client {job.client}")
+            try:
+                processor.process_tokentax(fee_map=fee_map, executor=executor)
+                job.output_dir.mkdir(parents=True, exist_ok=True)
+                processor.generate_tokentax_summary(job.output_dir / "summary_tokentax.csv")
+                processor.generate_balances_from_tokentax(job.output_dir / "summary_tokentax_balances.csv")
+                _duplicates = processor.find_duplicate_fee_txs()
+                if len(_duplicates) > 0:
+                    write_fee_tx_duplicates(_duplicates, job.output_dir / "fee_tx_duplicates.csv")
+            except Exception as e:
+                # one client's bad row must not stop the others
+                print(f"[ERROR] client {job.client} failed: {e}")
+                failed.append(job.client)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    print(f"[INFO] batch complete: {len(jobs) - len(failed)} of {len(jobs)} clients succeeded")
+    return failed
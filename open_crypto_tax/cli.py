@@ -0,0 +1,262 @@
+import argparse
+import sys
+from pathlib import Path
+from metrics import Metrics
+
+# heavy modules (pandas, web3, gql, dateparser) are imported by each command, only when it runs
+
+
+def validate(args):
+    from .core import Validator
+    validator = Validator(args.input, args.sheet)
+    if args.all_errors:
+        # every rule over every row, before anything is written
+        errors = validator.find_errors()
+        if len(errors) > 0:
+            for line, error in zip(errors["Line"], errors["Error"]):
+                print(f"[ERROR] line {line}: {error}")
+            if args.errors_output is not None:
+                args.errors_output.parent.mkdir(parents=True, exist_ok=True)
+                errors.to_csv(args.errors_output, index=False)
+            print(f"[ERROR] {len(errors)} errors on {errors['Line'].nunique()} lines - no valid input file generated")
+            sys.exit(1)
+    validator.process(args.output)
+    print("[INFO] generate_valid_input complete :)")
+
+
+def tokentax(args):
+    if args.stream or args.resume:
+        from .streaming import stream_tokentax
+        stream_tokentax(args.input_valid, args.output, args.balances_output, args.chunk_size, args.workers,
+                        args.resume, args.fee_duplicates_output)
+        return
+    from .core import Processor
+    processor = Processor(args.input_valid, True)
+    if args.fee_duplicates_output is not None:
+        from .fee_index import write_fee_tx_duplicates
+        write_fee_tx_duplicates(processor.find_duplicate_fee_txs(), args.fee_duplicates_output)
+    processor.process_tokentax(num_workers=args.workers)
+    processor.generate_tokentax_summary(args.output)
+    processor.generate_balances_from_tokentax(args.balances_output)
+    print("[INFO] generate tokentax summary complete (: enjoy!")
+
+
+def balances(args):
+    from .balances import generate_balances_from_tokentax_file
+    generate_balances_from_tokentax_file(args.tokentax_file, args.output)
+
+
+def gains(args):
+    import pandas as pd
+    from .gains import generate_gains_report
+    report_sorted = generate_gains_report(pd.read_csv(args.input, engine='python'))
+    report_sorted.to_csv(args.output)
+    if args.html is not None:
+        with open(args.html, "w") as f:
+            f.write(report_sorted.to_html())
+    if args.html_dir is not None:
+        from .report_html import write_html_report
+        write_html_report(report_sorted, args.html_dir, args.rows_per_page)
+    print(f"[INFO] gains report generated: {args.output}")
+
+
+def open_lots(args):
+    import pandas as pd
+    from .open_lots import generate_open_lots_report
+    report, summary = generate_open_lots_report(pd.read_csv(args.input, engine='python'), args.prices, args.date)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    report.to_csv(args.output, index=False)
+    summary.to_csv(args.summary_output, index=False)
+    print(f"[INFO] open lots report generated: {args.output} ({report.shape[0]} lots), "
+          f"summary: {args.summary_output}")
+
+
+def tax_forms(args):
+    import pandas as pd
+    from .tax_forms import generate_tax_forms
+    lines, totals = generate_tax_forms(pd.read_csv(args.input, engine='python'), args.year)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    lines.to_csv(args.output, index=False)
+    totals.to_csv(args.summary_output, index=False)
+    print(f"[INFO] form 8949 lines generated: {args.output} ({lines.shape[0]} lines), "
+          f"schedule D totals: {args.summary_output}")
+
+
+def reconcile(args):
+    from .reconcile import reconcile_balances, write_reconciliation
+    rows = reconcile_balances(args.balances_file, args.wallet, args.chain, args.block, args.tokens, args.tolerance)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    write_reconciliation(rows, args.output)
+
+
+def batch(args):
+    from .batch import load_manifest, run_batch
+    failed = run_batch(load_manifest(args.manifest), args.workers)
+    if len(failed) > 0:
+        print(f"[ERROR] failed clients: {', '.join(failed)}")
+        sys.exit(1)
+
+
+def cache_warm(args):
+    from .core import Processor
+    fee_map = Processor(args.input_valid).resolve_fees()
+    print(f"[INFO] fee cache warmed: {len(fee_map)} fee txs")
+
+
+def cache_stats(args):
+    import json
+    from web3_api import caches
+    print(json.dumps(caches.get_fee_cache_stats(), indent=2))
+
+
+def cache_export(args):
+    from web3_api import caches
+    num_entries = caches.export_fee_cache(args.output)
+    print(f"[INFO] {num_entries} fee cache entries exported: {args.output}")
+
+
+def cache_import(args):
+    from web3_api import caches
+    num_entries = caches.import_fee_cache(args.input, args.overwrite)
+    print(f"[INFO] {num_entries} fee cache entries imported from: {args.input}")
+
+
+def cache_prune(args):
+    from web3_api import caches
+    if args.chain is None and not args.usd and not args.invalid and args.keep_ledger is None:
+        raise ValueError("nothing to prune - pass --chain, --usd, --invalid and/or --keep-ledger")
+    num_entries = caches.prune_fee_cache(args.chain, args.usd, args.invalid, args.keep_ledger)
+    print(f"[INFO] {num_entries} fee cache entries pruned")
+
+
+def cache_compact(args):
+    from web3_api import caches
+    bytes_before, bytes_after = caches.compact_fee_cache()
+    print(f"[INFO] fee cache compacted: {bytes_before} -> {bytes_after} bytes")
+
+
+def serve(args):
+    import time
+    from .service import TaxService
+    service = TaxService(args.host, args.port, args.connect).start()
+    print(f"[INFO] service running at {service.url()} - POST /validate, /process, /balances, /gains; GET /stats")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        service.stop()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m open_crypto_tax",
+                                     description="Open crypto tax: validate inputs, generate TokenTax summaries, "
+                                                 "balances and gains reports")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("validate", help="generate a valid input file from an unchecked one")
+    p.add_argument("input", type=Path, help="unchecked input (.xlsx or .csv)")
+    p.add_argument("--sheet", default="input", help="excel sheet name")
+    p.add_argument("--output", type=Path, default=None, help="defaults to input/input_valid.csv")
+    p.add_argument("--all-errors", action="store_true",
+                   help="check every row against every rule first, and report all errors instead of the first")
+    p.add_argument("--errors-output", type=Path, default=None, help="csv of all errors (with --all-errors)")
+    p.set_defaults(func=validate)
+
+    p = subparsers.add_parser("tokentax", help="generate a TokenTax summary (and balances) from a valid input file")
+    p.add_argument("input_valid", type=Path)
+    p.add_argument("--output", type=Path, default=Path("out/summary_tokentax.csv"))
+    p.add_argument("--balances-output", type=Path, default=Path("out/summary_tokentax_balances.csv"))
+    p.add_argument("--workers", type=int, default=1, help="worker processes")
+    p.add_argument("--fee-duplicates-output", type=Path, default=None,
+                   help="csv of fee txs referenced more than once (only booked on their first reference)")
+    p.add_argument("--stream", action="store_true",
+                   help="read, translate and write a chunk at a time (bounded memory); "
+                        "an --output ending in .parquet is written as Parquet (requires pyarrow)")
+    p.add_argument("--chunk-size", type=int, default=100000, help="input rows per chunk when streaming")
+    p.add_argument("--resume", action="store_true",
+                   help="stream, restarting from the checkpoint of a failed run at the first changed chunk")
+    p.set_defaults(func=tokentax)
+
+    p = subparsers.add_parser("balances", help="generate balances from an existing TokenTax csv (offline)")
+    p.add_argument("tokentax_file", type=Path)
+    p.add_argument("--output", type=Path, default=Path("out/summary_tokentax_balances.csv"))
+    p.set_defaults(func=balances)
+
+    p = subparsers.add_parser("gains", help="generate a FIFO gains report")
+    p.add_argument("input", type=Path)
+    p.add_argument("--output", type=Path, default=Path("out.csv"))
+    p.add_argument("--html", type=Path, default=None, help="also write the report as a single html file")
+    p.add_argument("--html-dir", type=Path, default=None,
+                   help="also write the report as html pages per asset and year, with an index of totals")
+    p.add_argument("--rows-per-page", type=int, default=1000, help="max report rows per html page")
+    p.set_defaults(func=gains)
+
+    p = subparsers.add_parser("open-lots", help="value open lots and unrealized gains from a local price table")
+    p.add_argument("input", type=Path, help="gains input csv")
+    p.add_argument("--prices", type=Path, required=True, help="price table csv with Date, Asset, Spot Price USD")
+    p.add_argument("--date", action="append", required=True, help="valuation date (repeatable)")
+    p.add_argument("--output", type=Path, default=Path("out/open_lots.csv"))
+    p.add_argument("--summary-output", type=Path, default=Path("out/open_lots_summary.csv"))
+    p.set_defaults(func=open_lots)
+
+    p = subparsers.add_parser("tax-forms", help="aggregate gains by tax year and term, as form 8949 lines and "
+                                                "schedule D totals")
+    p.add_argument("input", type=Path, help="gains input csv")
+    p.add_argument("--year", type=int, action="append", default=None, help="tax year to keep (repeatable)")
+    p.add_argument("--output", type=Path, default=Path("out/form_8949.csv"))
+    p.add_argument("--summary-output", type=Path, default=Path("out/schedule_d.csv"))
+    p.set_defaults(func=tax_forms)
+
+    p = subparsers.add_parser("reconcile", help="compare ledger balances with on-chain balances at a block")
+    p.add_argument("balances_file", type=Path, help="balances file, e.g. out/summary_tokentax_balances.csv")
+    p.add_argument("--wallet", action="append", required=True, help="wallet address (repeatable)")
+    p.add_argument("--chain", default="ETH")
+    p.add_argument("--block", type=int, required=True, help="snapshot block number")
+    p.add_argument("--tokens", type=Path, default=None,
+                   help="csv with columns symbol, chain and address; the token cache is used otherwise")
+    p.add_argument("--tolerance", type=float, default=0.000001)
+    p.add_argument("--output", type=Path, default=Path("out/reconciliation.csv"))
+    p.set_defaults(func=reconcile)
+
+    p = subparsers.add_parser("batch", help="generate TokenTax summaries for many clients, sharing lookups and caches")
+    p.add_argument("manifest", type=Path, help="csv with columns client, input_valid and (optional) output_dir")
+    p.add_argument("--workers", type=int, default=1, help="worker processes, shared by all clients")
+    p.set_defaults(func=batch)
+
+    p = subparsers.add_parser("serve", help="run a local HTTP service keeping caches and parsed ledgers warm")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--connect", action="append", default=[], help="chain whose provider is connected on start "
+                                                                   "(repeatable), e.g. ETH")
+    p.set_defaults(func=serve)
+
+    p = subparsers.add_parser("cache", help="manage the tx fee cache (run from the directory holding the cache)")
+    cache_subparsers = p.add_subparsers(dest="cache_command", required=True)
+    c = cache_subparsers.add_parser("warm", help="look up every fee tx of a valid input file, in bulk")
+    c.add_argument("input_valid", type=Path)
+    c.set_defaults(func=cache_warm)
+    c = cache_subparsers.add_parser("stats", help="print entry counts, size and lifetime hit rate")
+    c.set_defaults(func=cache_stats)
+    c = cache_subparsers.add_parser("export", help="export fee entries as compressed numpy columns")
+    c.add_argument("output", type=Path, help=".npz file")
+    c.set_defaults(func=cache_export)
+    c = cache_subparsers.add_parser("import", help="merge fee entries of an exported .npz file")
+    c.add_argument("input", type=Path, help=".npz file")
+    c.add_argument("--overwrite", action="store_true", help="replace existing entries")
+    c.set_defaults(func=cache_import)
+    c = cache_subparsers.add_parser("prune", help="remove fee entries")
+    c.add_argument("--chain", default=None, help="remove every entry of this chain")
+    c.add_argument("--usd", action="store_true", help="remove USD-converted fees")
+    c.add_argument("--invalid", action="store_true", help="remove malformed and non-positive entries")
+    c.add_argument("--keep-ledger", type=Path, default=None,
+                   help="remove entries of txs not referenced by this ledger csv")
+    c.set_defaults(func=cache_prune)
+    c = cache_subparsers.add_parser("compact", help="drop invalid entries and rewrite the cache compactly")
+    c.set_defaults(func=cache_compact)
+    return parser
+
+
+def main(argv: list = None):
+    args = build_parser().parse_args(argv if argv is not None else sys.argv[1:])
+    with Metrics.run(args.command if args.command != "cache" else "cache_" + args.cache_command):
+        args.func(args)
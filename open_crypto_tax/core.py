@@ -1,18 +1,21 @@
 import pandas as pd
-import numpy as np
 from pathlib import Path
-from web3_api import Web3Query
-from collections import defaultdict
-import csv
-
-
-NUM_GAS_TX_ALLOWED = 14
+from metrics import Metrics
+from .balances import accumulate_balances, write_balances
+from chain_registry import get_chain
+from .schema import NUM_GAS_TX_ALLOWED, read_ledger, densify_ledger
+from .fee_index import build_fee_tx_index, get_fee_txs_by_chain, find_duplicate_fee_txs, get_repeated_fee_tx_refs, \
+    drop_repeated_fee_txs, normalize_fee_tx, warn_repeated_fee_txs
+from concurrent.futures import ProcessPoolExecutor
 
 
 # object that represents a valid row of input data
 class ValidInputRow:
 
-    def __init__(self, row: pd.Series):
+    def __init__(self, row):
+        """
+        :param row: pd.Series or dict of input data, keyed by column
+        """
         # date
         self.date = row["Date"]
         # sells
@@ -41,18 +44,32 @@ class ValidInputRow:
         # USD fee
         self.aux_usd_fee = row["AuxUSDFee"]
         # Gifts
-        self.is_gift_from_me = row["IsGiftFromMe"]
-        self.is_gift_to_me = row["IsGiftToMe"]
+        self.is_gift_from_me = ValidInputRow.parse_flag(row["IsGiftFromMe"])
+        self.is_gift_to_me = ValidInputRow.parse_flag(row["IsGiftToMe"])
         self.gift_basis_usd = row["GiftBasisUSD"]
         # Income types
-        self.is_ordinary_income = row["IsOrdinaryIncome"]
-        self.is_business_income_1 = row["IsBusinessIncome1"]
-        self.is_business_income_2 = row["IsBusinessIncome2"]
+        self.is_ordinary_income = ValidInputRow.parse_flag(row["IsOrdinaryIncome"])
+        self.is_business_income_1 = ValidInputRow.parse_flag(row["IsBusinessIncome1"])
+        self.is_business_income_2 = ValidInputRow.parse_flag(row["IsBusinessIncome2"])
         # metadata
         self.other_tx_receipts = row["Other Tx Receipts (fees not auto-calculated or included)"]
         self.purchased_from = row["Purchased From"]
         self.other_notes = row["Other Notes"]
 
+    @staticmethod
+    def parse_flag(value):
+        """
+        :param value: flag cell, read as text from a valid input file or as a number from excel
+        :return: float value of a numeric flag; other values are returned as is, and rejected with their line
+                 number when the row is translated
+        """
+        if isinstance(value, str):
+            try:
+                return float(value)
+            except ValueError:
+                return value
+        return value
+
     # @classmethod
     # def from_dict(cls, input_dict: dict):
     #     r = cls()
@@ -62,13 +79,11 @@ class ValidInputRow:
 
 
 class Helpers:
-    fee_chain_to_fee_currency = dict()
-    fee_chain_to_fee_currency["ETH"] = "ETH"
-    fee_chain_to_fee_currency["BSC"] = "BNB"
 
     @staticmethod
     def get_fee_currency_from_fee_chain(fee_chain: str):
-        return Helpers.fee_chain_to_fee_currency[fee_chain]
+        # the gas asset of each chain is declared in the chain registry
+        return get_chain(fee_chain).gas_asset
 
     @staticmethod
     def get_tokentax_array(_type: str, buy_amount: float, buy_currency: str, sell_amount: float, sell_currency: str,
@@ -80,14 +95,112 @@ class Helpers:
 # This class validates an input csv/excel file and generates an
 # input_valid.csv file fully populated and able to be summarized.
 class Validator:
+    input_columns = [
+        "Date",
+        "SellAsset",
+        "SellQty",
+        "SellSpotPriceUSD",
+        "SellTotalUSD",
+        "BuyAsset",
+        "BuyQty",
+        "BuySpotPriceUSD",
+        "BuyTotalUSD",
+        "BookFeeWith"
+    ] + [
+        col for i in range(0, NUM_GAS_TX_ALLOWED)
+        for col in [f"FeeChain{i + 1}", f"FeeTx{i + 1}", f"FeeTx{i + 1}GasAssetPriceOverride"]
+    ] + [
+        "AuxFeeAsset",
+        "AuxFeeQty",
+        "AuxFeeSpotPrice",
+        "AuxUSDFee",
+        "IsGiftFromMe",
+        "IsGiftToMe",
+        "GiftBasisUSD",
+        "IsOrdinaryIncome",
+        "IsBusinessIncome1",
+        "IsBusinessIncome2",
+        "Other Tx Receipts (fees not auto-calculated or included)",
+        "Purchased From",
+        "Other Notes"
+    ]
+    # columns of the report of find_errors
+    error_columns = ["Line", "Rule", "Error"]
 
     def __init__(self, unchecked_input: Path, sheet_name: str = "input", print_preview: bool = False):
         # load input file
-        self.df = pd.read_excel(unchecked_input, sheet_name=sheet_name)
+        if Path(unchecked_input).suffix.lower() == ".csv":
+            self.df = pd.read_csv(unchecked_input)
+            # csv cells are untyped, so numbers sharing a column with "equal" are read as strings
+            for col in ["SellTotalUSD", "BuyTotalUSD"]:
+                _numeric = pd.to_numeric(self.df[col], errors="coerce")
+                self.df[col] = _numeric.astype(object).where(_numeric.notnull(), self.df[col])
+        else:
+            self.df = pd.read_excel(unchecked_input, sheet_name=sheet_name)
         if print_preview:
             print(self.df)
 
+    @Metrics.timed("validate_all")
+    def find_errors(self):
+        """
+        Evaluates the rules of process over all rows at once, as column masks, so every bad row is reported
+        in one pass instead of stopping at the first. Rules that only apply once an earlier rule holds (e.g.
+        price rules of swaps) are evaluated for the rows they apply to.
+        :return: pd.DataFrame one row per failed rule and line (error_columns), sorted by line; empty if valid
+        """
+        df = self.df
+        _missing_columns = [col for col in Validator.input_columns if col not in df.columns]
+        if len(_missing_columns) > 0:
+            return pd.DataFrame([[1, "columns", f"missing columns: {', '.join(_missing_columns)}"]],
+                                columns=Validator.error_columns)
+        _has_date = df["Date"].notnull()
+        _has_sell = df["SellAsset"].notnull()
+        _has_buy = df["BuyAsset"].notnull()
+        _has_fee_tx = df["FeeTx1"].notnull()
+        _book_fee_with = df["BookFeeWith"]
+        # empty rows are skipped
+        _checked = _has_date | _has_sell | _has_buy | _has_fee_tx
+        _swap = _checked & _has_sell & _has_buy
+        _sell_equal = df["SellTotalUSD"] == "equal"
+        _buy_equal = df["BuyTotalUSD"] == "equal"
+        # fee txs without a chain are on ETH, as set by process
+        _fee_chains = pd.DataFrame({
+            i: df[f"FeeChain{i + 1}"].where(df[f"FeeChain{i + 1}"].notnull() | df[f"FeeTx{i + 1}"].isnull(), "ETH")
+            for i in range(0, NUM_GAS_TX_ALLOWED)})
+        _has_fee_chain = _fee_chains.notnull().any(axis=1)
+        _has_aux_fee = df["AuxFeeQty"].notnull()
+        _has_usd_fee = df["AuxUSDFee"].notnull()
+        rules = [
+            ("date", _checked & ~_has_date, "missing date"),
+            ("data", _checked & _has_date & ~_has_sell & ~_has_buy & ~_has_fee_tx, "no buy/sell/gas data"),
+            ("book_fee_with", _checked & _book_fee_with.notnull() & ~_book_fee_with.isin(["sell", "buy", "gas"]),
+             "non-null BookFeeWith must be 'buy', 'sell', or 'gas'"),
+            ("gas_row", _checked & (_book_fee_with == "gas") & (_has_sell | _has_buy),
+             "BookFeeWith is 'gas', but sell/buy data exists"),
+            ("gas_only", _checked & ~_has_sell & ~_has_buy & _has_fee_tx & (_book_fee_with != "gas"),
+             "no buy/sell & no gas data (fee tx only rows must book fees with 'gas')"),
+            ("price", _swap & _sell_equal & (df["BuyTotalUSD"].isnull() | _buy_equal) &
+             df["BuySpotPriceUSD"].isnull(), "price not fully defined"),
+            ("price", _swap & ~_sell_equal & _buy_equal & df["SellTotalUSD"].isnull() &
+             df["SellSpotPriceUSD"].isnull(), "price not fully defined"),
+            ("over_defined", _swap & _sell_equal & df["SellSpotPriceUSD"].notnull(), "sell spot price over-defines"),
+            ("over_defined", _swap & ~_sell_equal & _buy_equal & df["BuySpotPriceUSD"].notnull(),
+             "buy spot price over-defines"),
+            ("fee_chains", _checked & (_fee_chains.nunique(axis=1) > 1), "fees booked on several chains - split up"),
+            ("aux_fees", _checked & _has_fee_chain & (_has_aux_fee | _has_usd_fee),
+             "fee chain and aux/usd fees booked together - split up"),
+            ("aux_fees", _checked & _has_aux_fee & _has_usd_fee, "aux and usd fees booked together - split up"),
+        ]
+        errors = pd.concat([pd.DataFrame({"Line": df.index[_mask] + 2, "Rule": _rule, "Error": _error, "_order": i})
+                            for i, (_rule, _mask, _error) in enumerate(rules)], ignore_index=True)
+        errors = errors.sort_values(by=["Line", "_order"], kind="mergesort")
+        return errors[Validator.error_columns].reset_index(drop=True)
+
+    @Metrics.timed("validate")
     def process(self, output_filename: Path = None):
+        """
+        :param output_filename: Path (optional) valid input file to write, input/input_valid.csv by default
+        """
         num_rows = self.df.shape[0]
         for index, row in self.df.iterrows():
             try:
@@ -254,24 +367,30 @@ class Processor:
 
     def __init__(self, input_valid: Path, print_preview: bool = False):
         # load input file
-        self.df = pd.read_csv(input_valid, engine='python')
+        self.df = read_ledger(input_valid)
         if print_preview:
             print(self.df)
         pass
+        # every fee tx reference, indexed once
+        self.fee_tx_index = build_fee_tx_index(self.df)
         # initialize generic dataframes
         self.df_tt = None  # tokentax formatted dataframe
 
     @staticmethod
-    def safe_get_total_tx_fee_and_currency(r: ValidInputRow, line: int):
+    def safe_get_total_tx_fee_and_currency(r: ValidInputRow, line: int, fee_map: dict = None):
         # bundle gas tx data
         fee_currency = None
         fee_qty = 0
         fee_hashes = ""
+        _booked = set()
         for i in range(0, NUM_GAS_TX_ALLOWED):
             _fee_chain = r.fee_chain[i+1]
-            _fee_tx = r.fee_tx[i+1]
-            _fee_tx_gas_asset_price_override = r.fee_tx_gas_asset_price_override[i+1]
+            _fee_tx = normalize_fee_tx(r.fee_tx[i+1])
             if not pd.isnull(_fee_chain):
+                # a fee tx repeated in several slots of the row is booked once
+                if (_fee_chain, _fee_tx) in _booked:
+                    continue
+                _booked.add((_fee_chain, _fee_tx))
                 _fee_currency = Helpers.get_fee_currency_from_fee_chain(_fee_chain)
                 if fee_currency is None:
                     # initial value
@@ -281,8 +400,12 @@ class Processor:
                     raise ValueError(f"only a single fee_currency allowed in line {line}")
                 # add fee qty to total fee qty
                 # print(f"[INFO] querying fee data for tx on {_fee_chain}: {_fee_tx}")
-                # we NEED a cache system here, 100%
-                fee_qty += Web3Query.get_tx_fee(_fee_tx, _fee_chain, False)
+                if fee_map is not None:
+                    fee_qty += fee_map[(_fee_chain, _fee_tx)]
+                else:
+                    # web3_api is only imported once fees are looked up, it pulls in web3
+                    from web3_api import Web3Query
+                    fee_qty += Web3Query.get_tx_fee(_fee_tx, _fee_chain, False)
                 fee_hashes += _fee_chain + "-" + str(_fee_tx) + " | "
         # any usd fees
         if not pd.isnull(r.aux_usd_fee):
@@ -304,246 +427,344 @@ class Processor:
                 raise ValueError(f"fee_currency is None, but fee_qty is non-zero - HELP!")
         return fee_qty, fee_currency, fee_hashes
 
-    def process_tokentax(self):
+    def get_fee_txs_by_chain(self):
         """
-        This processes loaded input data into a tokentax dataframe
-        (looks up all fee tx, builds entire buy/sell basis sheet)
+        :return: dict mapping each fee chain to the unique fee txs referenced by the loaded input data
         """
-        df_tt = pd.DataFrame(columns=Processor.tokentax_columns)
-        num_rows = self.df.shape[0]
-        for index, row in self.df.iterrows():
+        return get_fee_txs_by_chain(self.fee_tx_index)
+
+    def find_duplicate_fee_txs(self):
+        """
+        Fee txs referenced more than once (on several rows, or in several slots of a row) are only booked on their
+        first reference; the others are likely double-booked gas, to be fixed in the input file
+        :return: pd.DataFrame every reference of each duplicated fee tx, see fee_index.FEE_TX_DUPLICATE_COLUMNS
+        """
+        return find_duplicate_fee_txs(self.fee_tx_index)
+
+    @staticmethod
+    @Metrics.timed("resolve_fees")
+    def resolve_fee_txs(chain_to_fee_txs: dict):
+        """
+        This looks up the fee of every unique fee tx
+        :param chain_to_fee_txs: dict mapping fee chain to list of fee txs (may repeat)
+        :return: dict mapping (chain, tx_hash) to fee qty in the chain's gas currency, keyed by normalized hash
+        """
+        if len(chain_to_fee_txs) == 0:
+            return dict()
+        # web3_api is only imported once fees are looked up, it pulls in web3
+        from web3_api import Web3Query
+        # fees are fetched in bulk, per chain
+        fee_map = dict()
+        for _fee_chain, _fee_txs in chain_to_fee_txs.items():
+            _fee_txs = [normalize_fee_tx(_fee_tx) for _fee_tx in _fee_txs]
+            for _fee_tx, _fee in Web3Query.get_tx_fees(_fee_txs, _fee_chain).items():
+                fee_map[(_fee_chain, _fee_tx)] = _fee
+        return fee_map
+
+    def resolve_fees(self):
+        """
+        This looks up the fee of every unique fee tx referenced by the loaded input data
+        :return: dict mapping (chain, tx_hash) to fee qty in the chain's gas currency
+        """
+        return Processor.resolve_fee_txs(self.get_fee_txs_by_chain())
+
+    @staticmethod
+    def get_tokentax_rows(r: ValidInputRow, line: int, fee_map: dict = None):
+        """
+        This translates a single valid input row into zero, one or two tokentax rows
+        :param r: ValidInputRow row of input data
+        :param line: int line number of row in input file (used in error messages)
+        :param fee_map: dict (optional) fee qty keyed by (chain, tx_hash); fees are queried via web3 if not specified
+        :return: list of tokentax arrays
+        """
+        rows = []
+        # every row needs:
+        date = r.date
+        # translate from row to one or more rows
+        # gas - categorize as gas-only, and it is a spend of ether for all gas TXs listed
+        if r.book_fee_with == "gas":
+            fee_qty, fee_currency, fee_hashes = Processor.safe_get_total_tx_fee_and_currency(r, line, fee_map)
+            if (not pd.isnull(r.buy_qty)) or (not pd.isnull(r.sell_qty)):
+                raise ValueError(f"gas row has non-null buy and/or sell qty on line: {line}")
+            # append bundled gas txs to summary; no fee tx is left if they all repeat earlier references
+            if fee_qty in ("", 0):
+                print(f"[WARN] no gas fee transactions found on line {line} - SKIPPED LINE")
+            else:
+                _comment = "gas fees unrelated to buy/sell - treat as spending gas asset. tx hashe(s): " + fee_hashes
+                rows.append(Helpers.get_tokentax_array(_type="Spend",
+                                                       buy_amount="",
+                                                       buy_currency="",
+                                                       sell_amount=fee_qty,
+                                                       sell_currency=fee_currency,
+                                                       fee_amount="",
+                                                       fee_currency="",
+                                                       exchange="",
+                                                       group="",
+                                                       comment=_comment,
+                                                       date=date))
+                # ["Trade", 0, 0, 0, 0, fee_qty, fee_currency, 0, 0, "gas fees unrelated to buy/sell", date]
+        # business mining income - treat as a buy on my personal tokentax summary
+        elif not pd.isnull(r.is_business_income_1):
+            if not (r.is_business_income_1 == 1.0):
+                raise ValueError(f"Unexpected business income 1 value for line {line}")
+            # fees should be zero, but check anyway
+            fee_qty, fee_currency, _ = Processor.safe_get_total_tx_fee_and_currency(r, line, fee_map)
+            if not fee_qty == "":
+                print(f"[WARN] Jellyfish mining income non-zero - is something messed up? line {line}")
+            # append new summary row
+            _comment = "purchased from Jellyfish Mining upon receiving mining rewards. ref ETH tx_hash: " + str(r.other_tx_receipts)
+            rows.append(Helpers.get_tokentax_array(_type="Trade",
+                                                   buy_amount=r.buy_qty,
+                                                   buy_currency=r.buy_asset,
+                                                   sell_amount=r.buy_total_usd,
+                                                   sell_currency="USD",
+                                                   fee_amount=fee_qty,
+                                                   fee_currency=fee_currency,
+                                                   exchange="",
+                                                   group="",
+                                                   comment=_comment,
+                                                   date=date))
+        # business income 2 - TODO not yet implemented
+        elif not pd.isnull(r.is_business_income_2):
+            print(f"[WARN] handling of business income 2 not implemented - line: {line}")
+        # ordinary income - use type Income
+        elif not pd.isnull(r.is_ordinary_income):
+            if not (r.is_ordinary_income == 1.0):
+                raise ValueError(f"Unexpected ordinary income value for line {line}")
+            if not (pd.isnull(r.sell_qty)):
+                raise ValueError(f"Sell qty should be empty for income on line {line}")
+            # total fees
+            fee_qty, fee_currency, fee_hashes = Processor.safe_get_total_tx_fee_and_currency(r, line, fee_map)
+            # commend from source file
+            _comment = "ordinary income - fee_tx_hashes: " + str(fee_hashes) + " - " + str(r.purchased_from)
+            rows.append(Helpers.get_tokentax_array(_type="Income",
+                                                   buy_amount=r.buy_qty,
+                                                   buy_currency=r.buy_asset,
+                                                   sell_amount="",
+                                                   sell_currency="",
+                                                   fee_amount=fee_qty,
+                                                   fee_currency=fee_currency,
+                                                   exchange="",
+                                                   group="",
+                                                   comment=_comment,
+                                                   date=date))
+        # gift from someone else - treat as a buy at the cost basis of someone else
+        elif not pd.isnull(r.is_gift_to_me):
+            if not (r.is_gift_to_me == 1.0):
+                raise ValueError(f"Unexpected is_gift_to_me value for line {line}")
+            # total fees should be ZERO for me
+            fee_qty, fee_currency, fee_hashes = Processor.safe_get_total_tx_fee_and_currency(r, line, fee_map)
+            if not fee_qty == "":
+                raise ValueError(f"Fees should be zero for gift to me on line {line}")
+            if not (pd.isnull(r.sell_asset) and pd.isnull(r.sell_qty) and pd.isnull(r.buy_total_usd)):
+                raise ValueError(
+                    f"Sell should be null and buy prices should be null - use gift_basis_usd USD on line {line}"
+                )
+            if pd.isnull(r.buy_qty):
+                raise ValueError(f"Buy qty should be non-zero for gift on line {line}")
+            # append line with a buy, cost basis the original giver's basis
+            _comment = "Gift to me with original cost basis of " + str(r.gift_basis_usd) + " USD. " + \
+                       (str(r.purchased_from) or "")
+            rows.append(Helpers.get_tokentax_array(_type="Trade",
+                                                   buy_amount=r.buy_qty,
+                                                   buy_currency=r.buy_asset,
+                                                   sell_amount=r.gift_basis_usd,
+                                                   sell_currency="USD",
+                                                   fee_amount="",
+                                                   fee_currency="",
+                                                   exchange="",
+                                                   group="",
+                                                   comment=_comment,
+                                                   date=date))
+        # per tokentax: gift to someone else from me - use sell fields, leave buy blank, set exchange as "Gift"
+        elif not pd.isnull(r.is_gift_from_me):
+            if not (r.is_gift_from_me == 1.0):
+                raise ValueError(f"Unexpected is_gift_from_me value for line {line}")
+            # total fees
+            fee_qty, fee_currency, fee_hashes = Processor.safe_get_total_tx_fee_and_currency(r, line, fee_map)
+            if not (pd.isnull(r.buy_asset) and pd.isnull(r.buy_qty) and pd.isnull(r.buy_total_usd)):
+                raise ValueError(
+                    f"Buy should be null for gift from me on line {line}"
+                )
+            if pd.isnull(r.sell_qty):
+                raise ValueError(f"Sell qty should be non-zero for gift from me on line {line}")
+            # append line as instructed by tokentax
+            _comment = "Gift from me. Filling out per tokentax recommended format. fee_hashes: " + \
+                       str(fee_hashes) + " - " + (str(r.purchased_from) or "")
+            rows.append(Helpers.get_tokentax_array(_type="Gift",
+                                                   buy_amount="",
+                                                   buy_currency="",
+                                                   sell_amount=r.sell_qty,
+                                                   sell_currency=r.sell_asset,
+                                                   fee_amount=fee_qty,
+                                                   fee_currency=fee_currency,
+                                                   exchange="Gift",
+                                                   group="",
+                                                   comment=_comment,
+                                                   date=date))
+        # non-null buy AND sell - break into two transactions, booking fees in some way
+        # note: this is because NFT values in USD won't be known by tokentax
+        elif (not pd.isnull(r.sell_asset)) and (not pd.isnull(r.buy_asset)):
+            # require everything defined
+            if pd.isnull(r.sell_qty) or pd.isnull(r.sell_total_usd) or pd.isnull(r.buy_qty) or pd.isnull(r.buy_total_usd):
+                raise ValueError(f"buy and sell qty and total usd must be non-null for line {line}")
+            # require book fee with to be either buy or sell
+            if not (r.book_fee_with == "buy" or r.book_fee_with == "sell"):
+                raise ValueError(f"BookFeeWith must be 'buy` or `sell` for line {line}")
+            # total fees
+            fee_qty, fee_currency, fee_hashes = Processor.safe_get_total_tx_fee_and_currency(r, line, fee_map)
+            # append sell line as a trade with USD
+            if r.book_fee_with == "sell":
+                _comment = "Trade. fee_hashes: " + \
+                       str(fee_hashes) + " - " + (str(r.purchased_from) or "")
+                _fee_qty = fee_qty
+                _fee_currency = fee_currency
+            else:
+                _comment = "Trade. Fees booked with buy (next line). Swap between two assets split to record best estimate of USD value of assets at time of swap."
+                _fee_qty = ""
+                _fee_currency = ""
+            rows.append(Helpers.get_tokentax_array(_type="Trade",
+                                                   buy_amount=r.sell_total_usd,
+                                                   buy_currency="USD",
+                                                   sell_amount=r.sell_qty,
+                                                   sell_currency=r.sell_asset,
+                                                   fee_amount=_fee_qty,
+                                                   fee_currency=_fee_currency,
+                                                   exchange="",
+                                                   group="",
+                                                   comment=_comment,
+                                                   date=date))
+            # append buy line as a trade with USD
+            if r.book_fee_with == "buy":
+                _comment = "Trade. fee_hashes: " + \
+                       str(fee_hashes) + " - " + (str(r.purchased_from) or "")
+                _fee_qty = fee_qty
+                _fee_currency = fee_currency
+            else:
+                _comment = "Trade. Fees booked with sell (previous line). Swap between two assets split to record best estimate of USD value of assets at time of swap."
+                _fee_qty = ""
+                _fee_currency = ""
+            rows.append(Helpers.get_tokentax_array(_type="Trade",
+                                                   buy_amount=r.buy_qty,
+                                                   buy_currency=r.buy_asset,
+                                                   sell_amount=r.buy_total_usd,
+                                                   sell_currency="USD",
+                                                   fee_amount=_fee_qty,
+                                                   fee_currency=_fee_currency,
+                                                   exchange="",
+                                                   group="",
+                                                   comment=_comment,
+                                                   date=date))
+
+        # non-null sell and no buy
+        elif (not pd.isnull(r.sell_asset)) and (pd.isnull(r.buy_asset)):
+            # require specific things defined
+            if pd.isnull(r.sell_qty) or pd.isnull(r.sell_total_usd) or (not pd.isnull(r.buy_qty)) or (not pd.isnull(r.buy_total_usd)):
+                raise ValueError(f"buy and sell qty and totals not appropriate for sell-no-buy on line {line}")
+            # total fees
+            fee_qty, fee_currency, fee_hashes = Processor.safe_get_total_tx_fee_and_currency(r, line, fee_map)
+            # append line as a trade
+            _comment = "Trade. fee_hashes: " + \
+                       str(fee_hashes) + " - " + (str(r.purchased_from) or "")
+            rows.append(Helpers.get_tokentax_array(_type="Trade",
+                                                   buy_amount=r.sell_total_usd,
+                                                   buy_currency="USD",
+                                                   sell_amount=r.sell_qty,
+                                                   sell_currency=r.sell_asset,
+                                                   fee_amount=fee_qty,
+                                                   fee_currency=fee_currency,
+                                                   exchange="",
+                                                   group="",
+                                                   comment=_comment,
+                                                   date=date))
+        # null sell and non-null buy
+        elif (not pd.isnull(r.buy_asset)) and (pd.isnull(r.sell_asset)):
+            # require specific things defined
+            if pd.isnull(r.buy_qty) or pd.isnull(r.buy_total_usd) or (not pd.isnull(r.sell_qty)) or (not pd.isnull(r.sell_total_usd)):
+                raise ValueError(f"buy and sell qty and totals not appropriate for buy-no-sell on line {line}")
+            # total fees
+            fee_qty, fee_currency, fee_hashes = Processor.safe_get_total_tx_fee_and_currency(r, line, fee_map)
+            # append line as a trade
+            _comment = "Trade. fee_hashes: " + \
+                       str(fee_hashes) + " - " + (str(r.purchased_from) or "")
+            rows.append(Helpers.get_tokentax_array(_type="Trade",
+                                                   buy_amount=r.buy_qty,
+                                                   buy_currency=r.buy_asset,
+                                                   sell_amount=r.buy_total_usd,
+                                                   sell_currency="USD",
+                                                   fee_amount=fee_qty,
+                                                   fee_currency=fee_currency,
+                                                   exchange="",
+                                                   group="",
+                                                   comment=_comment,
+                                                   date=date))
+        else:
+            raise ValueError(f"Invalid/unrecognized line on line {line}")
+        return rows
+
+    @staticmethod
+    def process_tokentax_chunk(df: pd.DataFrame, fee_map: dict = None):
+        """
+        This translates a chunk of valid input data into tokentax rows
+        :param df: pd.DataFrame chunk of valid input data; index must be the row's index in the input file
+        :param fee_map: dict (optional) fee qty keyed by (chain, tx_hash)
+        :return: list of tokentax arrays, in input order
+        """
+        rows = []
+        # rows are read as plain dicts of typed values, only this chunk's sparse fee columns are expanded
+        for index, row in zip(df.index, densify_ledger(df).to_dict("records")):
             try:
                 line = index + 2
-                # pull out data
-                r = ValidInputRow(row)
-                # every row needs:
-                date = r.date
-                # translate from row to one or more rows
-                # gas - categorize as gas-only, and it is a spend of ether for all gas TXs listed
-                if r.book_fee_with == "gas":
-                    fee_qty, fee_currency, fee_hashes = self.safe_get_total_tx_fee_and_currency(r, line)
-                    if (not pd.isnull(r.buy_qty)) or (not pd.isnull(r.sell_qty)):
-                        raise ValueError(f"gas row has non-null buy and/or sell qty on line: {line}")
-                    # append bundled gas txs to summary
-                    if fee_qty == 0:
-                        print(f"[WARN] no gas fee transactions found on line {line} - SKIPPED LINE")
-                    else:
-                        _comment = "gas fees unrelated to buy/sell - treat as spending gas asset. tx hashe(s): " + fee_hashes
-                        df_tt.loc[len(df_tt.index)] = Helpers.get_tokentax_array(_type="Spend",
-                                                                                 buy_amount="",
-                                                                                 buy_currency="",
-                                                                                 sell_amount=fee_qty,
-                                                                                 sell_currency=fee_currency,
-                                                                                 fee_amount="",
-                                                                                 fee_currency="",
-                                                                                 exchange="",
-                                                                                 group="",
-                                                                                 comment=_comment,
-                                                                                 date=date)
-                        # ["Trade", 0, 0, 0, 0, fee_qty, fee_currency, 0, 0, "gas fees unrelated to buy/sell", date]
-                # business mining income - treat as a buy on my personal tokentax summary
-                elif not pd.isnull(r.is_business_income_1):
-                    if not (r.is_business_income_1 == 1.0):
-                        raise ValueError(f"Unexpected business income 1 value for line {line}")
-                    # fees should be zero, but check anyway
-                    fee_qty, fee_currency, _ = self.safe_get_total_tx_fee_and_currency(r, line)
-                    if not fee_qty == "":
-                        print(f"[WARN] Jellyfish mining income non-zero - is something messed up? line {line}")
-                    # append new summary row
-                    _comment = "purchased from Jellyfish Mining upon receiving mining rewards. ref ETH tx_hash: " + str(r.other_tx_receipts)
-                    df_tt.loc[len(df_tt.index)] = Helpers.get_tokentax_array(_type="Trade",
-                                                                             buy_amount=r.buy_qty,
-                                                                             buy_currency=r.buy_asset,
-                                                                             sell_amount=r.buy_total_usd,
-                                                                             sell_currency="USD",
-                                                                             fee_amount=fee_qty,
-                                                                             fee_currency=fee_currency,
-                                                                             exchange="",
-                                                                             group="",
-                                                                             comment=_comment,
-                                                                             date=date)
-                # business income 2 - TODO not yet implemented
-                elif not pd.isnull(r.is_business_income_2):
-                    print(f"[WARN] handling of business income 2 not implemented - line: {line}")
-                # ordinary income - use type Income
-                elif not pd.isnull(r.is_ordinary_income):
-                    if not (r.is_ordinary_income == 1.0):
-                        raise ValueError(f"Unexpected ordinary income value for line {line}")
-                    if not (pd.isnull(r.sell_qty)):
-                        raise ValueError(f"Sell qty should be empty for income on line {line}")
-                    # total fees
-                    fee_qty, fee_currency, fee_hashes = self.safe_get_total_tx_fee_and_currency(r, line)
-                    # commend from source file
-                    _comment = "ordinary income - fee_tx_hashes: " + str(fee_hashes) + " - " + str(r.purchased_from)
-                    df_tt.loc[len(df_tt.index)] = Helpers.get_tokentax_array(_type="Income",
-                                                                             buy_amount=r.buy_qty,
-                                                                             buy_currency=r.buy_asset,
-                                                                             sell_amount="",
-                                                                             sell_currency="",
-                                                                             fee_amount=fee_qty,
-                                                                             fee_currency=fee_currency,
-                                                                             exchange="",
-                                                                             group="",
-                                                                             comment=_comment,
-                                                                             date=date)
-                # gift from someone else - treat as a buy at the cost basis of someone else
-                elif not pd.isnull(r.is_gift_to_me):
-                    if not (r.is_gift_to_me == 1.0):
-                        raise ValueError(f"Unexpected is_gift_to_me value for line {line}")
-                    # total fees should be ZERO for me
-                    fee_qty, fee_currency, fee_hashes = self.safe_get_total_tx_fee_and_currency(r, line)
-                    if not fee_qty == "":
-                        raise ValueError(f"Fees should be zero for gift to me on line {line}")
-                    if not (pd.isnull(r.sell_asset) and pd.isnull(r.sell_qty) and pd.isnull(r.buy_total_usd)):
-                        raise ValueError(
-                            f"Sell should be null and buy prices should be null - use gift_basis_usd USD on line {line}"
-                        )
-                    if pd.isnull(r.buy_qty):
-                        raise ValueError(f"Buy qty should be non-zero for gift on line {line}")
-                    # append line with a buy, cost basis the original giver's basis
-                    _comment = "Gift to me with original cost basis of " + str(r.gift_basis_usd) + " USD. " + \
-                               (str(r.purchased_from) or "")
-                    df_tt.loc[len(df_tt.index)] = Helpers.get_tokentax_array(_type="Trade",
-                                                                             buy_amount=r.buy_qty,
-                                                                             buy_currency=r.buy_asset,
-                                                                             sell_amount=r.gift_basis_usd,
-                                                                             sell_currency="USD",
-                                                                             fee_amount="",
-                                                                             fee_currency="",
-                                                                             exchange="",
-                                                                             group="",
-                                                                             comment=_comment,
-                                                                             date=date)
-                # per tokentax: gift to someone else from me - use sell fields, leave buy blank, set exchange as "Gift"
-                elif not pd.isnull(r.is_gift_from_me):
-                    if not (r.is_gift_from_me == 1.0):
-                        raise ValueError(f"Unexpected is_gift_from_me value for line {line}")
-                    # total fees
-                    fee_qty, fee_currency, fee_hashes = self.safe_get_total_tx_fee_and_currency(r, line)
-                    if not (pd.isnull(r.buy_asset) and pd.isnull(r.buy_qty) and pd.isnull(r.buy_total_usd)):
-                        raise ValueError(
-                            f"Buy should be null for gift from me on line {line}"
-                        )
-                    if pd.isnull(r.sell_qty):
-                        raise ValueError(f"Sell qty should be non-zero for gift from me on line {line}")
-                    # append line as instructed by tokentax
-                    _comment = "Gift from me. Filling out per tokentax recommended format. fee_hashes: " + \
-                               str(fee_hashes) + " - " + (str(r.purchased_from) or "")
-                    df_tt.loc[len(df_tt.index)] = Helpers.get_tokentax_array(_type="Gift",
-                                                                             buy_amount="",
-                                                                             buy_currency="",
-                                                                             sell_amount=r.sell_qty,
-                                                                             sell_currency=r.sell_asset,
-                                                                             fee_amount=fee_qty,
-                                                                             fee_currency=fee_currency,
-                                                                             exchange="Gift",
-                                                                             group="",
-                                                                             comment=_comment,
-                                                                             date=date)
-                # non-null buy AND sell - break into two transactions, booking fees in some way
-                # note: this is because NFT values in USD won't be known by tokentax
-                elif (not pd.isnull(r.sell_asset)) and (not pd.isnull(r.buy_asset)):
-                    # require everything defined
-                    if pd.isnull(r.sell_qty) or pd.isnull(r.sell_total_usd) or pd.isnull(r.buy_qty) or pd.isnull(r.buy_total_usd):
-                        raise ValueError(f"buy and sell qty and total usd must be non-null for line {line}")
-                    # require book fee with to be either buy or sell
-                    if not (r.book_fee_with == "buy" or r.book_fee_with == "sell"):
-                        raise ValueError(f"BookFeeWith must be 'buy` or `sell` for line {line}")
-                    # total fees
-                    fee_qty, fee_currency, fee_hashes = self.safe_get_total_tx_fee_and_currency(r, line)
-                    # append sell line as a trade with USD
-                    if r.book_fee_with == "sell":
-                        _comment = "Trade. fee_hashes: " + \
-                               str(fee_hashes) + " - " + (str(r.purchased_from) or "")
-                        _fee_qty = fee_qty
-                        _fee_currency = fee_currency
-                    else:
-                        _comment = "Trade. Fees booked with buy (next line). Swap between two assets split to record best estimate of USD value of assets at time of swap."
-                        _fee_qty = ""
-                        _fee_currency = ""
-                    df_tt.loc[len(df_tt.index)] = Helpers.get_tokentax_array(_type="Trade",
-                                                                             buy_amount=r.sell_total_usd,
-                                                                             buy_currency="USD",
-                                                                             sell_amount=r.sell_qty,
-                                                                             sell_currency=r.sell_asset,
-                                                                             fee_amount=_fee_qty,
-                                                                             fee_currency=_fee_currency,
-                                                                             exchange="",
-                                                                             group="",
-                                                                             comment=_comment,
-                                                                             date=date)
-                    # append buy line as a trade with USD
-                    if r.book_fee_with == "buy":
-                        _comment = "Trade. fee_hashes: " + \
-                               str(fee_hashes) + " - " + (str(r.purchased_from) or "")
-                        _fee_qty = fee_qty
-                        _fee_currency = fee_currency
-                    else:
-                        _comment = "Trade. Fees booked with sell (previous line). Swap between two assets split to record best estimate of USD value of assets at time of swap."
-                        _fee_qty = ""
-                        _fee_currency = ""
-                    df_tt.loc[len(df_tt.index)] = Helpers.get_tokentax_array(_type="Trade",
-                                                                             buy_amount=r.buy_qty,
-                                                                             buy_currency=r.buy_asset,
-                                                                             sell_amount=r.buy_total_usd,
-                                                                             sell_currency="USD",
-                                                                             fee_amount=_fee_qty,
-                                                                             fee_currency=_fee_currency,
-                                                                             exchange="",
-                                                                             group="",
-                                                                             comment=_comment,
-                                                                             date=date)
-
-                # non-null sell and no buy
-                elif (not pd.isnull(r.sell_asset)) and (pd.isnull(r.buy_asset)):
-                    # require specific things defined
-                    if pd.isnull(r.sell_qty) or pd.isnull(r.sell_total_usd) or (not pd.isnull(r.buy_qty)) or (not pd.isnull(r.buy_total_usd)):
-                        raise ValueError(f"buy and sell qty and totals not appropriate for sell-no-buy on line {line}")
-                    # total fees
-                    fee_qty, fee_currency, fee_hashes = self.safe_get_total_tx_fee_and_currency(r, line)
-                    # append line as a trade
-                    _comment = "Trade. fee_hashes: " + \
-                               str(fee_hashes) + " - " + (str(r.purchased_from) or "")
-                    df_tt.loc[len(df_tt.index)] = Helpers.get_tokentax_array(_type="Trade",
-                                                                             buy_amount=r.sell_total_usd,
-                                                                             buy_currency="USD",
-                                                                             sell_amount=r.sell_qty,
-                                                                             sell_currency=r.sell_asset,
-                                                                             fee_amount=fee_qty,
-                                                                             fee_currency=fee_currency,
-                                                                             exchange="",
-                                                                             group="",
-                                                                             comment=_comment,
-                                                                             date=date)
-                # null sell and non-null buy
-                elif (not pd.isnull(r.buy_asset)) and (pd.isnull(r.sell_asset)):
-                    # require specific things defined
-                    if pd.isnull(r.buy_qty) or pd.isnull(r.buy_total_usd) or (not pd.isnull(r.sell_qty)) or (not pd.isnull(r.sell_total_usd)):
-                        raise ValueError(f"buy and sell qty and totals not appropriate for buy-no-sell on line {line}")
-                    # total fees
-                    fee_qty, fee_currency, fee_hashes = self.safe_get_total_tx_fee_and_currency(r, line)
-                    # append line as a trade
-                    _comment = "Trade. fee_hashes: " + \
-                               str(fee_hashes) + " - " + (str(r.purchased_from) or "")
-                    df_tt.loc[len(df_tt.index)] = Helpers.get_tokentax_array(_type="Trade",
-                                                                             buy_amount=r.buy_qty,
-                                                                             buy_currency=r.buy_asset,
-                                                                             sell_amount=r.buy_total_usd,
-                                                                             sell_currency="USD",
-                                                                             fee_amount=fee_qty,
-                                                                             fee_currency=fee_currency,
-                                                                             exchange="",
-                                                                             group="",
-                                                                             comment=_comment,
-                                                                             date=date)
-                else:
-                    raise ValueError(f"Invalid/unrecognized line on line {line}")
+                rows.extend(Processor.get_tokentax_rows(ValidInputRow(row), line, fee_map))
             except BaseException as err:
                 print(f"[ERROR] error while processing line {line}")
                 raise
+        return rows
+
+    @Metrics.timed("process_tokentax")
+    def process_tokentax(self, num_workers: int = 1, chunk_size: int = 10000, fee_map: dict = None,
+                         executor: ProcessPoolExecutor = None):
+        """
+        This processes loaded input data into a tokentax dataframe
+        (looks up all fee tx, builds entire buy/sell basis sheet)
+        :param num_workers: int (optional) number of processes used to translate rows once fees are resolved
+        :param chunk_size: int (optional) number of input rows sent to a worker process at a time
+        :param fee_map: dict (optional) already resolved fees covering every fee tx of the loaded input data
+        :param executor: ProcessPoolExecutor (optional) long-lived pool created by create_tokentax_executor,
+                         whose fee map already covers every fee tx of the loaded input data; overrides num_workers
+        """
+        # a fee tx referenced more than once is booked on its first reference only
+        warn_repeated_fee_txs(self.fee_tx_index)
+        df = drop_repeated_fee_txs(self.df, get_repeated_fee_tx_refs(self.fee_tx_index))
+        if executor is None and num_workers <= 1:
+            rows = Processor.process_tokentax_chunk(df, fee_map if fee_map is not None else self.resolve_fees())
+        else:
+            # rows are independent once fees are resolved - translate ordered chunks in a process pool
+            chunks = [df.iloc[i:i + chunk_size] for i in range(0, df.shape[0], chunk_size)]
+            rows = []
+            _executor = executor or Processor.create_tokentax_executor(
+                num_workers, fee_map if fee_map is not None else self.resolve_fees())
+            try:
+                # map yields results in submission order, so output order matches input order
+                for _rows in _executor.map(_process_tokentax_chunk_worker, chunks):
+                    rows.extend(_rows)
+            finally:
+                if executor is None:
+                    _executor.shutdown()
         # save output
-        self.df_tt = df_tt
+        self.df_tt = pd.DataFrame(rows, columns=Processor.tokentax_columns)
 
+    @staticmethod
+    def create_tokentax_executor(num_workers: int, fee_map: dict):
+        """
+        Creates a process pool for process_tokentax; the fee map is sent once per worker process
+        :param num_workers: int number of worker processes
+        :param fee_map: dict fee qty keyed by (chain, tx_hash), see resolve_fee_txs
+        :return: ProcessPoolExecutor, to be shut down by the caller
+        """
+        return ProcessPoolExecutor(max_workers=num_workers, initializer=_init_tokentax_worker, initargs=(fee_map,))
+
+    @Metrics.timed("write_tokentax_summary")
     def generate_tokentax_summary(self, output_filename: Path = None):
         """
         This generates a TokenTax csv output file
@@ -556,33 +777,23 @@ class Processor:
         self.df_tt.to_csv(output_filename, index=False)
         print(f"[INFO] validated input file generated: {output_filename}")
 
+    @Metrics.timed("balances")
     def generate_balances_from_tokentax(self, output_filename: Path):
         if self.df_tt is None:
             raise LookupError("TokenTax summary not generated - call `process_tokentax` method")
-        # use a default dict to track all balances - positive and negative
-        dd = defaultdict(float)
-        # total up each asset/currency
-        df_tt = pd.DataFrame(columns=Processor.tokentax_columns)
-        num_rows = self.df.shape[0]
-        for index, row in self.df_tt.iterrows():
-            try:
-                line = index + 2
-                # add buys
-                if not row["BuyCurrency"] == "":
-                    dd[row["BuyCurrency"]] += row["BuyAmount"]
-                # subtract sells
-                if not row["SellCurrency"] == "":
-                    dd[row["SellCurrency"]] -= row["SellAmount"]
-                # subtract fees
-                if not row["FeeCurrency"] == "":
-                    dd[row["FeeCurrency"]] -= row["FeeAmount"]
-            except BaseException as err:
-                print(f"[ERROR] error while processing line {line}")
-                raise
-        # output default dict to file
-        with open(output_filename, 'w') as f:
-            for key, val in dd.items():
-                if not abs(val) < 0.000001:
-                    f.write("%s, %s\n" % (key, val))
+        write_balances(accumulate_balances(self.df_tt.to_dict("records")), output_filename)
         print(f"[INFO] balances file generated from tokentax summary: {output_filename}")
 
+
+# process pool helpers for Processor.process_tokentax
+# the fee map is sent once per worker process, not once per chunk
+_worker_fee_map = None
+
+
+def _init_tokentax_worker(fee_map: dict):
+    global _worker_fee_map
+    _worker_fee_map = fee_map
+
+
+def _process_tokentax_chunk_worker(df: pd.DataFrame):
+    return Processor.process_tokentax_chunk(df, _worker_fee_map)
@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from metrics import Metrics
+from .schema import NUM_GAS_TX_ALLOWED
+
+# one row per fee tx reference of a ledger: its line in the input file, FeeTx slot (1 to NUM_GAS_TX_ALLOWED)
+# and whether the line is a gas-only row (BookFeeWith "gas")
+FEE_TX_INDEX_COLUMNS = ["Line", "Slot", "Chain", "FeeTx", "GasOnly"]
+# one row per reference of a fee tx referenced more than once, on several rows or in several slots of a row:
+# whether its fee is booked (first reference only), and whether its line is skipped, i.e. a gas-only row
+# whose fee txs are all repeats, so it has no fee left to book
+FEE_TX_DUPLICATE_COLUMNS = ["Chain", "FeeTx", "References", "FirstLine", "Line", "Slot", "Booked", "LineSkipped"]
+MAX_WARNED_LINES = 20  # lines listed in warnings, the duplicates report lists them all
+
+
+def normalize_fee_tx(fee_tx):
+    """
+    :return: str fee tx hash as looked up and indexed (stripped, lowercase), or fee_tx if null
+    """
+    if pd.isnull(fee_tx):
+        return fee_tx
+    return str(fee_tx).strip().lower()
+
+
+def get_unbooked_rows(df: pd.DataFrame):
+    """
+    :param df: pd.DataFrame valid input data (or its fee and income columns)
+    :return: np.ndarray of bool, True for rows translated to no TokenTax row whatever their fees
+             (business income 2, see Processor.get_tokentax_rows), whose fees are never looked up
+    """
+    if "IsBusinessIncome2" not in df.columns:
+        return np.zeros(df.shape[0], dtype=bool)
+    return (np.asarray(df["BookFeeWith"], dtype=object) != "gas") & \
+        pd.isnull(np.asarray(df["IsBusinessIncome1"], dtype=object)) & \
+        pd.notnull(np.asarray(df["IsBusinessIncome2"], dtype=object))
+
+
+@Metrics.timed("fee_tx_index")
+def build_fee_tx_index(df: pd.DataFrame):
+    """
+    Indexes every booked fee tx reference of a ledger, i.e. every FeeTxN whose FeeChainN is set, over all fee
+    columns; references of rows never booked (see get_unbooked_rows) are left out
+    :param df: pd.DataFrame valid input data (or its fee and income columns); index must be the row's index in
+               the input file
+    :return: pd.DataFrame (FEE_TX_INDEX_COLUMNS) sorted by line and slot, with normalized hashes
+    """
+    _booked = ~get_unbooked_rows(df)
+    _gas_only = np.asarray(df["BookFeeWith"], dtype=object) == "gas" if "BookFeeWith" in df.columns \
+        else np.zeros(df.shape[0], dtype=bool)
+    parts = []
+    for i in range(0, NUM_GAS_TX_ALLOWED):
+        if f"FeeChain{i + 1}" not in df.columns:
+            continue
+        # np.asarray also densifies sparse columns
+        _chains = np.asarray(df[f"FeeChain{i + 1}"], dtype=object)
+        _mask = pd.notnull(_chains) & _booked
+        if not _mask.any():
+            continue
+        parts.append(pd.DataFrame({
+            "Line": df.index[_mask] + 2,
+            "Slot": i + 1,
+            "Chain": _chains[_mask],
+            "FeeTx": np.asarray(df[f"FeeTx{i + 1}"], dtype=object)[_mask],
+            "GasOnly": _gas_only[_mask],
+        }))
+    if len(parts) == 0:
+        return pd.DataFrame(columns=FEE_TX_INDEX_COLUMNS)
+    index = pd.concat(parts, ignore_index=True)
+    index["FeeTx"] = index["FeeTx"].str.strip().str.lower()
+    return index.sort_values(by=["Line", "Slot"], kind="mergesort").reset_index(drop=True)
+
+
+def get_fee_txs_by_chain(index: pd.DataFrame):
+    """
+    :param index: pd.DataFrame from build_fee_tx_index
+    :return: dict mapping each fee chain to its unique fee txs, so every tx is fetched once however often referenced
+    """
+    _unique = index.drop_duplicates(subset=["Chain", "FeeTx"])
+    return {_fee_chain: list(_fee_txs) for _fee_chain, _fee_txs in _unique.groupby("Chain", sort=False)["FeeTx"]}
+
+
+def find_duplicate_fee_txs(index: pd.DataFrame):
+    """
+    :param index: pd.DataFrame from build_fee_tx_index
+    :return: pd.DataFrame every reference of each fee tx referenced more than once (FEE_TX_DUPLICATE_COLUMNS),
+             sorted by the line of the first reference; empty if none
+    """
+    _groups = index.groupby(["Chain", "FeeTx"], sort=False)["Line"]
+    duplicates = index.assign(References=_groups.transform("size"), FirstLine=_groups.transform("min"),
+                              Booked=~index.duplicated(subset=["Chain", "FeeTx"], keep="first"))
+    duplicates["LineSkipped"] = duplicates["Line"].isin(get_skipped_lines(index))
+    duplicates = duplicates.loc[duplicates["References"] > 1]
+    duplicates = duplicates.sort_values(by=["FirstLine", "Line", "Slot"], kind="mergesort")
+    return duplicates[FEE_TX_DUPLICATE_COLUMNS].reset_index(drop=True)
+
+
+def get_repeated_fee_tx_refs(index: pd.DataFrame):
+    """
+    :param index: pd.DataFrame from build_fee_tx_index
+    :return: pd.DataFrame line and slot of every reference of a fee tx but its first one
+    """
+    return index.loc[index.duplicated(subset=["Chain", "FeeTx"], keep="first"), ["Line", "Slot"]]
+
+
+def get_skipped_lines(index: pd.DataFrame):
+    """
+    :param index: pd.DataFrame from build_fee_tx_index
+    :return: np.ndarray lines of gas-only rows whose fee txs are all repeats; with nothing left to book, they are
+             skipped like gas rows without fee txs
+    """
+    _repeated = index.duplicated(subset=["Chain", "FeeTx"], keep="first")
+    _booked_lines = index.loc[~_repeated, "Line"]
+    _lines = index.loc[_repeated & index["GasOnly"].astype(bool), "Line"]
+    return np.unique(_lines.loc[~_lines.isin(_booked_lines)])
+
+
+def warn_repeated_fee_txs(index: pd.DataFrame):
+    """
+    Prints which lines have fee tx references that are not booked again, and which lines are skipped
+    :param index: pd.DataFrame from build_fee_tx_index
+    """
+    _lines = np.unique(get_repeated_fee_tx_refs(index)["Line"])
+    if len(_lines) == 0:
+        return
+    print(f"[WARN] {len(_lines)} lines repeat fee txs of earlier references, not booked again: "
+          f"{_format_lines(_lines)}")
+    _skipped = get_skipped_lines(index)
+    if len(_skipped) > 0:
+        print(f"[WARN] {len(_skipped)} gas-only lines only repeat fee txs - SKIPPED LINES: {_format_lines(_skipped)}")
+
+
+def _format_lines(lines: np.ndarray):
+    _text = ", ".join(str(line) for line in lines[:MAX_WARNED_LINES])
+    return _text + (f", ... ({len(lines) - MAX_WARNED_LINES} more)" if len(lines) > MAX_WARNED_LINES else "")
+
+
+def drop_repeated_fee_txs(df: pd.DataFrame, repeated_refs: pd.DataFrame):
+    """
+    Clears the fee tx references of df listed in repeated_refs, so each fee tx is booked once, on its first reference
+    :param df: pd.DataFrame valid input data (or a chunk of it); index must be the row's index in the input file
+    :param repeated_refs: pd.DataFrame from get_repeated_fee_tx_refs
+    :return: pd.DataFrame df, or a copy if any of its references were cleared
+    """
+    _refs = repeated_refs.loc[repeated_refs["Line"].isin(df.index + 2)]
+    if len(_refs) == 0:
+        return df
+    df = df.copy()
+    for _slot, _lines in _refs.groupby("Slot")["Line"]:
+        _rows = df.index.isin(_lines - 2)
+        for col in [f"FeeChain{_slot}", f"FeeTx{_slot}", f"FeeTx{_slot}GasAssetPriceOverride"]:
+            if col in df.columns:
+                df[col] = df[col].where(~_rows)
+    return df
+
+
+def write_fee_tx_duplicates(duplicates: pd.DataFrame, output_filename: Path):
+    Path(output_filename).parent.mkdir(parents=True, exist_ok=True)
+    duplicates.to_csv(output_filename, index=False)
+    print(f"[INFO] fee tx duplicates report generated: {output_filename} ({duplicates.shape[0]} references)")
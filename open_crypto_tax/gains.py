@@ -0,0 +1,391 @@
+import numpy as np
+import pandas as pd
+from collections import defaultdict
+from copy import deepcopy
+import dateparser
+from metrics import Metrics
+from units import Units, DEFAULT_DECIMALS
+from .schema import parse_ledger_dates
+
+LONG_TERM_CAP_GAIN_RATE_EST = 0.15  # estimate
+SHORT_TERM_CAP_GAIN_RATE_EST = 0.22  # estimate
+
+
+class Action:
+
+    def __init__(self, id, tx_type, qty_change, spot_price, fees_asset_sym, fees_asset, fees_usd, receipts, purchase_info, meta,
+                 decimals: int = DEFAULT_DECIMALS):
+        self.id = id
+        self.tx_type = tx_type
+        self.qty_change = float(qty_change)
+        # exact qty, lots are matched in integer base units
+        self.decimals = decimals
+        self.qty_change_units = Units.to_base_units(qty_change, decimals)
+        self.spot_price = float(spot_price)
+        self.fees_asset_sym = fees_asset_sym
+        self.fees_asset = float(fees_asset)
+        self.fees_usd = float(fees_usd)
+        self.receipts = receipts
+        self.purchase_info = purchase_info
+        self.meta = meta
+        # calculated properties
+        self.action = "buy"
+        if qty_change < 0:
+            self.action = "sell"
+        if qty_change == 0:
+            self.basis_total_usd = 0
+            self.basis_price = 0
+        elif self.action == "buy":
+            # calculate basis
+            self.basis_total_usd = self.spot_price * self.qty_change + self.fees_usd
+            self.basis_price = float(self.basis_total_usd) / float(self.qty_change)
+        if self.action == "sell":
+            # calculate sale price, minus fees
+            self.sale_actual_revenue_usd = self.spot_price * self.qty_change - self.fees_usd
+            self.sale_actual_price = float(self.sale_actual_revenue_usd) / float(self.qty_change)
+        # calculate income if an income
+        self.income_non_business = "-"
+        if self.tx_type.lower() == 'income_non_business':
+            # note: cannot subtract fees here, since get to include fees in basis. otherwise would be double tax benefit
+            self.income_non_business = self.spot_price * self.qty_change
+        # Important error checking
+        if self.action == "buy" and self.tx_type == "Sell":
+            raise ValueError(f"QtyChange {self.qty_change}: "
+                             f"Identified a Tx Type Sell that has a positive or zero amount-change value. ERROR!")
+
+
+class Buy:
+
+    def __init__(self, action: Action, date):
+        self.action = action
+        self.date = date
+        self.basis_remaining = deepcopy(self.action.qty_change)
+        self.basis_remaining_units = self.action.qty_change_units
+        self.sell_ids_lt = []
+        self.sell_ids_st = []
+        # (sell date, base units) of every sell matched against this lot
+        self.consumed = []
+
+class Sell:
+
+    def __init__(self, action: Action, date):
+        self.action = action
+        self.date = date
+        self.sell_qty_remaining = -1.0 * deepcopy(self.action.qty_change)
+        self.sell_qty_remaining_units = -self.action.qty_change_units
+        self.basis_total_cost = 0
+        self.basis_total_qty_lt = 0
+        self.basis_total_cost_lt = 0
+        self.basis_total_qty_st = 0
+        self.basis_total_cost_st = 0
+        self.buy_ids_lt = []
+        self.buy_ids_st = []
+        # (Buy, base units) of every lot matched against this sell, in match order
+        self.lots = []
+        self.cap_gain_lt = None
+        self.cap_gain_st = None
+        self.cap_gain = None
+        self.cap_gain_tax_est_lt = None
+        self.cap_gain_tax_est_st = None
+        self.cap_gain_tax_est = None
+
+
+# label report dataframe titles
+REPORT_COLUMNS = ['ID', 'Type', 'Class', 'Date', 'Asset', 'Qty Change', 'Spot Price', 'Fees Asset', 'Fees Qty',
+                  'Fees USD', 'Buy/Sell IDs ST', 'Buy/Sell IDs LT',
+                  'Basis Amount ST', 'Basis Cost ST', 'Cap Gain ST', 'Cap Gain Tax Est ST',
+                  'Basis Amount LT', 'Basis Cost LT', 'Cap Gain LT', 'Cap Gain Tax Est LT',
+                  'Cap Gain TOT', 'Cap Gain Tax Est TOT',
+                  'Income_non_business',
+                  'Receipts', 'Purchase Info', 'Metadata']
+
+
+class Events:
+    """
+    Array-backed table of the actions of every asset, one row per event (asset, date, action).
+    Rows are sorted once, by asset in order of first appearance, date and action ID, so several events
+    of an asset may share a date (e.g. a gas fee sale landing on another event) and are ordered
+    deterministically, in input order.
+    """
+
+    def __init__(self, assets: list, dates, actions: list):
+        """
+        :param assets: list of str asset of each event
+        :param dates: pd.DatetimeIndex (or list of datetime) date of each event
+        :param actions: list of Action of each event
+        """
+        self.assets = np.array(assets, dtype=object)
+        self.dates = pd.DatetimeIndex(dates)
+        self.actions = np.empty(len(actions), dtype=object)
+        self.actions[:] = actions
+        self._codes = None  # asset codes of sorted rows, None until sorted
+
+    def __len__(self):
+        return len(self.actions)
+
+    def append(self, assets: list, dates, actions: list):
+        """
+        Adds events, the table is sorted again on next use
+        """
+        _new = Events(assets, dates, actions)
+        self.assets = np.concatenate([self.assets, _new.assets])
+        self.dates = self.dates.append(_new.dates)
+        self.actions = np.concatenate([self.actions, _new.actions])
+        self._codes = None
+
+    def sort(self):
+        """
+        Sorts rows by (asset, date, action ID) with a single lexsort, unless already sorted
+        """
+        if self._codes is not None:
+            return
+        _codes, _ = pd.factorize(self.assets)
+        _ids = np.array([_action.id for _action in self.actions], dtype=np.float64)
+        _order = np.lexsort((_ids, self.dates.asi8, _codes))
+        self.assets = self.assets[_order]
+        self.dates = self.dates[_order]
+        self.actions = self.actions[_order]
+        self._codes = _codes[_order]
+
+    def groups(self):
+        """
+        :return: iterator of tuples of (asset, pd.DatetimeIndex dates, np.ndarray of Action), per asset, in
+                 order of first appearance, each in event order
+        """
+        self.sort()
+        _bounds = np.flatnonzero(np.diff(self._codes)) + 1
+        for _start, _end in zip(np.concatenate([[0], _bounds]), np.concatenate([_bounds, [len(self)]])):
+            yield self.assets[_start], self.dates[_start:_end], self.actions[_start:_end]
+
+
+def parse_gains_dates(dates: pd.Series):
+    """
+    :param dates: pd.Series of str dates of gains input data
+    :return: pd.DatetimeIndex, parsed vectorized when pandas can, per value by dateparser otherwise
+    """
+    try:
+        return pd.DatetimeIndex(parse_ledger_dates(dates))
+    except ValueError:
+        return pd.DatetimeIndex([dateparser.parse(_date) for _date in dates])
+
+
+@Metrics.timed("gains_build_assets")
+def build_assets(df: pd.DataFrame):
+    """
+    Builds the table of actions of every asset
+    :param df: pd.DataFrame gains input data (one row per asset qty change)
+    :return: Events one per input row, with action IDs in input order
+    """
+    actions = [Action(float(ind), _type, _qty_change, _spot_price, _fees_asset_sym, _fees_asset, _fees_usd, _receipts,
+                      _purchase_info, _meta, Units.get_decimals(_asset))
+               for ind, (_asset, _type, _qty_change, _spot_price, _fees_asset_sym, _fees_asset, _fees_usd, _receipts,
+                         _purchase_info, _meta)
+               in enumerate(zip(df['Asset'], df['Type'], df['Qty Change'], df['Spot Price USD'], df['TxnFeeAsset'],
+                                df['TxnFee(ASSET)'], df['TxnFee(USD)'], df['Tx Receipts'], df['Purchased From'],
+                                df['Other']))]
+    return Events(df['Asset'].tolist(), parse_gains_dates(df['Date']), actions)
+
+
+@Metrics.timed("gains_gas_fee_sales")
+def add_gas_fee_sales(events: Events):
+    """
+    Treats every transaction gas fee as paid in <gas fee asset>, and as essentially a small sale of
+    <gas fee asset> for usd to pay gas.
+    Adds sales 1 second after each tx to calculate gains or loss on the <gas fee asset> sold to pay gas fees.
+    This applies to both buys and sells, any tx that has a gas fee.
+    :param events: Events, updated in place
+    """
+    # a new sell event that has no fees, but tracks the "sale" of eth used to pay for this tx gas fee
+    _has_fees = np.array([_action.fees_asset > 0 for _action in events.actions], dtype=bool)
+    if not _has_fees.any():
+        return
+    _paid = events.actions[_has_fees]
+    events.append([action.fees_asset_sym for action in _paid],
+                  events.dates[_has_fees] + pd.Timedelta(seconds=1),
+                  [Action(action.id + 0.1, 'fee', -1.0 * action.fees_asset, action.fees_usd / action.fees_asset, '',
+                          0.0, 0.0, action.receipts, action.purchase_info, 'FEE PAYMENT',
+                          Units.get_decimals(action.fees_asset_sym))
+                   for action in _paid])
+
+
+def match_fifo(buy_units: np.ndarray, sell_units: np.ndarray):
+    """
+    Matches sells to buys FIFO in integer base units, all at once: sell k consumes the slice of cumulative
+    buy qty between the cumulative qty of sells before it and including it, so every overlap of a buy's
+    and a sell's slice is one matched pair
+    :param buy_units: np.ndarray base units of each buy, in order
+    :param sell_units: np.ndarray positive base units of each sell, in order
+    :return: tuple of np.ndarray buy index, np.ndarray sell index, np.ndarray base units of each matched pair
+             (ordered by sell, then buy) and int number of leading sells fully covered by buys
+    """
+    if buy_units.dtype != sell_units.dtype:
+        # int64 and Python int totals are only compared as Python ints
+        buy_units, sell_units = buy_units.astype(object), sell_units.astype(object)
+    _buy_ends = np.cumsum(buy_units)
+    _sell_ends = np.cumsum(sell_units)
+    _total_buy = _buy_ends[-1] if len(_buy_ends) > 0 else 0
+    _num_covered = int(np.searchsorted(_sell_ends, _total_buy, side="right"))
+    if _num_covered == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64), _sell_ends[:0], 0
+    # slice boundaries up to the end of the last covered sell; zero qty buys and sells add no slice
+    _points = np.union1d(np.concatenate([_buy_ends[:0], [0], _buy_ends]),
+                         np.concatenate([_sell_ends[:0], [0], _sell_ends[:_num_covered]]))
+    _points = _points[_points <= _sell_ends[_num_covered - 1]]
+    _starts = _points[:-1]
+    _buy_index = np.searchsorted(_buy_ends, _starts, side="right")
+    _sell_index = np.searchsorted(_sell_ends, _starts, side="right")
+    return _buy_index, _sell_index, _points[1:] - _starts, _num_covered
+
+
+@Metrics.timed("gains_match_lots")
+def match_lots(events: Events):
+    """
+    Matches sells to buys FIFO, per asset, and calculates basis, gains, etc. of every sell
+    :param events: Events of every asset
+    :return: tuple of dicts of asset -> list of Buy, and asset -> list of Sell, in date order
+    """
+    buys = dict()
+    sells = dict()
+    for _asset, _dates, _actions in events.groups():
+        _is_buy = np.array([_action.action == 'buy' for _action in _actions], dtype=bool)
+        buys[_asset] = [Buy(_action, _date) for _action, _date in zip(_actions[_is_buy], _dates[_is_buy])]
+        sells[_asset] = [Sell(_action, _date) for _action, _date in zip(_actions[~_is_buy], _dates[~_is_buy])]
+        if len(sells[_asset]) == 0:
+            continue
+        # for each sell, calculate basis, gains, etc.
+        _buys = buys[_asset]
+        _sells = sells[_asset]
+        _decimals = _sells[0].action.decimals
+        _buy_units = [buy.basis_remaining_units for buy in _buys]
+        _sell_units = [sell.sell_qty_remaining_units for sell in _sells]
+        # matched in units of 10^(_scale - _decimals), so most assets' totals fit int64
+        _scale = Units.get_scale(_buy_units + _sell_units, _decimals)
+        _buy_index, _sell_index, _units, _num_covered = match_fifo(
+            Units.to_array(_buy_units, _scale), Units.to_array(_sell_units, _scale))
+        if _num_covered < len(_sells):
+            raise ValueError(f"Sell ID {_sells[_num_covered].action.id} could not find enough buys to complete basis!")
+        _qty = Units.to_float_array(_units, _decimals - _scale)
+        # must track short and long term separately
+        _buy_dates = _dates[_is_buy].values
+        _sell_dates = _dates[~_is_buy].values
+        _is_lt = (_buy_dates[_buy_index] + np.timedelta64(365, "D")) < _sell_dates[_sell_index]
+        _cost = np.array([buy.action.basis_price for buy in _buys])[_buy_index] * _qty
+        # per sell and term: exact basis qty, basis cost added in match order, and whether any lot matched
+        _totals = {}
+        for _name, _mask in [("lt", _is_lt), ("st", ~_is_lt)]:
+            _units_total = np.zeros(len(_sells), dtype=_units.dtype)
+            _cost_total = np.zeros(len(_sells))
+            np.add.at(_units_total, _sell_index[_mask], _units[_mask])
+            np.add.at(_cost_total, _sell_index[_mask], _cost[_mask])
+            _totals[_name] = (Units.to_float_array(_units_total, _decimals - _scale), _cost_total,
+                              np.bincount(_sell_index[_mask], minlength=len(_sells)) > 0)
+        _qty_lt, _cost_lt, _has_lt = _totals["lt"]
+        _qty_st, _cost_st, _has_st = _totals["st"]
+        _consumed_units = np.zeros(len(_buys), dtype=_units.dtype)
+        np.add.at(_consumed_units, _buy_index, _units)
+        # lots are kept in base units
+        _factor = 10 ** _scale
+        _lot_units = [_u * _factor for _u in _units.tolist()]
+        for _b, _s, _u, _lt in zip(_buy_index.tolist(), _sell_index.tolist(), _lot_units, _is_lt.tolist()):
+            # add the buy ID to the sell and the sell ID to the buy, as LT or ST
+            if _lt:
+                _sells[_s].buy_ids_lt.append(_buys[_b].action.id)
+                _buys[_b].sell_ids_lt.append(_sells[_s].action.id)
+            else:
+                _sells[_s].buy_ids_st.append(_buys[_b].action.id)
+                _buys[_b].sell_ids_st.append(_sells[_s].action.id)
+            _buys[_b].consumed.append((_sells[_s].date, _u))
+            _sells[_s].lots.append((_buys[_b], _u))
+        for _b, buy in enumerate(_buys):
+            buy.basis_remaining_units -= int(_consumed_units[_b]) * _factor
+            buy.basis_remaining = Units.from_base_units(buy.basis_remaining_units, _decimals)
+        for _s, sell in enumerate(_sells):
+            sell.sell_qty_remaining_units = 0
+            sell.sell_qty_remaining = 0.0
+            # totals of a term without any matched lots stay 0
+            if _has_lt[_s]:
+                sell.basis_total_qty_lt = float(_qty_lt[_s])
+                sell.basis_total_cost_lt = float(_cost_lt[_s])
+            if _has_st[_s]:
+                sell.basis_total_qty_st = float(_qty_st[_s])
+                sell.basis_total_cost_st = float(_cost_st[_s])
+            # calculate short and long term gains for this sell
+            sell.cap_gain_lt = (sell.action.sale_actual_price * sell.basis_total_qty_lt) - sell.basis_total_cost_lt
+            sell.cap_gain_st = (sell.action.sale_actual_price * sell.basis_total_qty_st) - sell.basis_total_cost_st
+            sell.cap_gain = sell.cap_gain_lt + sell.cap_gain_st
+            # calculate estimated tax liabilities
+            sell.cap_gain_tax_est_lt = sell.cap_gain_lt * LONG_TERM_CAP_GAIN_RATE_EST
+            sell.cap_gain_tax_est_st = sell.cap_gain_st * SHORT_TERM_CAP_GAIN_RATE_EST
+            sell.cap_gain_tax_est = sell.cap_gain_tax_est_lt + sell.cap_gain_tax_est_st
+    return buys, sells
+
+
+@Metrics.timed("gains_build_report")
+def build_report(buys: dict, sells: dict):
+    """
+    Generates capital gains report, one row per buy/sell
+    :param buys: dict of asset -> list of Buy
+    :param sells: dict of asset -> list of Sell
+    :return: pd.DataFrame report, sorted by date
+    """
+    # one entry per buy/sell: each asset's buys, then its sells
+    assets = []
+    entries = []
+    for _asset in buys.keys():
+        for _entry in buys[_asset] + sells[_asset]:
+            assets.append(_asset)
+            entries.append(_entry)
+    actions = [_entry.action for _entry in entries]
+    is_sell = [isinstance(_entry, Sell) for _entry in entries]
+
+    def _sell_column(attribute: str):
+        # only sells have basis and gains, buys are left empty
+        return [getattr(_entry, attribute) if _is_sell else None for _entry, _is_sell in zip(entries, is_sell)]
+
+    # columns are built directly, rather than row by row
+    report = pd.DataFrame({
+        'ID': [_action.id for _action in actions],
+        'Type': [_action.tx_type for _action in actions],
+        'Class': [_action.action for _action in actions],
+        'Date': [_entry.date for _entry in entries],
+        'Asset': assets,
+        'Qty Change': [_action.qty_change for _action in actions],
+        'Spot Price': [_action.spot_price for _action in actions],
+        'Fees Asset': [_action.fees_asset_sym for _action in actions],
+        'Fees Qty': [_action.fees_asset for _action in actions],
+        'Fees USD': [_action.fees_usd for _action in actions],
+        'Buy/Sell IDs ST': [_entry.buy_ids_st if _is_sell else _entry.sell_ids_st
+                            for _entry, _is_sell in zip(entries, is_sell)],
+        'Buy/Sell IDs LT': [_entry.buy_ids_lt if _is_sell else _entry.sell_ids_lt
+                            for _entry, _is_sell in zip(entries, is_sell)],
+        'Basis Amount ST': _sell_column('basis_total_qty_st'),
+        'Basis Cost ST': _sell_column('basis_total_cost_st'),
+        'Cap Gain ST': _sell_column('cap_gain_st'),
+        'Cap Gain Tax Est ST': _sell_column('cap_gain_tax_est_st'),
+        'Basis Amount LT': _sell_column('basis_total_qty_lt'),
+        'Basis Cost LT': _sell_column('basis_total_cost_lt'),
+        'Cap Gain LT': _sell_column('cap_gain_lt'),
+        'Cap Gain Tax Est LT': _sell_column('cap_gain_tax_est_lt'),
+        'Cap Gain TOT': _sell_column('cap_gain'),
+        'Cap Gain Tax Est TOT': _sell_column('cap_gain_tax_est'),
+        'Income_non_business': [_action.income_non_business for _action in actions],
+        'Receipts': [_action.receipts for _action in actions],
+        'Purchase Info': [_action.purchase_info for _action in actions],
+        'Metadata': [_action.meta for _action in actions],
+    }, columns=REPORT_COLUMNS)
+
+    # sort by date, stable so events on the same date keep their order
+    return report.sort_values(by='Date', kind='mergesort')
+
+
+@Metrics.timed("gains")
+def generate_gains_report(df: pd.DataFrame):
+    """
+    Runs the full FIFO gains engine over gains input data
+    :param df: pd.DataFrame gains input data
+    :return: pd.DataFrame report, sorted by date
+    """
+    events = build_assets(df)
+    add_gas_fee_sales(events)
+    buys, sells = match_lots(events)
+    return build_report(buys, sells)
@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+import dateparser
+from metrics import Metrics
+from units import Units
+from .gains import build_assets, add_gas_fee_sales, match_lots, LONG_TERM_CAP_GAIN_RATE_EST, \
+    SHORT_TERM_CAP_GAIN_RATE_EST
+
+PRICE_TABLE_COLUMNS = ["Date", "Asset", "Spot Price USD"]
+OPEN_LOT_COLUMNS = ['As Of', 'ID', 'Date', 'Asset', 'Term', 'Qty Remaining', 'Basis Price', 'Basis Remaining',
+                    'Spot Price', 'Market Value', 'Unrealized Gain ST', 'Unrealized Gain LT', 'Unrealized Gain TOT',
+                    'Unrealized Gain Tax Est TOT']
+OPEN_LOT_SUMMARY_COLUMNS = ['As Of', 'Asset', 'Qty Remaining', 'Basis Remaining', 'Market Value',
+                            'Unrealized Gain ST', 'Unrealized Gain LT', 'Unrealized Gain TOT',
+                            'Unrealized Gain Tax Est ST', 'Unrealized Gain Tax Est LT', 'Unrealized Gain Tax Est TOT']
+
+
+@Metrics.timed("open_lots_build")
+def build_lot_tables(df: pd.DataFrame):
+    """
+    Runs the FIFO gains engine and flattens every buy lot, and every sell matched against it, into tables,
+    so open lots can be valued at any date without rerunning the engine
+    :param df: pd.DataFrame gains input data
+    :return: tuple of pd.DataFrame lots (ID, Date, Asset, Units, Decimals, Basis Price) and
+             pd.DataFrame consumptions (ID, Date, Units) of sells matched against each lot; quantities are
+             exact integer base units
+    """
+    events = build_assets(df)
+    add_gas_fee_sales(events)
+    buys, _ = match_lots(events)
+    lots = []
+    consumptions = []
+    for _asset in buys.keys():
+        for buy in buys[_asset]:
+            if buy.action.qty_change <= 0:
+                continue
+            lots.append([buy.action.id, buy.date, _asset, buy.action.qty_change_units, buy.action.decimals,
+                         buy.action.basis_price])
+            for _date, _units in buy.consumed:
+                consumptions.append([buy.action.id, _date, _units])
+    lots = pd.DataFrame(lots, columns=['ID', 'Date', 'Asset', 'Units', 'Decimals', 'Basis Price'])
+    consumptions = pd.DataFrame(consumptions, columns=['ID', 'Date', 'Units'])
+    # base units may exceed int64, they are kept as Python ints
+    lots['Units'] = lots['Units'].astype(object)
+    consumptions['Units'] = consumptions['Units'].astype(object)
+    lots['Date'] = pd.to_datetime(lots['Date'])
+    consumptions['Date'] = pd.to_datetime(consumptions['Date'])
+    return lots, consumptions
+
+
+def read_price_table(price_file):
+    """
+    Reads a local historical price table, a csv with one row per asset and date (PRICE_TABLE_COLUMNS)
+    :return: pd.DataFrame sorted by date
+    """
+    prices = pd.read_csv(price_file, usecols=PRICE_TABLE_COLUMNS)
+    prices['Date'] = pd.to_datetime(prices['Date'])
+    prices['Spot Price USD'] = prices['Spot Price USD'].astype("float64")
+    return prices.sort_values(by='Date', kind='mergesort').reset_index(drop=True)
+
+
+def get_prices_at(prices: pd.DataFrame, as_of):
+    """
+    :param prices: pd.DataFrame price table from read_price_table
+    :param as_of: datetime valuation date
+    :return: pd.Series mapping asset to its latest price on or before as_of
+    """
+    _until = np.searchsorted(prices['Date'].values, np.datetime64(pd.Timestamp(as_of)), side='right')
+    return prices.iloc[:_until].drop_duplicates(subset='Asset', keep='last').set_index('Asset')['Spot Price USD']
+
+
+def value_open_lots(lots: pd.DataFrame, consumptions: pd.DataFrame, prices: pd.DataFrame, as_of):
+    """
+    Values every lot still open at as_of at the price table's price, vectorized across all lots.
+    A lot is long term if it was bought more than 365 days before as_of, as for realized gains.
+    :param lots: pd.DataFrame lots from build_lot_tables
+    :param consumptions: pd.DataFrame consumptions from build_lot_tables
+    :param prices: pd.DataFrame price table from read_price_table
+    :param as_of: datetime valuation date
+    :return: pd.DataFrame one row per open lot (OPEN_LOT_COLUMNS); assets without a price have NaN values
+    """
+    as_of = pd.Timestamp(as_of)
+    _consumed = consumptions.loc[consumptions['Date'] <= as_of].groupby('ID')['Units'].sum()
+    _remaining = lots['Units'] - lots['ID'].map(_consumed).fillna(0)
+    # remaining qty is exact, so fully sold lots are exactly zero
+    _open = lots.loc[(lots['Date'] <= as_of) & (_remaining > 0)]
+    _qty = [Units.from_base_units(_units, _decimals)
+            for _units, _decimals in zip(_remaining.loc[_open.index], _open['Decimals'])]
+    report = pd.DataFrame({
+        'As Of': as_of,
+        'ID': _open['ID'],
+        'Date': _open['Date'],
+        'Asset': _open['Asset'],
+        'Qty Remaining': np.array(_qty, dtype=np.float64),
+        'Basis Price': _open['Basis Price'],
+    })
+    _is_lt = (report['Date'] + timedelta(days=365)) < as_of
+    report['Term'] = np.where(_is_lt, 'LT', 'ST')
+    report['Basis Remaining'] = report['Qty Remaining'] * report['Basis Price']
+    report['Spot Price'] = report['Asset'].map(get_prices_at(prices, as_of))
+    report['Market Value'] = report['Qty Remaining'] * report['Spot Price']
+    _gain = report['Market Value'] - report['Basis Remaining']
+    report['Unrealized Gain ST'] = _gain.where(~_is_lt, 0.0)
+    report['Unrealized Gain LT'] = _gain.where(_is_lt, 0.0)
+    report['Unrealized Gain TOT'] = _gain
+    report['Unrealized Gain Tax Est TOT'] = report['Unrealized Gain ST'] * SHORT_TERM_CAP_GAIN_RATE_EST + \
+        report['Unrealized Gain LT'] * LONG_TERM_CAP_GAIN_RATE_EST
+    _missing = sorted(report.loc[report['Spot Price'].isnull(), 'Asset'].unique())
+    if len(_missing) > 0:
+        print(f"[WARN] no price on or before {as_of} for open lots of: {', '.join(_missing)}")
+    return report[OPEN_LOT_COLUMNS].reset_index(drop=True)
+
+
+def summarize_open_lots(report: pd.DataFrame):
+    """
+    :param report: pd.DataFrame open lots from value_open_lots (one or more valuation dates)
+    :return: pd.DataFrame totals per valuation date and asset (OPEN_LOT_SUMMARY_COLUMNS)
+    """
+    summary = report.groupby(['As Of', 'Asset'], sort=True)[
+        ['Qty Remaining', 'Basis Remaining', 'Market Value', 'Unrealized Gain ST', 'Unrealized Gain LT',
+         'Unrealized Gain TOT']].sum(min_count=1).reset_index()
+    summary['Unrealized Gain Tax Est ST'] = summary['Unrealized Gain ST'] * SHORT_TERM_CAP_GAIN_RATE_EST
+    summary['Unrealized Gain Tax Est LT'] = summary['Unrealized Gain LT'] * LONG_TERM_CAP_GAIN_RATE_EST
+    summary['Unrealized Gain Tax Est TOT'] = summary['Unrealized Gain Tax Est ST'] + \
+        summary['Unrealized Gain Tax Est LT']
+    return summary[OPEN_LOT_SUMMARY_COLUMNS]
+
+
+@Metrics.timed("open_lots")
+def generate_open_lots_report(df: pd.DataFrame, price_file, dates: list):
+    """
+    Values the open lots of gains input data at each of dates from a local price table
+    :param df: pd.DataFrame gains input data
+    :param price_file: Path price table csv (PRICE_TABLE_COLUMNS)
+    :param dates: list of str valuation dates
+    :return: tuple of pd.DataFrame open lots and pd.DataFrame per asset summary
+    """
+    lots, consumptions = build_lot_tables(df)
+    prices = read_price_table(price_file)
+    report = pd.concat([value_open_lots(lots, consumptions, prices, dateparser.parse(_date)) for _date in dates],
+                       ignore_index=True)
+    return report, summarize_open_lots(report)
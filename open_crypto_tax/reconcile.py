@@ -0,0 +1,102 @@
+import csv
+from pathlib import Path
+from metrics import Metrics
+from units import Units
+from chain_registry import get_chain
+
+RECONCILE_COLUMNS = ["Asset", "TokenAddress", "LedgerBalance", "OnChainBalance", "Difference", "Status"]
+
+
+def read_balances(balances_file: Path):
+    """
+    Reads a balances file written by generate_balances_from_tokentax ("asset, balance" lines)
+    :return: dict mapping asset to str balance, as written (exact decimal)
+    """
+    balances = dict()
+    with open(balances_file) as f:
+        for line in f:
+            if line.strip() == "":
+                continue
+            _asset, _balance = line.rsplit(",", 1)
+            balances[_asset.strip()] = _balance.strip()
+    return balances
+
+
+def read_token_addresses(tokens_file: Path, chain: str):
+    """
+    Reads a token list csv with columns symbol, chain and address
+    :return: dict mapping symbol to token address, for tokens on chain
+    """
+    symbol_to_addr = dict()
+    with open(tokens_file, newline="") as f:
+        for row in csv.DictReader(f):
+            if row["chain"].strip() == chain:
+                symbol_to_addr[row["symbol"].strip()] = row["address"].strip()
+    return symbol_to_addr
+
+
+@Metrics.timed("reconcile")
+def reconcile_balances(balances_file: Path, wallets: list, chain: str, block_number: int,
+                       tokens_file: Path = None, tolerance: float = 0.000001):
+    """
+    Compares ledger balances with the summed on-chain balances of wallets at a snapshot block.
+    Token addresses come from tokens_file, falling back to the token cache; assets of other chains
+    and assets without a known address are reported as unresolved.
+    :param balances_file: Path balances file written by generate_balances_from_tokentax
+    :param wallets: list of str wallet addresses
+    :param chain: str chain to reconcile (e.g. ETH, BSC)
+    :param block_number: int snapshot block
+    :param tokens_file: (optional) Path csv with columns symbol, chain and address
+    :param tolerance: float max absolute difference reported as ok
+    :return: list of rows (RECONCILE_COLUMNS)
+    """
+    # web3_api is only imported once balances are looked up, it pulls in web3
+    from web3_api import Web3Query
+    from web3_api.caches import get_cached_token_addresses
+    ledger_balances = read_balances(balances_file)
+    symbol_to_addr = get_cached_token_addresses(chain)
+    if tokens_file is not None:
+        symbol_to_addr.update(read_token_addresses(tokens_file, chain))
+    # the native gas asset is held by wallets outside any token contract
+    native_asset = get_chain(chain).gas_asset
+    token_assets = [asset for asset in ledger_balances.keys() if asset != native_asset and asset in symbol_to_addr]
+    token_addrs = [symbol_to_addr[asset] for asset in token_assets]
+    # decimals are cached, balances of every wallet and token come from a few aggregated calls
+    addr_to_decimals = {addr: decimals for addr, (_, decimals) in
+                        Web3Query.get_tokens_symbol_and_decimals(token_addrs, chain).items()}
+    raw_balances = Web3Query.get_balances_at_block(wallets, token_addrs, chain, block_number)
+    rows = []
+    for asset, ledger_balance in ledger_balances.items():
+        if asset == native_asset:
+            _addr, _decimals = None, get_chain(chain).gas_asset_decimals
+        elif asset in symbol_to_addr:
+            _addr = symbol_to_addr[asset]
+            _decimals = addr_to_decimals[_addr]
+        else:
+            rows.append([asset, "", ledger_balance, "", "", "unresolved"])
+            continue
+        _raw = [raw_balances[(wallet, _addr)] for wallet in wallets]
+        if any(b is None for b in _raw):
+            rows.append([asset, _addr or "", ledger_balance, "", "", "call_failed"])
+            continue
+        # compared exactly, in on-chain base units
+        _difference = sum(_raw) - Units.to_base_units(ledger_balance, _decimals, round_excess=True)
+        rows.append([asset, _addr or "", ledger_balance, Units.format_base_units(sum(_raw), _decimals),
+                     Units.format_base_units(_difference, _decimals),
+                     "ok" if abs(_difference) <= Units.to_base_units(tolerance, _decimals, round_excess=True)
+                     else "mismatch"])
+    return rows
+
+
+def write_reconciliation(rows: list, output_filename: Path):
+    with open(output_filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(RECONCILE_COLUMNS)
+        writer.writerows(rows)
+    num_mismatches = sum(1 for row in rows if row[-1] == "mismatch")
+    num_unresolved = sum(1 for row in rows if row[-1] in ["unresolved", "call_failed"])
+    for row in rows:
+        if row[-1] != "ok":
+            print(f"[WARN] {row[0]}: {row[-1]} (ledger {row[2]}, on-chain {row[3]})")
+    print(f"[INFO] reconciliation written: {output_filename} "
+          f"({num_mismatches} mismatches, {num_unresolved} unresolved of {len(rows)} assets)")
@@ -0,0 +1,92 @@
+import hashlib
+import html
+import re
+import pandas as pd
+from pathlib import Path
+from metrics import Metrics
+
+HTML_ROWS_PER_PAGE = 1000  # report rows per html page
+SUMMARY_COLUMNS = ['Asset', 'Buys', 'Sells', 'Cap Gain ST', 'Cap Gain LT', 'Cap Gain TOT',
+                   'Cap Gain Tax Est ST', 'Cap Gain Tax Est LT', 'Cap Gain Tax Est TOT', 'Income_non_business']
+_GAIN_COLUMNS = SUMMARY_COLUMNS[3:]
+_PAGE_HEAD = '<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>{title}</title></head>\n<body>\n'
+_PAGE_TAIL = '</body>\n</html>\n'
+
+
+def summarize_gains_report(report: pd.DataFrame, by: list = None):
+    """
+    Totals gains, estimated taxes and income of a gains report
+    :param report: pd.DataFrame gains report from generate_gains_report
+    :param by: list of str (optional) columns to group by; defaults to ['Asset']
+    :return: pd.DataFrame one row per group, with number of buys and sells and SUMMARY_COLUMNS totals
+    """
+    by = by or ['Asset']
+    _report = report[by].copy()
+    _report['Buys'] = (report['Class'] == 'buy').astype(int)
+    _report['Sells'] = (report['Class'] == 'sell').astype(int)
+    for col in _GAIN_COLUMNS:
+        # buys have no gains and non-income rows have "-" income
+        _report[col] = pd.to_numeric(report[col], errors='coerce').fillna(0.0)
+    return _report.groupby(by, sort=True).sum().reset_index()
+
+
+def _page_name(asset: str, year: int, page: int):
+    # file names keep only characters safe on every filesystem; a short hash of the asset keeps assets that only
+    # differ in unsafe characters or case (e.g. USDC.e and USDC_e) apart
+    _hash = hashlib.sha1(str(asset).encode("utf-8")).hexdigest()[:8]
+    return f"{re.sub(r'[^A-Za-z0-9_-]', '_', str(asset))}_{_hash}_{year}_{page}.html"
+
+
+@Metrics.timed("gains_html_report")
+def write_html_report(report: pd.DataFrame, output_dir: Path, rows_per_page: int = HTML_ROWS_PER_PAGE):
+    """
+    Writes a gains report as html pages per asset and year, of at most rows_per_page rows each, and an
+    index page with per asset and per asset-year totals linking to every page. Pages are written one at
+    a time, so no page (or the whole report) is ever built as a single string.
+    :param report: pd.DataFrame gains report from generate_gains_report
+    :param output_dir: Path directory of the html pages
+    :param rows_per_page: int max report rows per page
+    :return: Path of the index page
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    _years = pd.to_datetime(report['Date']).dt.year.rename('Year')
+    pages = dict()  # (asset, year) -> list of page file names
+    for (_asset, _year), _rows in report.groupby([report['Asset'], _years], sort=True):
+        _num_pages = (_rows.shape[0] + rows_per_page - 1) // rows_per_page
+        _names = [_page_name(_asset, _year, i + 1) for i in range(0, _num_pages)]
+        pages[(_asset, _year)] = _names
+        for i, _name in enumerate(_names):
+            with open(output_dir / _name, 'w') as f:
+                _title = f"{_asset} {_year} - page {i + 1} of {_num_pages}"
+                f.write(_PAGE_HEAD.format(title=html.escape(_title)))
+                f.write(f"<h1>{html.escape(_title)}</h1>\n")
+                _links = ['<a href="index.html">index</a>']
+                if i > 0:
+                    _links.append(f'<a href="{_names[i - 1]}">previous</a>')
+                if i + 1 < _num_pages:
+                    _links.append(f'<a href="{_names[i + 1]}">next</a>')
+                f.write(f"<p>{' | '.join(_links)}</p>\n")
+                _rows.iloc[i * rows_per_page:(i + 1) * rows_per_page].to_html(f)
+                f.write(_PAGE_TAIL)
+    # index of precomputed totals
+    _summary = summarize_gains_report(report)
+    _total = _summary[SUMMARY_COLUMNS[1:]].sum().to_frame().T
+    _total.insert(0, 'Asset', 'TOTAL')
+    _by_year = summarize_gains_report(report.assign(Year=_years), by=['Asset', 'Year'])
+    _by_year['Pages'] = [' '.join(f'<a href="{_name}">{i + 1}</a>' for i, _name in enumerate(pages[(_asset, _year)]))
+                         for _asset, _year in zip(_by_year['Asset'], _by_year['Year'])]
+    index_file = output_dir / "index.html"
+    with open(index_file, 'w') as f:
+        f.write(_PAGE_HEAD.format(title="Gains report"))
+        f.write(f"<h1>Gains report</h1>\n<p>{report.shape[0]} rows, {len(pages)} asset-years</p>\n")
+        f.write("<h2>Totals per asset</h2>\n")
+        pd.concat([_summary, _total], ignore_index=True).astype({'Buys': int, 'Sells': int})[SUMMARY_COLUMNS] \
+            .to_html(f, index=False)
+        f.write("\n<h2>Totals per asset and year</h2>\n")
+        # asset names are escaped by hand since the page links must not be
+        _by_year['Asset'] = _by_year['Asset'].map(lambda asset: html.escape(str(asset)))
+        _by_year.to_html(f, index=False, escape=False)
+        f.write(_PAGE_TAIL)
+    print(f"[INFO] html report written: {index_file} ({sum(len(names) for names in pages.values())} pages)")
+    return index_file
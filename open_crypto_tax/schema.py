@@ -0,0 +1,97 @@
+import pandas as pd
+from contextlib import contextmanager
+from pathlib import Path
+
+NUM_GAS_TX_ALLOWED = 14
+# date format of imported swap and punk transactions
+DATE_OUTPUT_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+# date formats of csv and excel sourced input, tried in order before falling back to per-value parsing
+DATE_INPUT_FORMATS = [DATE_OUTPUT_FORMAT, "%Y-%m-%d %H:%M:%S"]
+
+# columns of a valid input file, by storage type
+# dates are kept as written, they are passed through to the TokenTax output unchanged
+LEDGER_DATE_COLUMNS = ["Date"]
+# flags are read as text, so a bad value fails its row (see ValidInputRow.parse_flag) rather than the whole file
+LEDGER_FLAG_COLUMNS = ["IsGiftFromMe", "IsGiftToMe", "IsOrdinaryIncome", "IsBusinessIncome1", "IsBusinessIncome2"]
+LEDGER_CATEGORY_COLUMNS = ["SellAsset", "BuyAsset", "BookFeeWith", "AuxFeeAsset"] + \
+                          [f"FeeChain{i + 1}" for i in range(0, NUM_GAS_TX_ALLOWED)] + LEDGER_FLAG_COLUMNS
+LEDGER_FLOAT_COLUMNS = ["SellQty", "SellSpotPriceUSD", "SellTotalUSD", "BuyQty", "BuySpotPriceUSD", "BuyTotalUSD",
+                        "AuxFeeQty", "AuxFeeSpotPrice", "AuxUSDFee", "GiftBasisUSD"] + \
+                       [f"FeeTx{i + 1}GasAssetPriceOverride" for i in range(0, NUM_GAS_TX_ALLOWED)]
+LEDGER_STRING_COLUMNS = ["Other Tx Receipts (fees not auto-calculated or included)", "Purchased From",
+                         "Other Notes"] + [f"FeeTx{i + 1}" for i in range(0, NUM_GAS_TX_ALLOWED)]
+# all but the first fee tx are almost always empty, so only their filled cells are stored
+LEDGER_SPARSE_COLUMNS = [col for i in range(1, NUM_GAS_TX_ALLOWED)
+                         for col in [f"FeeTx{i + 1}", f"FeeTx{i + 1}GasAssetPriceOverride"]]
+
+LEDGER_DTYPES = dict()
+LEDGER_DTYPES.update({col: "category" for col in LEDGER_CATEGORY_COLUMNS})
+LEDGER_DTYPES.update({col: "float64" for col in LEDGER_FLOAT_COLUMNS})
+LEDGER_DTYPES.update({col: "object" for col in LEDGER_STRING_COLUMNS + LEDGER_DATE_COLUMNS})
+
+
+def parse_ledger_dates(dates: pd.Series):
+    # a known format is parsed vectorized, per-value parsing is orders of magnitude slower
+    for date_format in DATE_INPUT_FORMATS:
+        try:
+            return pd.to_datetime(dates, format=date_format)
+        except ValueError:
+            continue
+    return pd.to_datetime(dates)
+
+
+def apply_ledger_schema(df: pd.DataFrame):
+    """
+    Converts the sparse fee columns of a valid input dataframe read with LEDGER_DTYPES, in place
+    :param df: pd.DataFrame valid input data
+    :return: pd.DataFrame df
+    """
+    for col in LEDGER_SPARSE_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(pd.SparseDtype(df[col].dtype, float("nan")))
+    return df
+
+
+def densify_ledger(df: pd.DataFrame):
+    """
+    :param df: pd.DataFrame valid input data with the ledger schema
+    :return: pd.DataFrame copy with dense fee columns, for row by row access
+    """
+    _sparse = [col for col in LEDGER_SPARSE_COLUMNS if col in df.columns and isinstance(df[col].dtype, pd.SparseDtype)]
+    if len(_sparse) == 0:
+        return df
+    return df.assign(**{col: df[col].sparse.to_dense() for col in _sparse})
+
+
+def read_ledger(input_valid: Path, chunksize: int = None, skiprows=None):
+    """
+    Reads a valid input file with the ledger schema, using the C parser: assets, chains, BookFeeWith and flags
+    as categories, amounts as float64, dates as written and fee txs after the first sparse
+    :param input_valid: Path valid input file
+    :param chunksize: int (optional) return an iterator of dataframes of chunksize rows
+    :param skiprows: (optional) rows to skip, passed to pd.read_csv
+    :return: pd.DataFrame, or iterator of pd.DataFrame if chunksize is given
+    """
+    # round_trip parses floats exactly as python does, so amounts are written back unchanged
+    _kwargs = dict(dtype=LEDGER_DTYPES, engine="c", float_precision="round_trip", skiprows=skiprows)
+    if chunksize is None:
+        with _schema_errors(input_valid):
+            return apply_ledger_schema(pd.read_csv(input_valid, **_kwargs))
+    return _read_ledger_chunks(input_valid, chunksize, _kwargs)
+
+
+def _read_ledger_chunks(input_valid: Path, chunksize: int, kwargs: dict):
+    with _schema_errors(input_valid):
+        for chunk in pd.read_csv(input_valid, chunksize=chunksize, **kwargs):
+            yield apply_ledger_schema(chunk)
+
+
+@contextmanager
+def _schema_errors(input_valid: Path):
+    # pandas does not name the column a bad value was found in
+    try:
+        yield
+    except ValueError as e:
+        raise ValueError(f"[ERROR] {input_valid} does not match the valid input schema ({e}) - "
+                         f"was it generated by the validator?") from e
+
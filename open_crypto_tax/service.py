@@ -0,0 +1,243 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from metrics import Metrics
+
+MAX_CACHED_RESULTS = 16  # parsed ledgers and results kept in memory, least recently used are dropped first
+DEFAULT_PORT = 8765
+
+
+def file_signature(path: Path):
+    """
+    :return: tuple identifying a file's contents cheaply (path, mtime and size); a changed file gets a new one
+    """
+    _stat = os.stat(path)
+    return str(Path(path).resolve()), _stat.st_mtime_ns, _stat.st_size
+
+
+def dataframe_to_json(df):
+    # NaN as null and dates as ISO strings, which json.dumps would not produce
+    return json.loads(df.to_json(orient="records", date_format="iso"))
+
+
+class TaxService:
+    """
+    Long-running local HTTP service for validate, process (TokenTax), balances and gains requests.
+    Heavy modules, providers and the fee, token, block and price caches are loaded once, and parsed
+    ledgers and results are kept in memory keyed by file signature, so repeat requests for unchanged
+    files return without reading or processing them again.
+    Requests are POSTed as JSON to /validate, /process, /balances and /gains; GET /stats and /health.
+    Requests are handled one at a time (pickledb caches are not thread safe).
+    Bind to localhost only: requests name files on this machine.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, chains: list = None):
+        """
+        :param chains: list of str (optional) chains whose providers are connected on start
+        """
+        self.chains = chains or []
+        self.results = OrderedDict()  # (endpoint, file signature, options) -> result
+        self.stats = defaultdict(int)
+        self._lock = threading.Lock()
+        self.routes = {
+            "/validate": self.validate,
+            "/process": self.process,
+            "/balances": self.balances,
+            "/gains": self.gains,
+        }
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    return self._send(200, service.get_stats())
+                if self.path == "/health":
+                    return self._send(200, {"status": "ok"})
+                return self._send(404, {"error": "not found"})
+
+            def do_POST(self):
+                _body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                _status, _response = service.handle(self.path, _body)
+                self._send(_status, _response)
+
+            def _send(self, status: int, response):
+                _data = json.dumps(response).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(_data)))
+                self.end_headers()
+                self.wfile.write(_data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, endpoint: str = ""):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/{endpoint.lstrip('/')}"
+
+    def warm(self):
+        """
+        Imports the processing modules, loads every cache file and connects providers of self.chains
+        """
+        with Metrics.stage("service_warm"):
+            # imported once here, instead of by the first request
+            from . import core, gains, balances
+            from web3_api import caches
+            from web3_api.web3_api import w3
+            for _cache in [caches.db, caches.token_db, caches.block_db, caches.price_db]:
+                _cache.load()
+            for chain in self.chains:
+                w3[chain]
+        print(f"[INFO] caches loaded, providers connected: {', '.join(self.chains) or 'none'}")
+
+    def start(self):
+        self.warm()
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def get_stats(self):
+        # not behind the request lock, so stats are served while a long request runs
+        return {"requests": dict(self.stats), "cached_results": len(self.results), "metrics": Metrics.report()}
+
+    def handle(self, path: str, body: bytes):
+        """
+        :return: tuple of (http status, response json)
+        """
+        if path not in self.routes:
+            return 404, {"error": "not found"}
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            return 400, {"error": "invalid json"}
+        with self._lock:
+            self.stats[path] += 1
+            _start = time.perf_counter()
+            try:
+                response = self.routes[path](request)
+            except KeyError as e:
+                self.stats[path + ":error"] += 1
+                return 400, {"error": f"missing parameter {e}"}
+            except (ValueError, LookupError, OSError) as e:
+                # bad input data or files, e.g. an invalid ledger row
+                self.stats[path + ":error"] += 1
+                return 400, {"error": str(e)}
+            except Exception as e:
+                self.stats[path + ":error"] += 1
+                return 500, {"error": f"{type(e).__name__}: {e}"}
+            response["seconds"] = time.perf_counter() - _start
+            return 200, response
+
+    def _cached(self, key: tuple, compute):
+        # results of unchanged files are reused, the least recently used are dropped first
+        if key in self.results:
+            self.results.move_to_end(key)
+            self.stats["cache_hits"] += 1
+            return self.results[key], True
+        self.stats["cache_misses"] += 1
+        result = compute()
+        self.results[key] = result
+        if len(self.results) > MAX_CACHED_RESULTS:
+            self.results.popitem(last=False)
+        return result, False
+
+    def validate(self, request: dict):
+        """
+        {"input": path, "sheet": "input", "output": path} -> writes a valid input file
+        """
+        from .core import Validator
+        _sheet = request.get("sheet", "input")
+        _output = Path(request.get("output") or "input/input_valid.csv")
+
+        def _compute():
+            validator = Validator(request["input"], _sheet)
+            validator.process(_output)
+            return {"output": str(_output), "rows": validator.df.shape[0], "signature": file_signature(_output)}
+
+        _key = ("validate", file_signature(request["input"]), _sheet, str(_output))
+        _previous = self.results.get(_key)
+        if _previous is not None and (not _output.exists() or file_signature(_output) != _previous["signature"]):
+            # the output was changed or removed since, so it is written again
+            del self.results[_key]
+        result, cached = self._cached(_key, _compute)
+        return {"output": result["output"], "rows": result["rows"], "cached": cached}
+
+    def get_processor(self, input_valid: Path):
+        """
+        :return: tuple of Processor with its TokenTax rows (df_tt) generated, and bool True if reused
+        """
+        from .core import Processor
+
+        def _compute():
+            processor = Processor(input_valid)
+            processor.process_tokentax()
+            return processor
+
+        return self._cached(("process", file_signature(input_valid)), _compute)
+
+    def process(self, request: dict):
+        """
+        {"input_valid": path, "output": path, "balances_output": path, "return_rows": false}
+        -> TokenTax rows of a valid input file, optionally written to csv files or returned
+        """
+        processor, cached = self.get_processor(request["input_valid"])
+        response = {"rows": processor.df_tt.shape[0], "cached": cached}
+        if request.get("output"):
+            processor.generate_tokentax_summary(Path(request["output"]))
+            response["output"] = request["output"]
+        if request.get("balances_output"):
+            processor.generate_balances_from_tokentax(Path(request["balances_output"]))
+            response["balances_output"] = request["balances_output"]
+        if request.get("return_rows", False):
+            response["tokentax"] = dataframe_to_json(processor.df_tt)
+        return response
+
+    def balances(self, request: dict):
+        """
+        {"input_valid": path} or {"tokentax_file": path} -> balance of every non-dust asset, as exact decimals
+        """
+        from .balances import accumulate_balances, format_balances
+        if "tokentax_file" in request:
+            import csv
+
+            def _compute():
+                with open(request["tokentax_file"], newline="") as f:
+                    return format_balances(accumulate_balances(csv.DictReader(f)))
+
+            balances, cached = self._cached(("balances", file_signature(request["tokentax_file"])), _compute)
+        else:
+            processor, cached = self.get_processor(request["input_valid"])
+            balances = format_balances(accumulate_balances(processor.df_tt.to_dict("records")))
+        return {"balances": balances, "cached": cached}
+
+    def gains(self, request: dict):
+        """
+        {"input": path, "output": path, "return_rows": false} -> FIFO gains report of gains input data
+        """
+        import pandas as pd
+        from .gains import generate_gains_report
+
+        def _compute():
+            return generate_gains_report(pd.read_csv(request["input"], engine='python'))
+
+        report, cached = self._cached(("gains", file_signature(request["input"])), _compute)
+        response = {"rows": report.shape[0], "cached": cached}
+        if request.get("output"):
+            report.to_csv(request["output"])
+            response["output"] = request["output"]
+        if request.get("return_rows", False):
+            response["report"] = dataframe_to_json(report)
+        return response
@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+from collections import defaultdict, deque
+from pathlib import Path
+import pandas as pd
+from metrics import Metrics
+from .balances import accumulate_balances, write_balances
+from .core import Processor, NUM_GAS_TX_ALLOWED, _process_tokentax_chunk_worker
+from .fee_index import build_fee_tx_index, get_fee_txs_by_chain, find_duplicate_fee_txs, get_repeated_fee_tx_refs, \
+    drop_repeated_fee_txs, warn_repeated_fee_txs, write_fee_tx_duplicates
+from .schema import read_ledger
+
+TOKENTAX_AMOUNT_COLUMNS = ["BuyAmount", "SellAmount", "FeeAmount"]
+
+
+class CsvTokenTaxWriter:
+    """
+    Appends TokenTax rows to a csv, flushing after every chunk so completed chunks survive a crash
+    """
+
+    def __init__(self, output_filename: Path, resume_offset: int = None, resume_num_rows: int = 0):
+        """
+        :param output_filename: Path output csv
+        :param resume_offset: int (optional) byte offset of a checkpoint to resume from; later rows are dropped
+        :param resume_num_rows: int rows already written up to resume_offset
+        """
+        self.output_filename = output_filename
+        if resume_offset is None:
+            self.file = open(output_filename, "w", newline="")
+        else:
+            self.file = open(output_filename, "r+", newline="")
+            self.file.truncate(resume_offset)
+            self.file.seek(resume_offset)
+        self.num_rows = resume_num_rows
+        # chunks may produce no rows, so the header is tracked apart from the row count
+        self.header_written = resume_offset is not None and resume_offset > 0
+
+    def tell(self):
+        # byte offset of everything written so far
+        return self.file.tell()
+
+    def write(self, df_tt: pd.DataFrame):
+        df_tt.to_csv(self.file, header=not self.header_written, index=False)
+        self.file.flush()
+        self.header_written = True
+        self.num_rows += df_tt.shape[0]
+
+    def close(self):
+        if not self.header_written:
+            # header only
+            pd.DataFrame(columns=Processor.tokentax_columns).to_csv(self.file, index=False)
+            self.header_written = True
+        self.file.close()
+
+
+class ParquetTokenTaxWriter:
+    """
+    Appends TokenTax rows to a Parquet file, one row group per chunk (requires pyarrow).
+    Amounts are stored as float64 (blank amounts as null), every other column as string.
+    """
+
+    def __init__(self, output_filename: Path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("Parquet output requires pyarrow - pip install pyarrow, or write a .csv") from e
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([(col, pyarrow.float64() if col in TOKENTAX_AMOUNT_COLUMNS else pyarrow.string())
+                                      for col in Processor.tokentax_columns])
+        self.writer = pyarrow.parquet.ParquetWriter(str(output_filename), self.schema)
+        self.num_rows = 0
+
+    def write(self, df_tt: pd.DataFrame):
+        _df = pd.DataFrame(index=df_tt.index)
+        for col in Processor.tokentax_columns:
+            if col in TOKENTAX_AMOUNT_COLUMNS:
+                _df[col] = pd.to_numeric(df_tt[col].where(df_tt[col] != ""), errors="coerce").astype("float64")
+            else:
+                _df[col] = df_tt[col].astype(str)
+        self.writer.write_table(self.pa.Table.from_pandas(_df, schema=self.schema, preserve_index=False))
+        self.num_rows += df_tt.shape[0]
+
+    def close(self):
+        self.writer.close()
+
+
+class TokenTaxCheckpoint:
+    """
+    Progress of a streamed TokenTax run, saved next to its csv output after every chunk:
+    per chunk, a digest of its input rows, the input and output rows done, the output byte offset and
+    the running balances. A resumed run re-reads the input, keeps every leading chunk whose digest is
+    unchanged, and restarts from the first changed (or failed) chunk.
+    """
+
+    def __init__(self, input_valid: Path, output_filename: Path, chunk_size: int):
+        self.path = Path(str(output_filename) + ".checkpoint.json")
+        self.input_valid = str(input_valid)
+        self.output_filename = str(output_filename)
+        self.chunk_size = chunk_size
+        self.chunks = []
+
+    @staticmethod
+    def digest(chunk: pd.DataFrame):
+        return hashlib.sha256(pd.util.hash_pandas_object(chunk, index=False).values.tobytes()).hexdigest()
+
+    def load(self):
+        """
+        Loads a saved checkpoint of the same input and output; its chunk size replaces this one's
+        :return: bool True if a checkpoint was loaded
+        """
+        if not self.path.exists():
+            return False
+        with open(self.path) as f:
+            _saved = json.load(f)
+        if _saved["input"] != self.input_valid or _saved["output"] != self.output_filename:
+            raise ValueError(f"checkpoint {self.path} belongs to input {_saved['input']}, "
+                             f"output {_saved['output']}")
+        self.chunk_size = _saved["chunk_size"]
+        self.chunks = _saved["chunks"]
+        return True
+
+    def find_resume_chunk(self):
+        """
+        Re-reads the input and drops saved chunks from the first one whose input rows changed
+        :return: int number of leading chunks that are kept
+        """
+        num_kept = 0
+        for chunk in read_ledger(self.input_valid, chunksize=self.chunk_size):
+            if num_kept >= len(self.chunks) or self.chunks[num_kept]["digest"] != TokenTaxCheckpoint.digest(chunk):
+                break
+            num_kept += 1
+        self.chunks = self.chunks[:num_kept]
+        return num_kept
+
+    def record(self, digest: str, input_rows: int, writer: CsvTokenTaxWriter, balances: dict):
+        self.chunks.append({"digest": digest, "input_rows": input_rows, "tokentax_rows": writer.num_rows,
+                            "offset": writer.tell(), "balances": dict(balances)})
+        _tmp_file = str(self.path) + ".tmp"
+        with open(_tmp_file, "w") as f:
+            json.dump({"input": self.input_valid, "output": self.output_filename, "chunk_size": self.chunk_size,
+                       "chunks": self.chunks}, f)
+        os.replace(_tmp_file, self.path)
+
+    def remove(self):
+        if self.path.exists():
+            self.path.unlink()
+
+
+def create_tokentax_writer(output_filename: Path):
+    # the output format follows the file extension
+    if Path(output_filename).suffix.lower() == ".parquet":
+        return ParquetTokenTaxWriter(output_filename)
+    return CsvTokenTaxWriter(output_filename)
+
+
+def read_fee_tx_index(input_valid: Path, chunk_size: int):
+    """
+    Indexes the fee tx references of a valid input file, reading only its fee (and income) columns, a chunk at a time
+    :return: pd.DataFrame see fee_index.build_fee_tx_index
+    """
+    fee_columns = [f"{prefix}{i + 1}" for i in range(0, NUM_GAS_TX_ALLOWED) for prefix in ["FeeChain", "FeeTx"]] + \
+        ["BookFeeWith", "IsBusinessIncome1", "IsBusinessIncome2"]
+    # chunks keep counting the index, so lines are those of the whole file
+    return pd.concat([build_fee_tx_index(chunk) for chunk in
+                      pd.read_csv(input_valid, usecols=fee_columns, dtype=str, chunksize=chunk_size)],
+                     ignore_index=True)
+
+
+@Metrics.timed("stream_tokentax")
+def stream_tokentax(input_valid: Path, output_filename: Path, balances_filename: Path = None,
+                    chunk_size: int = 100000, num_workers: int = 1, resume: bool = False,
+                    duplicates_filename: Path = None):
+    """
+    Translates a valid input file into a TokenTax file chunk by chunk, writing rows as they are produced
+    and keeping running balances, so memory stays bounded by chunk_size (plus the fee map) for any input size.
+    Csv output is checkpointed after every chunk (see TokenTaxCheckpoint); the checkpoint is removed on success.
+    :param input_valid: Path valid input file
+    :param output_filename: Path TokenTax output (.csv, or .parquet with pyarrow installed)
+    :param balances_filename: (optional) Path balances output
+    :param chunk_size: int input rows read, translated and written at a time
+    :param num_workers: int worker processes; at most 2 chunks per worker are in flight
+    :param resume: bool restart from the checkpoint of a failed run, reprocessing every chunk from the first
+                   changed one; the checkpoint's chunk size is used
+    :param duplicates_filename: (optional) Path report of fee txs referenced more than once, which are only
+                                booked on their first reference
+    :return: int number of TokenTax rows written
+    """
+    checkpoint = None
+    if Path(output_filename).suffix.lower() != ".parquet":
+        checkpoint = TokenTaxCheckpoint(input_valid, output_filename, chunk_size)
+    elif resume:
+        raise ValueError("resume is only supported for csv output")
+    num_kept_chunks = 0
+    if resume and checkpoint.load():
+        num_kept_chunks = checkpoint.find_resume_chunk()
+        chunk_size = checkpoint.chunk_size
+    elif resume:
+        print(f"[WARN] no checkpoint found for {output_filename}, starting from the first row")
+    # first pass reads only the fee columns, so all fees are still fetched in bulk
+    fee_tx_index = read_fee_tx_index(input_valid, chunk_size)
+    fee_map = Processor.resolve_fee_txs(get_fee_txs_by_chain(fee_tx_index))
+    repeated_refs = get_repeated_fee_tx_refs(fee_tx_index)
+    warn_repeated_fee_txs(fee_tx_index)
+    if duplicates_filename is not None:
+        write_fee_tx_duplicates(find_duplicate_fee_txs(fee_tx_index), duplicates_filename)
+    balances = defaultdict(int)
+    start_row = 0
+    if num_kept_chunks > 0:
+        _last = checkpoint.chunks[-1]
+        start_row = _last["input_rows"]
+        balances.update(_last["balances"])
+        writer = CsvTokenTaxWriter(output_filename, _last["offset"], _last["tokentax_rows"])
+        print(f"[INFO] resuming from input row {start_row} ({writer.num_rows} tokentax rows kept)")
+    else:
+        writer = create_tokentax_writer(output_filename)
+    executor = Processor.create_tokentax_executor(num_workers, fee_map) if num_workers > 1 else None
+
+    def _write(rows: list, chunk: pd.DataFrame):
+        df_tt = pd.DataFrame(rows, columns=Processor.tokentax_columns)
+        accumulate_balances(df_tt.to_dict("records"), balances, writer.num_rows + 2)
+        writer.write(df_tt)
+        if checkpoint is not None:
+            checkpoint.record(TokenTaxCheckpoint.digest(chunk), int(chunk.index[-1]) + 1, writer, balances)
+        print(f"[INFO] {writer.num_rows} tokentax rows written")
+
+    def _chunks():
+        # skipped rows are not counted by the reader, so the index is shifted to keep line numbers right
+        _skiprows = range(1, start_row + 1) if start_row > 0 else None
+        for chunk in read_ledger(input_valid, chunksize=chunk_size, skiprows=_skiprows):
+            chunk.index = chunk.index + start_row
+            yield chunk
+
+    try:
+        if executor is None:
+            for chunk in _chunks():
+                _write(Processor.process_tokentax_chunk(drop_repeated_fee_txs(chunk, repeated_refs), fee_map), chunk)
+        else:
+            pending = deque()
+            for chunk in _chunks():
+                _future = executor.submit(_process_tokentax_chunk_worker, drop_repeated_fee_txs(chunk, repeated_refs))
+                pending.append((_future, chunk))
+                if len(pending) >= 2 * num_workers:
+                    _future, _chunk = pending.popleft()
+                    _write(_future.result(), _chunk)
+            while len(pending) > 0:
+                _future, _chunk = pending.popleft()
+                _write(_future.result(), _chunk)
+    except BaseException:
+        if checkpoint is not None and len(checkpoint.chunks) > 0:
+            print(f"[INFO] progress saved up to input row {checkpoint.chunks[-1]['input_rows']} - "
+                  f"fix the input and rerun with --resume")
+        raise
+    finally:
+        writer.close()
+        if executor is not None:
+            executor.shutdown()
+    if checkpoint is not None:
+        checkpoint.remove()
+    print(f"[INFO] tokentax summary streamed: {output_filename}")
+    if balances_filename is not None:
+        write_balances(balances, balances_filename)
+        print(f"[INFO] balances file generated from tokentax summary: {balances_filename}")
+    return writer.num_rows
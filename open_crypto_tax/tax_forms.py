@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+from metrics import Metrics
+from units import Units
+from .gains import build_assets, add_gas_fee_sales, match_lots
+
+SLICE_COLUMNS = ['Asset', 'Sell ID', 'Type', 'Date Acquired', 'Date Sold', 'Tax Year', 'Term', 'Qty', 'Proceeds',
+                 'Cost Basis', 'Gain']
+FORM_8949_COLUMNS = ['Tax Year', 'Term', 'Description', 'Date Acquired', 'Date Sold', 'Proceeds', 'Cost Basis',
+                     'Gain', 'Asset', 'Qty', 'Sell ID', 'Type']
+SCHEDULE_D_COLUMNS = ['Tax Year', 'Term', 'Asset', 'Lines', 'Proceeds', 'Cost Basis', 'Gain']
+VARIOUS_DATES = "VARIOUS"  # date acquired of a sale of lots bought on different dates, as on form 8949
+ALL_ASSETS = "ALL"
+
+
+@Metrics.timed("tax_forms_slices")
+def build_sale_slices(sells: dict):
+    """
+    Flattens every sell into one row per matched lot, so sales may be grouped in any way, vectorized
+    :param sells: dict of asset -> list of Sell, matched by match_lots
+    :return: pd.DataFrame one row per (sell, lot) pair (SLICE_COLUMNS); proceeds are the sale value net of
+             sale fees, which are prorated over the sell's lots by qty
+    """
+    slices = []
+    for _asset in sells.keys():
+        _ids, _types, _acquired, _sold, _units, _spot_prices, _fees_per_qty, _basis_prices = \
+            [], [], [], [], [], [], [], []
+        for sell in sells[_asset]:
+            for buy, _u in sell.lots:
+                _ids.append(sell.action.id)
+                _types.append(sell.action.tx_type)
+                _acquired.append(buy.date)
+                _sold.append(sell.date)
+                _units.append(_u)
+                _spot_prices.append(sell.action.spot_price)
+                # qty_change of a sell is negative
+                _fees_per_qty.append(sell.action.fees_usd / -sell.action.qty_change)
+                _basis_prices.append(buy.action.basis_price)
+        if len(_ids) == 0:
+            continue
+        _decimals = sells[_asset][0].action.decimals
+        _scale = Units.get_scale(_units, _decimals)
+        _qty = Units.to_float_array(Units.to_array(_units, _scale), _decimals - _scale)
+        slices.append(pd.DataFrame({
+            'Asset': _asset,
+            'Sell ID': _ids,
+            'Type': _types,
+            'Date Acquired': pd.to_datetime(_acquired),
+            'Date Sold': pd.to_datetime(_sold),
+            'Qty': _qty,
+            'Proceeds': (np.array(_spot_prices) - np.array(_fees_per_qty)) * _qty,
+            'Cost Basis': np.array(_basis_prices) * _qty,
+        }))
+    if len(slices) == 0:
+        return pd.DataFrame(columns=SLICE_COLUMNS)
+    slices = pd.concat(slices, ignore_index=True)
+    # held more than 365 days is long term, as in match_lots
+    _is_lt = (slices['Date Acquired'] + pd.Timedelta(days=365)) < slices['Date Sold']
+    slices['Term'] = np.where(_is_lt, 'LT', 'ST')
+    slices['Tax Year'] = slices['Date Sold'].dt.year
+    slices['Gain'] = slices['Proceeds'] - slices['Cost Basis']
+    return slices[SLICE_COLUMNS]
+
+
+def form_8949_lines(slices: pd.DataFrame):
+    """
+    :param slices: pd.DataFrame from build_sale_slices
+    :return: pd.DataFrame one line per sell and term (FORM_8949_COLUMNS), sorted by tax year, term and date
+             sold; the date acquired of a sale of lots bought on different dates is VARIOUS_DATES
+    """
+    lines = slices.groupby(['Sell ID', 'Term'], sort=False).agg(**{
+        'Tax Year': ('Tax Year', 'first'),
+        'Asset': ('Asset', 'first'),
+        'Type': ('Type', 'first'),
+        'Date Sold': ('Date Sold', 'first'),
+        'First Acquired': ('Date Acquired', 'min'),
+        'Last Acquired': ('Date Acquired', 'max'),
+        'Qty': ('Qty', 'sum'),
+        'Proceeds': ('Proceeds', 'sum'),
+        'Cost Basis': ('Cost Basis', 'sum'),
+        'Gain': ('Gain', 'sum'),
+    }).reset_index()
+    # sorted while dates are still datetimes
+    lines = lines.sort_values(by=['Tax Year', 'Term', 'Date Sold', 'Sell ID'], kind='mergesort')
+    lines['Date Acquired'] = lines['First Acquired'].dt.strftime("%m/%d/%Y").where(
+        lines['First Acquired'] == lines['Last Acquired'], VARIOUS_DATES)
+    lines['Date Sold'] = lines['Date Sold'].dt.strftime("%m/%d/%Y")
+    lines['Description'] = lines['Qty'].map(repr) + ' ' + lines['Asset'].astype(str)
+    return lines[FORM_8949_COLUMNS].reset_index(drop=True)
+
+
+def schedule_d_totals(lines: pd.DataFrame):
+    """
+    :param lines: pd.DataFrame from form_8949_lines
+    :return: pd.DataFrame proceeds, basis and gain totals per tax year, term and asset, followed in each
+             tax year and term by a total of all assets (SCHEDULE_D_COLUMNS)
+    """
+    _sums = {'Lines': ('Gain', 'size'), 'Proceeds': ('Proceeds', 'sum'), 'Cost Basis': ('Cost Basis', 'sum'),
+             'Gain': ('Gain', 'sum')}
+    per_asset = lines.groupby(['Tax Year', 'Term', 'Asset'], sort=True).agg(**_sums).reset_index()
+    per_term = lines.groupby(['Tax Year', 'Term'], sort=True).agg(**_sums).reset_index()
+    per_term['Asset'] = ALL_ASSETS
+    # totals rows sort after the assets of their tax year and term
+    totals = pd.concat([per_asset.assign(_order=0), per_term.assign(_order=1)], ignore_index=True)
+    totals = totals.sort_values(by=['Tax Year', 'Term', '_order', 'Asset'], kind='mergesort')
+    return totals[SCHEDULE_D_COLUMNS].reset_index(drop=True)
+
+
+@Metrics.timed("tax_forms")
+def generate_tax_forms(df: pd.DataFrame, years: list = None):
+    """
+    Runs the FIFO gains engine over gains input data and aggregates its sales by tax year and holding period
+    :param df: pd.DataFrame gains input data
+    :param years: list of int (optional) tax years to keep; all years otherwise
+    :return: tuple of pd.DataFrame form 8949 lines and pd.DataFrame schedule D totals
+    """
+    events = build_assets(df)
+    add_gas_fee_sales(events)
+    _, sells = match_lots(events)
+    slices = build_sale_slices(sells)
+    if years:
+        slices = slices.loc[slices['Tax Year'].isin(years)]
+    lines = form_8949_lines(slices)
+    return lines, schedule_d_totals(lines)
@@ -1 +1,2 @@
 from .subgraph_api import SubgraphQuery
+from .overrides import GasPriceOverrides, get_gas_price_overrides, set_gas_price_overrides
@@ -0,0 +1,94 @@
+import csv
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# columns of a gas asset price override table; each row sets the price of a chain's gas asset over a block
+# range (FromBlock to ToBlock, both included), an empty bound is open
+GAS_PRICE_OVERRIDE_COLUMNS = ["Chain", "FromBlock", "ToBlock", "GasAssetPriceUSD"]
+# override table used by price lookups, unless one is set with set_gas_price_overrides
+GAS_PRICE_OVERRIDES_ENV_VAR = "GAS_PRICE_OVERRIDES_FILE"
+
+
+class GasPriceOverride:
+
+    def __init__(self, chain: str, price_usd: float, from_block: int = None, to_block: int = None):
+        self.chain = chain
+        self.price_usd = price_usd
+        self.from_block = from_block
+        self.to_block = to_block
+
+    @property
+    def has_blocks(self):
+        return self.from_block is not None or self.to_block is not None
+
+    def covers_block(self, block_number: int):
+        return self.has_blocks and (self.from_block is None or self.from_block <= block_number) and \
+            (self.to_block is None or block_number <= self.to_block)
+
+
+class GasPriceOverrides:
+    """
+    Table of user supplied gas asset prices, e.g. to fill gaps of a subgraph, looked up before any price request.
+    The first row of a chain covering a block sets its price.
+    """
+
+    def __init__(self, overrides: list = None):
+        """
+        :param overrides: list of GasPriceOverride
+        """
+        self.overrides = overrides or []
+
+    def __len__(self):
+        return len(self.overrides)
+
+    @staticmethod
+    def read(overrides_file):
+        """
+        :param overrides_file: Path csv with GAS_PRICE_OVERRIDE_COLUMNS
+        :return: GasPriceOverrides
+        """
+        overrides = []
+        with open(overrides_file, newline="") as f:
+            for line, row in enumerate(csv.DictReader(f), start=2):
+                _values = {col: (row.get(col) or "").strip() for col in GAS_PRICE_OVERRIDE_COLUMNS}
+                if not _values["Chain"] or not _values["GasAssetPriceUSD"]:
+                    raise ValueError(f"[ERROR] Chain and GasAssetPriceUSD required on line {line} of {overrides_file}")
+                _override = GasPriceOverride(
+                    _values["Chain"], float(_values["GasAssetPriceUSD"]),
+                    int(_values["FromBlock"]) if _values["FromBlock"] else None,
+                    int(_values["ToBlock"]) if _values["ToBlock"] else None)
+                if not _override.has_blocks:
+                    raise ValueError(f"[ERROR] block range required on line {line} of {overrides_file}")
+                overrides.append(_override)
+        return GasPriceOverrides(overrides)
+
+    def get_price_at_block(self, chain: str, block_number: int):
+        """
+        :return: float gas asset price in USD, or None if no row of chain covers block_number
+        """
+        for _override in self.overrides:
+            if _override.chain == chain and _override.covers_block(block_number):
+                return _override.price_usd
+        return None
+
+
+_gas_price_overrides = None
+
+
+def get_gas_price_overrides():
+    """
+    :return: GasPriceOverrides set by set_gas_price_overrides, else read from the file named by
+             GAS_PRICE_OVERRIDES_ENV_VAR (empty if not set)
+    """
+    global _gas_price_overrides
+    if _gas_price_overrides is None:
+        _file = os.environ.get(GAS_PRICE_OVERRIDES_ENV_VAR)
+        _gas_price_overrides = GasPriceOverrides.read(_file) if _file else GasPriceOverrides()
+    return _gas_price_overrides
+
+
+def set_gas_price_overrides(overrides: GasPriceOverrides):
+    global _gas_price_overrides
+    _gas_price_overrides = overrides
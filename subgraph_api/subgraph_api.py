@@ -1,44 +1,22 @@
-import requests
-import json
 import os
+import time
 from dotenv import load_dotenv
-from gql import gql, Client
-from gql.transport.aiohttp import AIOHTTPTransport
+from metrics import Metrics
+from cache_store import price_db
+from chain_registry import PriceSource, get_chain
+from .overrides import get_gas_price_overrides
 
 # take environment variables from .env
 load_dotenv()
 
-# transports
-transports = dict()
-transports["ETH"] = AIOHTTPTransport(
-    url=os.environ.get("UNISWAP_SUBGRAPH_HTTP_ENDPOINT"))
-transports["BSC"] = AIOHTTPTransport(
-    url=os.environ.get("PANCAKESWAP_V2_SUBGRAPH_HTTP_ENDPOINT"))
-# prior to block 6810708 (04/23/2021), Pancakeswap V2 LP didn't exist
-transports["BSC_V1"] = AIOHTTPTransport(
-    url=os.environ.get("PANCAKESWAP_V1_SUBGRAPH_HTTP_ENDPOINT"))
-# clients
+# schema fetching may be disabled for endpoints that don't support introspection (e.g. mock servers)
+SUBGRAPH_FETCH_SCHEMA = os.environ.get("SUBGRAPH_FETCH_SCHEMA", "true").lower() != "false"
+# clients and parsed queries are created on first use, so importing this module stays cheap
 clients = dict()
-for chain in ["ETH", "BSC", "BSC_V1"]:
-    clients[chain] = Client(transport=transports[chain], fetch_schema_from_transport=True)
+_parsed_queries = dict()
 
-eth_price_query = gql(
-    '''
-    query GetPair($block_number: Int!) {
-        pair(
-            id: "0xb4e16d0168e52d35cacd2c6185b44281ec28c9dc"
-            block: {
-              number: $block_number
-            }
-        ) {
-            token0Price
-        }
-    }
-    '''
-)
-
-bnb_price_query = gql(
-    '''
+# price of a gas asset in a pair at a block, field is the pair's token0Price or token1Price
+pair_price_query = '''
     query GetPair($id: ID!, $block_number: Int!) {
         pair(
             id: $id
@@ -46,11 +24,49 @@ bnb_price_query = gql(
               number: $block_number
             }
         ) {
-            token1Price
+            %s
         }
     }
-    '''
-)
+'''
+
+
+def get_client(source: PriceSource):
+    """
+    :param source: PriceSource of a registered chain
+    :return: gql Client of the source's subgraph endpoint, one per source name
+    """
+    if source.name not in clients:
+        from gql import Client
+        from gql.transport.aiohttp import AIOHTTPTransport
+        _transport = AIOHTTPTransport(url=os.environ.get(source.endpoint_env_var))
+        clients[source.name] = Client(transport=_transport, fetch_schema_from_transport=SUBGRAPH_FETCH_SCHEMA)
+    return clients[source.name]
+
+
+def get_query(query: str):
+    """
+    :param query: str GraphQL query
+    :return: query parsed by gql (parsed once per process)
+    """
+    if query not in _parsed_queries:
+        from gql import gql
+        _parsed_queries[query] = gql(query)
+    return _parsed_queries[query]
+
+
+def execute(source: PriceSource, query: str, params: dict, name: str):
+    """
+    Executes a subgraph query, recording its latency
+    :param source: PriceSource whose subgraph is queried
+    :param name: str query name reported in run metrics
+    """
+    _start = time.perf_counter()
+    response = None
+    try:
+        response = get_client(source).execute(get_query(query), variable_values=params)
+        return response
+    finally:
+        Metrics.record_call("graphql", source.name, name, time.perf_counter() - _start, error=response is None)
 
 
 class SubgraphQuery:
@@ -58,38 +74,63 @@ class SubgraphQuery:
     def __init__(self):
         print('hi from subgraph_api')
 
+    @staticmethod
+    def get_gas_asset_price_at_block(chain: str, block_number: int):
+        """
+        This returns the price of a chain's gas asset at a given block number, from the gas price override
+        table if it covers the block (no request is made), otherwise from the chain's subgraph (caches)
+        :param chain: str registered chain (e.g. ETH, BSC)
+        :param block_number: int block number of chain
+        :return: float price of the gas asset in USD
+        """
+        _override = get_gas_price_overrides().get_price_at_block(chain, block_number)
+        if _override is not None:
+            Metrics.cache_hit("price_override")
+            return _override
+        return float(SubgraphQuery.get_subgraph_price_at_block(chain, block_number))
+
+    @staticmethod
+    def get_subgraph_price_at_block(chain: str, block_number: int):
+        """
+        This returns the price of a chain's gas asset at a given block number from the subgraph pair of the
+        chain's price source covering the block (caches)
+        :param chain: str registered chain (e.g. ETH, BSC)
+        :param block_number: int block number of chain
+        :return: price of the gas asset in USD, as returned by the subgraph
+        """
+        cache_key = chain + "_price_" + str(block_number)
+        _cached_val = price_db.get(cache_key)
+        if not _cached_val == False:
+            Metrics.cache_hit("price")
+            return _cached_val
+        Metrics.cache_miss("price")
+        _chain = get_chain(chain)
+        _source = _chain.get_price_source(block_number)
+        params = {"id": _source.pair, "block_number": block_number}
+        response = execute(_source, pair_price_query % _source.price_field, params, _chain.gas_asset.lower() + "_price")
+        if response["pair"] is None:
+            raise ValueError(f"Subgraph {_source.name} did not find an asset value at {chain} block number {block_number}")
+        price_db.set(cache_key, response["pair"][_source.price_field])
+        price_db.dump()
+        return response["pair"][_source.price_field]
+
     @staticmethod
     def get_eth_price_at_block(block_number: int):
         """
         This returns the eth price based on uniswap subgraph
-        at a given block number
+        at a given block number (caches)
         :param block_number: int Block number to get uniswap eth price
         :return: eth_price_usd: double Price of eth in USD (usdt)
         """
-        params = {"block_number": block_number}
-        response = clients["ETH"].execute(eth_price_query, variable_values=params)
-        return response["pair"]["token0Price"]
+        return SubgraphQuery.get_subgraph_price_at_block("ETH", block_number)
 
     @staticmethod
     def get_bnb_price_at_bsc_block(block_number: int):
         """
         This returns the bnb price based on pancake swap subgraph
-        at a given block number.
-        Uses
+        at a given block number (caches).
+        Uses the pancakeswap v1 pair before the v2 pair existed (block 6810708), see ref/chains.json
         :param block_number: int BSC block number to get pancake swap BNB price
         :return: bnb_price_usd: double Price of bnb in USD (busd)
         """
-        # pancakeswapv2 pair deployed block 6810708
-        if block_number >= 6810708:
-            _client = clients["BSC"]
-            _pair_id = "0x58f876857a02d6762e0101bb5c46a8c1ed44dc16"
-        else:
-            _client = clients["BSC_V1"]
-            _pair_id = "0x1b96b92314c44b159149f7e0303511fb2fc4774f"
-        params = {"id": _pair_id, "block_number": block_number}
-        print(params)
-        response = _client.execute(bnb_price_query, variable_values=params)
-        print(response)
-        if response["pair"] is None:
-            raise ValueError(f"Subgraph did not find an asset value at BSC block number {block_number}")
-        return response["pair"]["token1Price"]
+        return SubgraphQuery.get_subgraph_price_at_block("BSC", block_number)
@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+from open_crypto_tax.core import Validator
+
+
+def write_ledger(path, num_rows: int = 40, extra_rows: dict = None):
+    """
+    Writes a valid input file cycling through a buy, a sell, a gas-only row and a swap; every fee tx is unique
+    :param extra_rows: dict (optional) rows replacing the generated one at their row index
+    :return: (path, fee_map) fee map covering every fee tx of the file, keyed as by Processor.resolve_fee_txs
+    """
+    rows, fee_map = [], dict()
+    for i in range(0, num_rows):
+        _date = "01/%02d/2021 10:%02d:00 AM" % (i % 28 + 1, i % 60)
+        _fee_tx = "0x%064x" % (i + 1)
+        _kind = i % 4
+        if _kind == 0:
+            row = {"Date": _date, "BuyAsset": "ETH", "BuyQty": 1.0, "BuySpotPriceUSD": 100.0, "BuyTotalUSD": 100.0,
+                   "BookFeeWith": "buy", "AuxUSDFee": 1.0}
+        elif _kind == 1:
+            row = {"Date": _date, "SellAsset": "ETH", "SellQty": 0.5, "SellSpotPriceUSD": 120.0,
+                   "SellTotalUSD": 60.0, "BookFeeWith": "sell", "FeeChain1": "ETH", "FeeTx1": _fee_tx}
+        elif _kind == 2:
+            row = {"Date": _date, "BookFeeWith": "gas", "FeeChain1": "ETH", "FeeTx1": _fee_tx}
+        else:
+            row = {"Date": _date, "SellAsset": "ETH", "SellQty": 0.1, "SellSpotPriceUSD": 100.0,
+                   "SellTotalUSD": 10.0, "BuyAsset": "UNI", "BuyQty": 2.0, "BuySpotPriceUSD": 5.0,
+                   "BuyTotalUSD": 10.0, "BookFeeWith": "buy", "FeeChain1": "ETH", "FeeTx1": _fee_tx}
+        if "FeeTx1" in row:
+            fee_map[("ETH", _fee_tx)] = 0.001 * (i + 1)
+        rows.append((extra_rows or {}).get(i, row))
+    pd.DataFrame(rows, columns=Validator.input_columns).to_csv(path, index=False)
+    return path, fee_map
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return write_ledger(tmp_path / "input_valid.csv")
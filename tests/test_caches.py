@@ -0,0 +1,38 @@
+import pytest
+from cache_store import LazyPickleDB
+from web3_api import caches
+from web3_api.caches import fee_cache_key, parse_fee_cache_key, prune_fee_cache
+
+TX_HASH = "0x" + "ab" * 32
+
+
+@pytest.fixture
+def fee_db(tmp_path, monkeypatch):
+    _db = LazyPickleDB(str(tmp_path / "_txfee_cache.db"))
+    monkeypatch.setattr(caches, "db", _db)
+    return _db
+
+
+@pytest.mark.parametrize("key, parsed", [
+    (fee_cache_key("ETH", TX_HASH, False), ("ETH", TX_HASH, False)),
+    (fee_cache_key("BSC", TX_HASH, True), ("BSC", TX_HASH, True)),
+    # hashes are not assumed to be 32 bytes long, nor chains to be 3 characters
+    (fee_cache_key("ETH", "0xabc", False), ("ETH", "0xabc", False)),
+    (fee_cache_key("POLYGON", "0x" + "cd" * 40, False), ("POLYGON", "0x" + "cd" * 40, False)),
+    (fee_cache_key("", TX_HASH, False), None),
+    (fee_cache_key("ETH", "0x", False), None),
+    (fee_cache_key("ETH", "0xnothex", False), None),
+    ("ETH" + TX_HASH, None),
+])
+def test_parse_fee_cache_key(key, parsed):
+    assert parse_fee_cache_key(key) == parsed
+
+
+def test_prune_keeps_ledger_fee_txs_whatever_their_case(tmp_path, fee_db):
+    _other = "0x" + "cd" * 32
+    fee_db.set(fee_cache_key("ETH", TX_HASH, False), 0.01)
+    fee_db.set(fee_cache_key("ETH", _other, False), 0.02)
+    (tmp_path / "ledger.csv").write_text(f"Date,FeeChain1,FeeTx1\n01/01/2021 12:00:00 AM,ETH, {TX_HASH.upper()} \n")
+    assert prune_fee_cache(keep_ledger=tmp_path / "ledger.csv") == 1
+    assert fee_db.get(fee_cache_key("ETH", TX_HASH, False)) == 0.01
+    assert fee_db.get(fee_cache_key("ETH", _other, False)) is False
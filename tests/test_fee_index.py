@@ -0,0 +1,43 @@
+import pandas as pd
+from open_crypto_tax.core import Processor, Validator
+from open_crypto_tax.streaming import stream_tokentax
+
+# fee qty of each fee tx, keyed as by Processor.resolve_fee_txs
+FEE_MAP = {("ETH", "0xaa"): 0.01, ("ETH", "0xbb"): 0.02}
+
+
+def write_gas_ledger(path):
+    """
+    Writes a valid input file of three gas-only rows; the second (line 3) only repeats the fee tx of the first
+    """
+    rows = [{"Date": "01/0%d/2021 12:00:00 AM" % (i + 1), "BookFeeWith": "gas", "FeeChain1": "ETH", "FeeTx1": fee_tx}
+            for i, fee_tx in enumerate(["0xaa", "0xAA", "0xbb"])]
+    pd.DataFrame(rows, columns=Validator.input_columns).to_csv(path, index=False)
+    return path
+
+
+def check_gas_spends(df_tt: pd.DataFrame):
+    # the repeat is neither booked again nor written as a spend without amount
+    assert df_tt["Type"].tolist() == ["Spend", "Spend"]
+    assert df_tt["SellAmount"].astype(float).tolist() == [0.01, 0.02]
+    assert df_tt["SellCurrency"].tolist() == ["ETH", "ETH"]
+
+
+def test_gas_row_repeating_a_fee_tx_is_skipped(tmp_path):
+    processor = Processor(write_gas_ledger(tmp_path / "input_valid.csv"))
+    processor.process_tokentax(fee_map=FEE_MAP)
+    check_gas_spends(processor.df_tt)
+    duplicates = processor.find_duplicate_fee_txs()
+    assert duplicates["Line"].tolist() == [2, 3]
+    assert duplicates["Booked"].tolist() == [True, False]
+    assert duplicates["LineSkipped"].tolist() == [False, True]
+
+
+def test_streamed_gas_row_repeating_a_fee_tx_is_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(Processor, "resolve_fee_txs", staticmethod(lambda chain_to_fee_txs: FEE_MAP))
+    output = tmp_path / "summary_tokentax.csv"
+    stream_tokentax(write_gas_ledger(tmp_path / "input_valid.csv"), output, chunk_size=1,
+                    duplicates_filename=tmp_path / "fee_tx_duplicates.csv")
+    check_gas_spends(pd.read_csv(output))
+    duplicates = pd.read_csv(tmp_path / "fee_tx_duplicates.csv")
+    assert duplicates.loc[duplicates["LineSkipped"], "Line"].tolist() == [3]
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+from open_crypto_tax.gains import build_assets, match_fifo, match_lots
+from units import Units
+
+GAINS_INPUT_COLUMNS = ["Date", "Asset", "Type", "Qty Change", "Spot Price USD", "TxnFeeAsset", "TxnFee(ASSET)",
+                       "TxnFee(USD)", "Tx Receipts", "Purchased From", "Other"]
+
+
+def gains_input(rows: list):
+    """
+    :param rows: list of (date, asset, type, qty change, spot price) without fees
+    """
+    return pd.DataFrame([list(row) + ["", 0.0, 0.0, "", "", ""] for row in rows], columns=GAINS_INPUT_COLUMNS)
+
+
+def as_lists(buy_index, sell_index, units, num_covered):
+    return buy_index.tolist(), sell_index.tolist(), [int(u) for u in units], num_covered
+
+
+def test_match_fifo_splits_lots():
+    # sell 1 consumes part of buy 0, sell 2 the rest of it and part of buy 1, sell 3 the rest
+    buys, sells = np.array([5, 3, 4]), np.array([2, 4, 5])
+    assert as_lists(*match_fifo(buys, sells)) == ([0, 0, 1, 1, 2], [0, 1, 1, 2, 2], [2, 3, 1, 2, 3], 3)
+
+
+def test_match_fifo_skips_zero_qty_lots():
+    buys, sells = np.array([0, 5, 0, 3]), np.array([0, 4, 4])
+    assert as_lists(*match_fifo(buys, sells)) == ([1, 1, 3], [1, 2, 2], [4, 1, 3], 3)
+
+
+def test_match_fifo_counts_covered_sells():
+    buys, sells = np.array([5]), np.array([3, 3])
+    assert as_lists(*match_fifo(buys, sells)) == ([0], [0], [3], 1)
+    assert match_fifo(np.array([], dtype=np.int64), sells)[3] == 0
+
+
+def test_match_fifo_falls_back_to_python_ints():
+    # total buys overflow int64, so they are an object array, matched against int64 sells as Python ints
+    buy_units = Units.to_array([2 ** 62, 2 ** 62])
+    sell_units = Units.to_array([2 ** 62 + 1])
+    assert buy_units.dtype == object and sell_units.dtype == np.int64
+    assert as_lists(*match_fifo(buy_units, sell_units)) == ([0, 1], [0, 0], [2 ** 62, 1], 1)
+
+
+def test_get_scale():
+    assert Units.get_scale([10 ** 18, 5 * 10 ** 17, 0], 18) == 17
+    assert Units.get_scale([10 ** 20], 18) == 18
+    assert Units.get_scale([123, 10 ** 18]) == 0
+    assert Units.get_scale([0, 0]) == 0
+    # 100 tokens at 18 decimals overflow int64, rescaled they do not
+    units = [Units.to_base_units(qty) for qty in [40.5, 60.25]]
+    assert Units.to_array(units).dtype == object
+    _scale = Units.get_scale(units)
+    assert _scale == 16 and Units.to_array(units, _scale).tolist() == [4050, 6025]
+
+
+def test_match_lots():
+    events = build_assets(gains_input([
+        ("01/01/2020 12:00:00 AM", "ETH", "Buy", 50.5, 100.0),
+        ("06/01/2021 12:00:00 AM", "ETH", "Buy", 30.25, 200.0),
+        ("07/01/2021 12:00:00 AM", "ETH", "Sell", -60.5, 300.0),
+        ("07/02/2021 12:00:00 AM", "ETH", "Sell", -20.0, 300.0),
+    ]))
+    buys, sells = match_lots(events)
+    _buys, _sells = buys["ETH"], sells["ETH"]
+    # the first sell takes all of the long term lot and part of the short term one, in exact base units
+    assert [(buy.action.id, units) for buy, units in _sells[0].lots] == [(0.0, 505 * 10 ** 17), (1.0, 10 ** 19)]
+    assert (_sells[0].basis_total_qty_lt, _sells[0].basis_total_qty_st) == (50.5, 10.0)
+    assert (_sells[0].basis_total_cost_lt, _sells[0].basis_total_cost_st) == (5050.0, 2000.0)
+    assert _sells[1].buy_ids_st == [1.0]
+    assert [buy.basis_remaining_units for buy in _buys] == [0, 25 * 10 ** 16]
+    assert _buys[1].basis_remaining == 0.25
+
+
+def test_match_lots_rejects_uncovered_sell():
+    events = build_assets(gains_input([
+        ("01/01/2021 12:00:00 AM", "ETH", "Buy", 1.0, 100.0),
+        ("01/02/2021 12:00:00 AM", "ETH", "Sell", -0.5, 100.0),
+        ("01/03/2021 12:00:00 AM", "ETH", "Sell", -0.75, 100.0),
+    ]))
+    with pytest.raises(ValueError, match="Sell ID 2.0 could not find enough buys"):
+        match_lots(events)
@@ -0,0 +1,74 @@
+import pytest
+
+# web3 and eth_abi fail to import on some python versions (parsimonious on 3.11), the provider and mock server need them
+providers = pytest.importorskip("web3_api.providers", exc_type=ImportError)
+MockServer = pytest.importorskip("mock_server", exc_type=ImportError).MockServer
+FailoverHTTPProvider = providers.FailoverHTTPProvider
+
+
+@pytest.fixture
+def servers():
+    # a failing primary endpoint and a healthy backup, in this order
+    _servers = [MockServer(error_rate=1.0).start(), MockServer().start()]
+    yield _servers
+    for server in _servers:
+        server.stop()
+
+
+def make_provider(servers):
+    return FailoverHTTPProvider([server.url("rpc", "ETH") for server in servers], "ETH", timeout=5)
+
+
+def get_stats(provider):
+    return [(e["requests"], e["errors"]) for e in provider.get_stats()]
+
+
+def test_failover_on_http_error(servers):
+    provider = make_provider(servers)
+    assert provider.make_request("eth_chainId", [])["result"] == "0x1"
+    assert get_stats(provider) == [(1, 1), (1, 0)]
+    assert servers[0].get_stats()["counts"] == {"ETH:http_500": 1}
+
+
+@pytest.mark.parametrize("error_code", providers.FAILOVER_RPC_ERROR_CODES)
+def test_failover_on_rpc_error(servers, error_code):
+    servers[0].error_code = error_code
+    provider = make_provider(servers)
+    assert provider.make_batch_request([{"jsonrpc": "2.0", "id": 0, "method": "eth_chainId", "params": []}]) == \
+        [{"jsonrpc": "2.0", "id": 0, "result": "0x1"}]
+    assert get_stats(provider) == [(1, 1), (1, 0)]
+
+
+def test_request_errors_are_not_failed_over(servers):
+    # an unknown method is an error of the request, every endpoint would answer it the same
+    servers[0].error_rate = 0.0
+    provider = make_provider(servers)
+    assert "error" in provider.make_request("eth_unknownMethod", [])
+    assert get_stats(provider) == [(1, 0), (0, 0)]
+
+
+def test_last_rpc_error_is_returned_if_every_endpoint_fails(servers):
+    for server in servers:
+        server.error_rate = 1.0
+        server.error_code = -32005
+    response = make_provider(servers).make_request("eth_chainId", [])
+    assert response["error"]["code"] == -32005
+
+
+def test_cooldown_and_recovery(servers, monkeypatch):
+    provider = make_provider(servers)
+    provider.make_request("eth_chainId", [])
+    # the failed endpoint ranks last while cooling down, so it is not retried
+    assert provider.endpoint_uri == servers[1].url("rpc", "ETH")
+    provider.make_request("eth_chainId", [])
+    assert get_stats(provider) == [(1, 1), (2, 0)]
+    # once recovered and past its cooldown, it is used again and its consecutive errors are reset
+    servers[0].error_rate = 0.0
+    _now = providers.time.monotonic()
+    monkeypatch.setattr(providers.time, "monotonic", lambda: _now + providers.ENDPOINT_COOLDOWN + 1)
+    provider.endpoints[1].latency_ewma = 1.0
+    assert provider.endpoint_uri == servers[0].url("rpc", "ETH")
+    provider.make_request("eth_chainId", [])
+    assert get_stats(provider) == [(2, 1), (2, 0)]
+    assert provider.endpoints[0].consecutive_errors == 0
+    assert provider.endpoints[0].cooldown_until == 0.0
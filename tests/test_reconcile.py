@@ -0,0 +1,60 @@
+import sys
+import types
+import pytest
+from open_crypto_tax.reconcile import RECONCILE_COLUMNS, reconcile_balances, write_reconciliation
+
+WALLETS = ["0x1111", "0x2222"]
+USDC = "0xa0b8"
+UNI = "0x1f98"
+# raw on-chain balances of each wallet, in base units; None for a failed call
+RAW_BALANCES = {
+    ("0x1111", None): 10 ** 18, ("0x2222", None): 5 * 10 ** 17,
+    ("0x1111", USDC): 100 * 10 ** 6, ("0x2222", USDC): 23 * 10 ** 6 + 450000,
+    ("0x1111", UNI): 7 * 10 ** 18, ("0x2222", UNI): None,
+}
+
+
+@pytest.fixture(autouse=True)
+def web3_api(monkeypatch):
+    # reconcile only imports web3_api once balances are looked up; it is replaced by the cached lookups it uses
+    class Web3Query:
+        @staticmethod
+        def get_tokens_symbol_and_decimals(addrs, chain):
+            return {addr: ({USDC: "USDC", UNI: "UNI"}[addr], {USDC: 6, UNI: 18}[addr]) for addr in addrs}
+
+        @staticmethod
+        def get_balances_at_block(wallets, token_addrs, chain, block_number):
+            assert block_number == 15000000
+            return {(wallet, addr): RAW_BALANCES[(wallet, addr)] for wallet in wallets for addr in [None] + token_addrs}
+
+    module = types.ModuleType("web3_api")
+    module.Web3Query = Web3Query
+    caches = types.ModuleType("web3_api.caches")
+    caches.get_cached_token_addresses = lambda chain: {"UNI": UNI}
+    monkeypatch.setitem(sys.modules, "web3_api", module)
+    monkeypatch.setitem(sys.modules, "web3_api.caches", caches)
+
+
+def test_reconcile_balances(tmp_path):
+    (tmp_path / "balances.csv").write_text("ETH, 1.5\nUSDC, 123.4\nUNI, 7\nSUSHI, 3\n")
+    # tokens_file adds to the token cache
+    (tmp_path / "tokens.csv").write_text(f"symbol,chain,address\nUSDC,ETH,{USDC}\nUSDC,BSC,0x8ac7\n")
+    rows = reconcile_balances(tmp_path / "balances.csv", WALLETS, "ETH", 15000000, tmp_path / "tokens.csv")
+    assert rows == [
+        ["ETH", "", "1.5", "1.5", "0", "ok"],
+        ["USDC", USDC, "123.4", "123.45", "0.05", "mismatch"],
+        ["UNI", UNI, "7", "", "", "call_failed"],
+        ["SUSHI", "", "3", "", "", "unresolved"],
+    ]
+    write_reconciliation(rows, tmp_path / "reconciliation.csv")
+    lines = (tmp_path / "reconciliation.csv").read_text().splitlines()
+    assert lines[0] == ",".join(RECONCILE_COLUMNS)
+    assert lines[2] == f"USDC,{USDC},123.4,123.45,0.05,mismatch"
+
+
+def test_reconcile_tolerance(tmp_path):
+    (tmp_path / "balances.csv").write_text("ETH, 1.4999999999\n")
+    rows = reconcile_balances(tmp_path / "balances.csv", WALLETS, "ETH", 15000000)
+    assert rows == [["ETH", "", "1.4999999999", "1.5", "0.0000000001", "ok"]]
+    rows = reconcile_balances(tmp_path / "balances.csv", WALLETS, "ETH", 15000000, tolerance=0)
+    assert rows[0][-1] == "mismatch"
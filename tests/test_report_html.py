@@ -0,0 +1,20 @@
+from test_gains import gains_input
+from open_crypto_tax.gains import generate_gains_report
+from open_crypto_tax.report_html import write_html_report
+
+
+def test_pages_of_assets_with_similar_names_are_kept_apart(tmp_path):
+    report = generate_gains_report(gains_input([
+        ("01/01/2021 12:00:00 AM", "USDC.e", "Buy", 10.0, 1.0),
+        ("01/02/2021 12:00:00 AM", "USDC_e", "Buy", 20.0, 1.0),
+        ("01/03/2021 12:00:00 AM", "usdc_e", "Buy", 30.0, 1.0),
+    ]))
+    write_html_report(report, tmp_path)
+    pages = sorted(path for path in tmp_path.iterdir() if path.name != "index.html")
+    assert len(pages) == 3
+    assert len(set(page.name.lower() for page in pages)) == 3
+    # each asset has a page of its own
+    titles = sorted(page.read_text().split("<h1>")[1].split(" - ")[0] for page in pages)
+    assert titles == ["USDC.e 2021", "USDC_e 2021", "usdc_e 2021"]
+    index = (tmp_path / "index.html").read_text()
+    assert all(f'href="{page.name}"' in index for page in pages)
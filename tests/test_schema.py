@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+from conftest import write_ledger
+from open_crypto_tax.core import Processor
+from open_crypto_tax.schema import read_ledger
+
+DATES = {0: "2021-01-01 10:00:00", 1: "1/2/2021 10:01 AM"}
+INCOME = {"Date": "01/03/2021 10:02:00 AM", "BuyAsset": "UNI", "BuyQty": 3.0, "BuyTotalUSD": 15.0}
+
+
+def test_dates_are_passed_through_as_written(tmp_path):
+    input_valid, fee_map = write_ledger(tmp_path / "input_valid.csv", num_rows=8)
+    df = pd.read_csv(input_valid, dtype=str)
+    for index, date in DATES.items():
+        df.loc[index, "Date"] = date
+    df.to_csv(input_valid, index=False)
+    processor = Processor(input_valid)
+    processor.process_tokentax(fee_map=fee_map)
+    assert processor.df_tt["Date"].tolist()[:2] == list(DATES.values())
+
+
+def test_flags_are_validated_per_row(tmp_path):
+    input_valid, fee_map = write_ledger(tmp_path / "input_valid.csv", num_rows=8, extra_rows={
+        2: dict(INCOME, IsOrdinaryIncome=1.0), 5: dict(INCOME, IsOrdinaryIncome="yes")})
+    # a bad flag does not fail the read, only its row
+    assert read_ledger(input_valid)["IsOrdinaryIncome"].tolist()[2] == "1.0"
+    with pytest.raises(ValueError, match="Unexpected ordinary income value for line 7"):
+        Processor(input_valid).process_tokentax(fee_map=fee_map)
+    input_valid, fee_map = write_ledger(tmp_path / "input_valid.csv", num_rows=8,
+                                        extra_rows={2: dict(INCOME, IsOrdinaryIncome=1.0)})
+    processor = Processor(input_valid)
+    processor.process_tokentax(fee_map=fee_map)
+    assert processor.df_tt.loc[processor.df_tt["Type"] == "Income", "BuyAmount"].tolist() == [3.0]
@@ -0,0 +1,61 @@
+import pytest
+from pathlib import Path
+from conftest import write_ledger
+from open_crypto_tax.core import Processor
+from open_crypto_tax.streaming import stream_tokentax
+
+# row index 22 (line 24) is in the 5th chunk of 5 rows
+BAD_ROW = {22: {"Date": "01/23/2021 10:22:00 AM", "BuyAsset": "ETH", "BuyQty": 1.0, "BuyTotalUSD": 100.0,
+                "IsOrdinaryIncome": 2.0}}
+
+
+@pytest.fixture
+def fee_map(monkeypatch, ledger):
+    _, _fee_map = ledger
+    monkeypatch.setattr(Processor, "resolve_fee_txs", staticmethod(lambda chain_to_fee_txs: _fee_map))
+    return _fee_map
+
+
+def stream_clean(tmp_path):
+    (tmp_path / "clean").mkdir()
+    input_valid, _ = write_ledger(tmp_path / "clean" / "input_valid.csv")
+    output = tmp_path / "clean" / "summary_tokentax.csv"
+    stream_tokentax(input_valid, output, tmp_path / "clean" / "balances.csv", chunk_size=5)
+    return output
+
+
+def test_resume_after_failed_chunk(tmp_path, capsys, fee_map):
+    input_valid = tmp_path / "input_valid.csv"
+    output = tmp_path / "summary_tokentax.csv"
+    checkpoint = Path(str(output) + ".checkpoint.json")
+    write_ledger(input_valid, extra_rows=BAD_ROW)
+    with pytest.raises(ValueError, match="line 24"):
+        stream_tokentax(input_valid, output, tmp_path / "balances.csv", chunk_size=5)
+    assert checkpoint.exists()
+    # fixing the bad row only changes its chunk, the 4 chunks before it are kept
+    write_ledger(input_valid)
+    capsys.readouterr()
+    stream_tokentax(input_valid, output, tmp_path / "balances.csv", chunk_size=5, resume=True)
+    assert "resuming from input row 20" in capsys.readouterr().out
+    assert not checkpoint.exists()
+    clean_output = stream_clean(tmp_path)
+    assert output.read_bytes() == clean_output.read_bytes()
+    assert (tmp_path / "balances.csv").read_bytes() == (tmp_path / "clean" / "balances.csv").read_bytes()
+
+
+def test_resume_restarts_from_first_changed_chunk(tmp_path, capsys, fee_map):
+    input_valid = tmp_path / "input_valid.csv"
+    output = tmp_path / "summary_tokentax.csv"
+    write_ledger(input_valid, extra_rows=BAD_ROW)
+    with pytest.raises(ValueError):
+        stream_tokentax(input_valid, output, chunk_size=5)
+    # a change in the 2nd chunk invalidates every saved chunk from it on, even if the run failed later
+    write_ledger(input_valid, extra_rows={7: {"Date": "01/08/2021 10:07:00 AM", "BuyAsset": "ETH", "BuyQty": 2.0,
+                                              "BuySpotPriceUSD": 100.0, "BuyTotalUSD": 200.0, "BookFeeWith": "buy",
+                                              "AuxUSDFee": 1.0}})
+    capsys.readouterr()
+    stream_tokentax(input_valid, output, chunk_size=5, resume=True)
+    assert "resuming from input row 5" in capsys.readouterr().out
+    processor = Processor(input_valid)
+    processor.process_tokentax(fee_map=fee_map)
+    assert output.read_text() == processor.df_tt.to_csv(index=False)
@@ -0,0 +1,19 @@
+import pytest
+from open_crypto_tax.gains import build_assets, match_lots
+from open_crypto_tax.tax_forms import build_sale_slices
+from test_gains import gains_input
+
+
+def test_sale_slices_subtract_prorated_fees_from_proceeds():
+    df = gains_input([
+        ("01/01/2021 12:00:00 AM", "ETH", "Buy", 1.5, 50.0),
+        ("02/01/2021 12:00:00 AM", "ETH", "Buy", 0.5, 80.0),
+        ("03/01/2021 12:00:00 AM", "ETH", "Sell", -2.0, 100.0),
+    ])
+    df.loc[2, "TxnFee(USD)"] = 10.0
+    _, sells = match_lots(build_assets(df))
+    slices = build_sale_slices(sells)
+    # 200 USD sale value less 10 USD fees, split 3:1 over the two lots
+    assert slices["Proceeds"].tolist() == pytest.approx([142.5, 47.5])
+    assert slices["Cost Basis"].tolist() == pytest.approx([75.0, 40.0])
+    assert slices["Gain"].sum() == pytest.approx(75.0)
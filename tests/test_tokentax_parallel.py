@@ -0,0 +1,31 @@
+import pytest
+from conftest import write_ledger
+from open_crypto_tax.core import Processor
+
+
+def process(input_valid, fee_map, **kwargs):
+    processor = Processor(input_valid)
+    processor.process_tokentax(fee_map=fee_map, **kwargs)
+    return processor.df_tt
+
+
+def test_parallel_output_matches_single_process(ledger):
+    input_valid, fee_map = ledger
+    df_tt = process(input_valid, fee_map)
+    # chunks of 3 rows do not line up with the 4 row pattern of the ledger, the last chunk is partial
+    df_tt_parallel = process(input_valid, fee_map, num_workers=2, chunk_size=3)
+    # each swap is translated into two rows
+    assert df_tt.shape[0] == 50
+    assert df_tt_parallel.equals(df_tt)
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_error_reports_line_of_input_file(tmp_path, capfd, num_workers):
+    # row index 29 is line 31 of the input file (header is line 1), in the 10th chunk of 3 rows
+    input_valid, fee_map = write_ledger(tmp_path / "input_valid.csv", extra_rows={
+        29: {"Date": "01/02/2021 10:29:00 AM", "BuyAsset": "ETH", "BuyQty": 1.0, "BuyTotalUSD": 100.0,
+             "IsOrdinaryIncome": 2.0}})
+    # worker processes print to the inherited stdout file descriptor
+    with pytest.raises(ValueError, match="Unexpected ordinary income value for line 31"):
+        process(input_valid, fee_map, num_workers=num_workers, chunk_size=3)
+    assert "error while processing line 31" in capfd.readouterr().out
@@ -0,0 +1,28 @@
+import pytest
+from units import Units
+
+
+@pytest.mark.parametrize("qty, decimals, units", [
+    ("1.5", 18, 15 * 10 ** 17),
+    (7, 6, 7000000),
+    (0.1, 8, 10000000),
+    ("-2.5e-5", 6, -25),
+    # float noise past the asset's decimals is rounded off
+    (0.1 + 0.2, 6, 300000),
+    (1.2e-5 + 3.4e-6, 18, 15400000000000),
+])
+def test_to_base_units(qty, decimals, units):
+    assert Units.to_base_units(qty, decimals) == units
+
+
+@pytest.mark.parametrize("qty", ["1.1234567", 1.1234567, "2.5e-7"])
+def test_to_base_units_rejects_precision_loss(qty):
+    # e.g. an 18 decimal bridged USDC amount booked as USDC, listed with 6 decimals
+    with pytest.raises(ValueError, match="more than 6 decimals"):
+        Units.to_base_units(qty, 6)
+    assert Units.to_base_units(qty, 6, round_excess=True) in [1123457, 0]
+
+
+def test_format_base_units():
+    assert Units.format_base_units(-1500000, 6) == "-1.5"
+    assert Units.format_base_units(10 ** 18) == "1"
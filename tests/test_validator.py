@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+from conftest import write_ledger
+from open_crypto_tax.core import Validator
+
+BAD_ROWS = {
+    # line 4: missing date
+    2: {"SellAsset": "ETH", "SellQty": 0.5, "SellSpotPriceUSD": 120.0, "SellTotalUSD": 60.0, "BookFeeWith": "sell"},
+    # line 7: unknown BookFeeWith, and a gas row with buy data
+    5: {"Date": "01/06/2021 10:05:00 AM", "BuyAsset": "ETH", "BuyQty": 1.0, "BookFeeWith": "fee"},
+    # line 8: gas row with sell data
+    6: {"Date": "01/07/2021 10:06:00 AM", "SellAsset": "ETH", "SellQty": 0.5, "BookFeeWith": "gas",
+        "FeeChain1": "ETH", "FeeTx1": "0xaa"},
+    # line 11: swap whose sell spot price over-defines an "equal" sell total
+    9: {"Date": "01/10/2021 10:09:00 AM", "SellAsset": "ETH", "SellQty": 0.1, "SellSpotPriceUSD": 100.0,
+        "SellTotalUSD": "equal", "BuyAsset": "UNI", "BuyQty": 2.0, "BuySpotPriceUSD": 5.0, "BuyTotalUSD": 10.0,
+        "BookFeeWith": "buy"},
+    # line 14: fees on two chains and an aux fee
+    12: {"Date": "01/13/2021 10:12:00 AM", "BookFeeWith": "gas", "FeeChain1": "ETH", "FeeTx1": "0xbb",
+         "FeeChain2": "BSC", "FeeTx2": "0xcc", "AuxFeeQty": 1.0},
+}
+
+
+def test_find_errors_reports_every_bad_row(tmp_path):
+    input_file, _ = write_ledger(tmp_path / "input.csv", num_rows=16, extra_rows=BAD_ROWS)
+    errors = Validator(input_file).find_errors()
+    assert list(errors.columns) == Validator.error_columns
+    assert list(errors.itertuples(index=False, name=None)) == [
+        (4, "date", "missing date"),
+        (7, "book_fee_with", "non-null BookFeeWith must be 'buy', 'sell', or 'gas'"),
+        (8, "gas_row", "BookFeeWith is 'gas', but sell/buy data exists"),
+        (11, "over_defined", "sell spot price over-defines"),
+        (14, "fee_chains", "fees booked on several chains - split up"),
+        (14, "aux_fees", "fee chain and aux/usd fees booked together - split up"),
+    ]
+
+
+def test_find_errors_agrees_with_process(tmp_path):
+    input_file, _ = write_ledger(tmp_path / "input.csv", num_rows=16)
+    validator = Validator(input_file)
+    assert validator.find_errors().empty
+    validator.process(tmp_path / "input_valid.csv")
+    # process stops at the first bad row, the first one reported by find_errors
+    input_file, _ = write_ledger(tmp_path / "input.csv", num_rows=16, extra_rows=BAD_ROWS)
+    with pytest.raises(LookupError, match="missing date on line 4"):
+        Validator(input_file).process(tmp_path / "input_valid.csv")
+
+
+def test_find_errors_reports_missing_columns(tmp_path):
+    input_file, _ = write_ledger(tmp_path / "input.csv", num_rows=4)
+    pd.read_csv(input_file).drop(columns=["BookFeeWith", "AuxUSDFee"]).to_csv(input_file, index=False)
+    errors = Validator(input_file).find_errors()
+    assert list(errors.itertuples(index=False, name=None)) == [
+        (1, "columns", "missing columns: BookFeeWith, AuxUSDFee")]
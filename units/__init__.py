@@ -0,0 +1 @@
+from .units import Units, DEFAULT_DECIMALS
@@ -0,0 +1,137 @@
+import functools
+import math
+import numbers
+
+DEFAULT_DECIMALS = 18  # standard EVM currency has 18 decimals
+# assets whose smallest unit is not 1e-18; keyed by symbol only, so a token sharing one of these symbols with other
+# decimals (e.g. 18 decimal bridged USDC) needs its own symbol - its quantities are rejected, not rounded
+ASSET_DECIMALS = {
+    "BTC": 8,
+    "WBTC": 8,
+    "USDC": 6,
+    "USDT": 6,
+}
+INT64_MAX = 2 ** 63 - 1
+MAX_EXACT_FLOAT_INT = 2 ** 53  # ints up to this are exact as float64
+MAX_EXACT_FLOAT_DECIMALS = 22  # 10^22 is the largest exact power of ten as float64
+# digits past an asset's decimals are only rounded off while they change the value by float noise, i.e. by less
+# than 2^-50 of it (a few float64 ulps)
+EXCESS_DIGITS_REL_TOLERANCE_BITS = 50
+
+
+class Units:
+    """
+    Exact quantities as integer base units (e.g. wei) with per-asset decimals.
+    Values are Python ints, or int64 NumPy arrays (scaled down by a common power of ten where exact, see
+    get_scale) that fall back to object arrays of Python ints when a total could still overflow int64,
+    so sums and differences never leave float residue.
+    """
+
+    @staticmethod
+    def get_decimals(asset: str):
+        return ASSET_DECIMALS.get(asset, DEFAULT_DECIMALS)
+
+    @staticmethod
+    def to_base_units(qty, decimals: int = DEFAULT_DECIMALS, round_excess: bool = False):
+        """
+        Converts a quantity to base units, exactly for ints and decimal strings, and from the shortest
+        decimal representation for floats; digits past decimals are rounded half to even if they only
+        amount to float noise (see EXCESS_DIGITS_REL_TOLERANCE_BITS)
+        :param qty: int, float or str quantity
+        :param decimals: int decimals of the asset
+        :param round_excess: bool=False round any digits past decimals if True (e.g. for tolerances), otherwise
+                             a quantity more precise than its asset's base unit raises ValueError
+        :return: int base units
+        """
+        if isinstance(qty, numbers.Integral) and not isinstance(qty, bool):
+            return int(qty) * 10 ** decimals
+        if isinstance(qty, float):
+            if not math.isfinite(qty):
+                raise ValueError(f"cannot convert {qty} to base units")
+            _text = repr(float(qty))
+        else:
+            _text = str(qty).strip()
+        _mantissa, _, _exponent = _text.lower().partition("e")
+        _sign = -1 if _mantissa.startswith("-") else 1
+        _whole, _, _fraction = _mantissa.lstrip("+-").partition(".")
+        if not (_whole + _fraction).isdigit() or (_exponent and not _exponent.lstrip("+-").isdigit()):
+            raise ValueError(f"cannot convert {qty!r} to base units")
+        _digits = int(_whole + _fraction)
+        _shift = decimals - len(_fraction) + (int(_exponent) if _exponent else 0)
+        if _shift >= 0:
+            return _sign * _digits * 10 ** _shift
+        _quotient, _remainder = divmod(_digits, 10 ** -_shift)
+        _twice = 2 * _remainder
+        if _twice > 10 ** -_shift or (_twice == 10 ** -_shift and _quotient % 2 == 1):
+            _quotient += 1
+        if not round_excess and \
+                abs(_quotient * 10 ** -_shift - _digits) << EXCESS_DIGITS_REL_TOLERANCE_BITS > _digits:
+            raise ValueError(f"{qty!r} has more than {decimals} decimals, digits past the asset's base unit would be "
+                             f"lost - is the asset listed in units.ASSET_DECIMALS with the wrong decimals?")
+        return _sign * _quotient
+
+    @staticmethod
+    def from_base_units(units: int, decimals: int = DEFAULT_DECIMALS):
+        """
+        :return: float nearest to units / 10^decimals (int true division is correctly rounded)
+        """
+        return int(units) / 10 ** decimals
+
+    @staticmethod
+    def format_base_units(units: int, decimals: int = DEFAULT_DECIMALS):
+        """
+        :return: str exact decimal representation of units / 10^decimals, without trailing zeros
+        """
+        _sign = "-" if units < 0 else ""
+        _whole, _fraction = divmod(abs(int(units)), 10 ** decimals)
+        _fraction = str(_fraction).rjust(decimals, "0").rstrip("0") if decimals > 0 else ""
+        return f"{_sign}{_whole}.{_fraction}" if _fraction else f"{_sign}{_whole}"
+
+    @staticmethod
+    def get_scale(units: list, max_scale: int = DEFAULT_DECIMALS):
+        """
+        At 18 decimals, int64 only holds about 9.22 tokens, but quantities rarely use every decimal: dividing
+        them all by their largest common power of ten is exact and keeps far larger totals in int64
+        :param units: list of int base units
+        :param max_scale: int largest power of ten to divide by, e.g. the asset's decimals
+        :return: int largest scale <= max_scale such that every value is a multiple of 10^scale
+        """
+        _gcd = functools.reduce(math.gcd, units, 0)
+        if _gcd == 0:
+            return 0
+        scale = 0
+        while scale < max_scale and _gcd % 10 ** (scale + 1) == 0:
+            scale += 1
+        return scale
+
+    @staticmethod
+    def to_array(units: list, scale: int = 0):
+        """
+        :param units: list of int base units
+        :param scale: int (optional) from get_scale; values are divided by 10^scale, i.e. in units of
+                      10^(scale - decimals), as decimals - scale are passed to to_float_array
+        :return: np.ndarray int64, or object array of Python ints if their total could overflow int64
+        """
+        # numpy is only imported for array helpers, so scalar conversions stay light (e.g. balances)
+        import numpy as np
+        if scale > 0:
+            _factor = 10 ** scale
+            units = [u // _factor for u in units]
+        if sum(abs(u) for u in units) <= INT64_MAX:
+            return np.array(units, dtype=np.int64)
+        _array = np.empty(len(units), dtype=object)
+        _array[:] = units
+        return _array
+
+    @staticmethod
+    def to_float_array(units, decimals: int = DEFAULT_DECIMALS):
+        """
+        :param units: np.ndarray base units, from to_array
+        :return: np.ndarray float64 of units / 10^decimals, correctly rounded per value
+        """
+        import numpy as np
+        if units.dtype != object and decimals <= MAX_EXACT_FLOAT_DECIMALS and \
+                (len(units) == 0 or np.abs(units).max() <= MAX_EXACT_FLOAT_INT):
+            # both operands are exact floats, so a single float division is correctly rounded
+            return units / 10 ** decimals
+        return np.array([int(u) / 10 ** decimals for u in units], dtype=np.float64)
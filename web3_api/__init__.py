@@ -1 +1,16 @@
-from .web3_api import Web3Query, Exchange, SwapSummary, PunkSummary
+import importlib
+
+# web3_api.web3_api pulls in web3, so it is only imported when one of its names is used
+_LAZY_ATTRS = {
+    "Web3Query": ".web3_api",
+    "Exchange": ".web3_api",
+    "SwapSummary": ".web3_api",
+    "PunkSummary": ".web3_api",
+}
+__all__ = list(_LAZY_ATTRS.keys())
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        return getattr(importlib.import_module(_LAZY_ATTRS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,184 @@
+import csv
+import math
+import os
+# the cache handles are shared with subgraph_api, which must not depend on web3_api
+from cache_store import FEE_CACHE_FILE, TOKEN_CACHE_FILE, BLOCK_CACHE_FILE, PRICE_CACHE_FILE, db, token_db, \
+    block_db, price_db
+from open_crypto_tax.fee_index import normalize_fee_tx
+
+TX_HASH_NUM_BYTES = 32  # tx hashes of every registered chain, as packed by export_fee_cache
+
+
+def get_cached_token_addresses(chain: str):
+    """
+    Looks up the addresses of tokens whose symbol has been cached (e.g. while importing swaps)
+    :param chain: str chain on which tokens reside
+    :return: dict mapping symbol to token address; symbols shared by several cached tokens are left out
+    """
+    symbol_to_addrs = dict()
+    for key, value in token_db.load().db.items():
+        _addr = key[-42:]
+        if key[:-42] == chain and _addr.startswith("0x"):
+            symbol_to_addrs.setdefault(value[0], set()).add(_addr)
+    return {symbol: addrs.pop() for symbol, addrs in symbol_to_addrs.items() if len(addrs) == 1}
+
+
+def fee_cache_key(chain: str, tx_hash: str, convert_to_usd: bool):
+    return chain + tx_hash + "usd_" + str(convert_to_usd)
+
+
+def parse_fee_cache_key(key: str):
+    """
+    :param key: str fee cache key, e.g. "ETH0xabc...usd_False"
+    :return: tuple of (chain, tx_hash, convert_to_usd), or None if key is not a fee cache key
+    """
+    for suffix, convert_to_usd in [("usd_False", False), ("usd_True", True)]:
+        if key.endswith(suffix):
+            _rest = key[:-len(suffix)]
+            # "x" is not a hex digit, so the hash starts at the last "0x", whatever its length
+            _start = _rest.rfind("0x")
+            _chain = _rest[:_start]
+            _tx_hash = _rest[_start:]
+            if _start > 0 and len(_tx_hash) > 2:
+                try:
+                    int(_tx_hash[2:], 16)
+                except ValueError:
+                    return None
+                return _chain, _tx_hash, convert_to_usd
+    return None
+
+
+def is_valid_fee(value):
+    # zero fees read as cache misses (pickledb returns False for missing keys), so they are refetched anyway
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value) and value > 0
+
+
+def get_fee_cache_stats():
+    """
+    :return: dict of entry counts (per chain and currency), invalid entries, size on disk and
+             lifetime hit statistics of the fee cache, plus entry counts of the token, block and price caches
+    """
+    entries = db.load().db
+    per_chain = dict()
+    num_invalid = 0
+    for key, value in entries.items():
+        _parsed = parse_fee_cache_key(key)
+        if _parsed is None or not is_valid_fee(value):
+            num_invalid += 1
+            continue
+        _chain, _, _convert_to_usd = _parsed
+        _counts = per_chain.setdefault(_chain, {"native": 0, "usd": 0})
+        _counts["usd" if _convert_to_usd else "native"] += 1
+    _lifetime = db.get_lifetime_stats()
+    _lookups = _lifetime["hits"] + _lifetime["misses"]
+    return {
+        "fee_cache": {
+            "file": FEE_CACHE_FILE,
+            "bytes": os.path.getsize(FEE_CACHE_FILE) if os.path.exists(FEE_CACHE_FILE) else 0,
+            "entries": len(entries),
+            "invalid_entries": num_invalid,
+            "chains": per_chain,
+            "lifetime_hits": _lifetime["hits"],
+            "lifetime_misses": _lifetime["misses"],
+            "lifetime_hit_rate": _lifetime["hits"] / _lookups if _lookups > 0 else None,
+        },
+        "token_cache": {"file": TOKEN_CACHE_FILE, "entries": len(token_db.load().db)},
+        "block_cache": {"file": BLOCK_CACHE_FILE, "entries": len(block_db.load().db)},
+        "price_cache": {"file": PRICE_CACHE_FILE, "entries": len(price_db.load().db)},
+    }
+
+
+def export_fee_cache(output_file):
+    """
+    Exports valid fee cache entries as compressed numpy columns (.npz):
+    chain (str), tx_hash (32 raw bytes), convert_to_usd (bool) and fee (float64); entries whose hash is not
+    32 bytes long are left out
+    :param output_file: Path of .npz file
+    :return: int number of exported entries
+    """
+    import numpy as np
+    chains, tx_hashes, convert_to_usds, fees = [], [], [], []
+    for key, value in db.load().db.items():
+        _parsed = parse_fee_cache_key(key)
+        if _parsed is None or not is_valid_fee(value) or len(_parsed[1]) != 2 + 2 * TX_HASH_NUM_BYTES:
+            continue
+        chains.append(_parsed[0])
+        tx_hashes.append(bytes.fromhex(_parsed[1][2:]))
+        convert_to_usds.append(_parsed[2])
+        fees.append(value)
+    np.savez_compressed(output_file,
+                        chain=np.array(chains, dtype=str),
+                        tx_hash=np.array(tx_hashes, dtype=f"S{TX_HASH_NUM_BYTES}"),
+                        convert_to_usd=np.array(convert_to_usds, dtype=bool),
+                        fee=np.array(fees, dtype="float64"))
+    return len(fees)
+
+
+def import_fee_cache(input_file, overwrite: bool = False):
+    """
+    Merges fee cache entries exported by export_fee_cache into the fee cache
+    :param input_file: Path of .npz file
+    :param overwrite: bool=False replaces existing entries if True, otherwise keeps them
+    :return: int number of imported entries
+    """
+    import numpy as np
+    _data = np.load(input_file)
+    num_imported = 0
+    for chain, tx_hash, convert_to_usd, fee in zip(_data["chain"], _data["tx_hash"], _data["convert_to_usd"],
+                                                  _data["fee"]):
+        # fixed-width bytes columns drop trailing zero bytes
+        _tx_hash = "0x" + tx_hash.ljust(TX_HASH_NUM_BYTES, b"\x00").hex()
+        _key = fee_cache_key(str(chain), _tx_hash, bool(convert_to_usd))
+        if not overwrite and db.exists(_key):
+            continue
+        db.set(_key, float(fee))
+        num_imported += 1
+    db.dump()
+    return num_imported
+
+
+def prune_fee_cache(chain: str = None, usd: bool = False, invalid: bool = False, keep_ledger=None):
+    """
+    Removes fee cache entries matching any of the given criteria
+    :param chain: (optional) str remove all entries of this chain
+    :param usd: bool remove USD-converted fees (they depend on subgraph prices at the time of caching)
+    :param invalid: bool remove entries that are not fee cache keys or whose fee is not a positive number
+    :param keep_ledger: (optional) Path of a ledger csv; remove entries of txs not in its FeeTx columns, compared
+                        as normalized hashes (see fee_index.normalize_fee_tx)
+    :return: int number of removed entries
+    """
+    _keep_tx_hashes = None
+    if keep_ledger is not None:
+        _keep_tx_hashes = set()
+        with open(keep_ledger, newline="") as f:
+            for row in csv.DictReader(f):
+                for column, value in row.items():
+                    if column is not None and column.startswith("FeeTx") and column[5:].isdigit() and value:
+                        _keep_tx_hashes.add(normalize_fee_tx(value))
+    entries = db.load().db
+    _remove = []
+    for key, value in entries.items():
+        _parsed = parse_fee_cache_key(key)
+        if _parsed is None or not is_valid_fee(value):
+            if invalid:
+                _remove.append(key)
+            continue
+        _chain, _tx_hash, _convert_to_usd = _parsed
+        if (chain is not None and _chain == chain) or (usd and _convert_to_usd) or \
+                (_keep_tx_hashes is not None and normalize_fee_tx(_tx_hash) not in _keep_tx_hashes):
+            _remove.append(key)
+    for key in _remove:
+        del entries[key]
+    db.dump()
+    return len(_remove)
+
+
+def compact_fee_cache():
+    """
+    Drops invalid entries and rewrites the fee cache file without whitespace
+    :return: tuple of (bytes before, bytes after)
+    """
+    _before = os.path.getsize(FEE_CACHE_FILE) if os.path.exists(FEE_CACHE_FILE) else 0
+    # prune dumps the cache compactly
+    prune_fee_cache(invalid=True)
+    return _before, os.path.getsize(FEE_CACHE_FILE)
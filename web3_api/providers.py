@@ -0,0 +1,195 @@
+import json
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from web3.providers.base import JSONBaseProvider
+from metrics import Metrics
+
+LATENCY_EWMA_ALPHA = 0.2  # weight of the newest request latency in an endpoint's moving average
+ENDPOINT_COOLDOWN = 30  # seconds an endpoint is de-prioritized after a failure, per consecutive failure
+MAX_ENDPOINT_COOLDOWN = 300  # seconds
+FAILOVER_STATUS_CODES = [429, 500, 502, 503, 504]  # HTTP status codes that trigger failover
+# JSON-RPC error codes of an HTTP 200 response that trigger failover: resource unavailable, limit exceeded
+# (rate limiting) and internal error. Request errors (reverts, invalid params, ...) are returned to the caller.
+FAILOVER_RPC_ERROR_CODES = [-32002, -32005, -32603]
+
+
+def parse_endpoint_uris(endpoints: str):
+    """
+    Parses a comma separated list of RPC endpoints (e.g. from a HTTP_PROVIDER_* env var)
+    :param endpoints: str e.g. "https://a.example/rpc,https://b.example/rpc"
+    :return: list of str endpoint uris
+    """
+    if endpoints is None:
+        return []
+    return [uri.strip() for uri in endpoints.split(",") if uri.strip() != ""]
+
+
+class EndpointStats:
+    def __init__(self, uri: str):
+        self.uri = uri
+        self.latency_ewma = None
+        self.num_requests = 0
+        self.num_errors = 0
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+
+    def score(self, now: float):
+        """
+        Lower is healthier. Endpoints cooling down after a failure always rank last.
+        """
+        _latency = self.latency_ewma if self.latency_ewma is not None else 0.0
+        _error_rate = self.num_errors / self.num_requests if self.num_requests > 0 else 0.0
+        return (self.cooldown_until > now, _latency * (1.0 + 10.0 * _error_rate))
+
+    def record_success(self, latency: float):
+        self.num_requests += 1
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * self.latency_ewma
+
+    def record_error(self):
+        self.num_requests += 1
+        self.num_errors += 1
+        self.consecutive_errors += 1
+        _cooldown = min(ENDPOINT_COOLDOWN * self.consecutive_errors, MAX_ENDPOINT_COOLDOWN)
+        self.cooldown_until = time.monotonic() + _cooldown
+
+
+class FailoverHTTPProvider(JSONBaseProvider):
+    """
+    HTTP JSON-RPC provider for one chain backed by a list of endpoints.
+    Requests share a pooled keep-alive session, are routed to the healthiest endpoint
+    (by latency and error rate) and fail over to the next endpoint on transport errors,
+    timeouts, rate limiting and server-side JSON-RPC errors.
+    """
+
+    def __init__(self, endpoint_uris: list, chain: str = "", timeout: int = 30, pool_maxsize: int = 20):
+        super().__init__()
+        if len(endpoint_uris) == 0:
+            raise ValueError(f"No RPC endpoints configured for chain {chain}")
+        self.chain = chain
+        self.timeout = timeout
+        self.endpoints = [EndpointStats(uri) for uri in endpoint_uris]
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        _adapter = HTTPAdapter(pool_connections=len(endpoint_uris), pool_maxsize=pool_maxsize)
+        self.session.mount("http://", _adapter)
+        self.session.mount("https://", _adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def __str__(self):
+        return f"Failover HTTP connection {[e.uri for e in self.endpoints]}"
+
+    @property
+    def endpoint_uri(self):
+        # healthiest endpoint, for callers that expect a single-endpoint provider
+        return self.ranked_endpoints()[0].uri
+
+    def ranked_endpoints(self):
+        now = time.monotonic()
+        with self._lock:
+            return sorted(self.endpoints, key=lambda e: e.score(now))
+
+    @staticmethod
+    def get_endpoint_error(response):
+        """
+        Finds errors of the endpoint itself in a decoded HTTP 200 response
+        :param response: decoded response (dict, or list of dicts for a batch) to a JSON-RPC request or batch
+        :return: str description of the error, or None if the endpoint answered (even with a request error)
+        """
+        for _item in (response if isinstance(response, list) else [response]):
+            _error = _item.get("error") if isinstance(_item, dict) else None
+            if isinstance(_error, dict) and _error.get("code") in FAILOVER_RPC_ERROR_CODES:
+                return f"JSON-RPC error {_error.get('code')}: {_error.get('message')}"
+        return None
+
+    def post(self, request_data: bytes):
+        """
+        Posts raw JSON-RPC request data, failing over across endpoints
+        :param request_data: bytes encoded JSON-RPC request or batch
+        :return: decoded response; the last JSON-RPC error response if every endpoint failed with one
+        """
+        last_error = None
+        last_response = None
+        for endpoint in self.ranked_endpoints():
+            _start = time.perf_counter()
+            try:
+                response = self.session.post(endpoint.uri, data=request_data, timeout=self.timeout)
+                if response.status_code in FAILOVER_STATUS_CODES:
+                    raise requests.HTTPError(f"HTTP {response.status_code} from {endpoint.uri}", response=response)
+                response.raise_for_status()
+            except requests.RequestException as e:
+                with self._lock:
+                    endpoint.record_error()
+                print(f"[WARN] RPC endpoint for chain {self.chain} failed, failing over: {e}")
+                last_error = e
+                continue
+            # each body is decoded once, then checked for endpoint errors; rate limiting and server errors are
+            # mostly returned as JSON-RPC errors with HTTP 200
+            try:
+                _decoded = self.decode_rpc_response(response.content)
+                _endpoint_error = FailoverHTTPProvider.get_endpoint_error(_decoded)
+            except ValueError as e:
+                _decoded = None
+                _endpoint_error = f"response is not JSON ({e})"
+                last_error = e
+            if _endpoint_error is not None:
+                with self._lock:
+                    endpoint.record_error()
+                print(f"[WARN] RPC endpoint for chain {self.chain} failed, failing over: "
+                      f"{_endpoint_error} from {endpoint.uri}")
+                if _decoded is not None:
+                    last_response = _decoded
+                continue
+            with self._lock:
+                endpoint.record_success(time.perf_counter() - _start)
+            return _decoded
+        if last_response is not None:
+            return last_response
+        raise last_error
+
+    def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        return self._timed_post(request_data, method, 1)
+
+    def make_batch_request(self, requests_data: list):
+        """
+        Sends a JSON-RPC batch request
+        :param requests_data: list of JSON-RPC request dicts
+        :return: decoded response (list of response dicts if the batch was accepted)
+        """
+        _method = requests_data[0]["method"] if len(requests_data) > 0 else ""
+        return self._timed_post(json.dumps(requests_data).encode("utf-8"), _method, len(requests_data))
+
+    def _timed_post(self, request_data: bytes, method: str, num_calls: int):
+        # failover retries count towards the latency of the request
+        _start = time.perf_counter()
+        response = None
+        try:
+            response = self.post(request_data)
+            return response
+        finally:
+            Metrics.record_call("rpc", self.chain, method, time.perf_counter() - _start, num_calls,
+                                error=response is None or (isinstance(response, dict) and "error" in response))
+
+    def isConnected(self):
+        try:
+            response = self.make_request("web3_clientVersion", [])
+        except (IOError, ValueError):
+            return False
+        return "error" not in response
+
+    def get_stats(self):
+        """
+        :return: list of dicts with request, error and latency stats per endpoint
+        """
+        with self._lock:
+            return [{"uri": e.uri,
+                     "requests": e.num_requests,
+                     "errors": e.num_errors,
+                     "latency_ewma": e.latency_ewma} for e in self.endpoints]
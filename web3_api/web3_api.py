@@ -3,35 +3,113 @@ from web3.middleware import geth_poa_middleware
 import os
 from dotenv import load_dotenv
 from subgraph_api import SubgraphQuery
+from metrics import Metrics
+from units import Units
+from chain_registry import get_chain, get_registry
+from .providers import FailoverHTTPProvider, parse_endpoint_uris
+from .caches import db, token_db, block_db, fee_cache_key
+from open_crypto_tax.fee_index import normalize_fee_tx
 import json
+import functools
 from collections import defaultdict
-import datetime
-import time
-import pickledb
+import pandas as pd
+from eth_abi import decode_single, encode_single
+from eth_abi.exceptions import DecodingError
 
-db = pickledb.load("_txfee_cache.db", False)
 
-EVM_DECIMALS = 1e18  # standard EVM currency has 18 decimals
+EVM_DECIMALS = 18  # standard EVM currency has 18 decimals
+RPC_TIMEOUT = 30  # seconds
+BLOCK_RECEIPTS_MIN_TXS = 2  # fetch a whole block's receipts once at least this many fee txs share it
+# chains, their RPC endpoints, gas assets and batch limits are declared in the chain registry (ref/chains.json)
+SUPPORTED_CHAINS = get_registry().names
 
 load_dotenv()  # take environment variables from .env
-w3 = dict()
-HTTP_PROVIDER_ETH: str = os.environ.get("HTTP_PROVIDER_ETH")
-w3["ETH"] = Web3(Web3.HTTPProvider(HTTP_PROVIDER_ETH))
-print(f"Current ETH block number: {w3['ETH'].eth.blockNumber}")
-HTTP_PROVIDER_BSC: str = os.environ.get("HTTP_PROVIDER_BSC")
-w3["BSC"] = Web3(Web3.HTTPProvider(HTTP_PROVIDER_BSC))
-# remove POA 32-byte extraData field since BSC is POA w/97 bytes
-w3["BSC"].middleware_onion.inject(geth_poa_middleware, layer=0)
-print(f"Current BSC block number: {w3['BSC'].eth.blockNumber}")
 
 
+def connect(chain: str):
+    """
+    Connects to a chain's RPC providers
+    :param chain: str registered chain
+    :return: Web3 connection
+    """
+    if chain not in get_registry():
+        raise KeyError(f"RPC for chain {chain} not supported!")
+    _chain = get_chain(chain)
+    # the chain's RPC env var may list several comma separated endpoints, used for failover
+    _w3 = Web3(FailoverHTTPProvider(parse_endpoint_uris(_chain.get_rpc_endpoints()), chain, RPC_TIMEOUT))
+    if _chain.poa:
+        # remove POA 32-byte extraData field since POA chains (e.g. BSC) have 97 bytes
+        _w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+    print(f"Current {chain} block number: {_w3.eth.blockNumber}")
+    return _w3
+
+
+class Connections(dict):
+    # connects to a chain's providers on first use, not at import
+    def __missing__(self, chain: str):
+        self[chain] = connect(chain)
+        return self[chain]
+
+
+w3 = Connections()
+
+
+def rpc_batch_request(chain: str, method: str, params_list: list):
+    """
+    Sends many calls of one JSON-RPC method as batch requests, up to the chain's rpc_batch_size calls per
+    HTTP request
+    :param chain: str chain whose provider is queried
+    :param method: str JSON-RPC method (e.g. eth_getBlockByHash)
+    :param params_list: list of params lists, one per call
+    :return: list of raw (hex-encoded) results, in the same order as params_list
+    """
+    results = []
+    _batch_size = get_chain(chain).rpc_batch_size
+    for i in range(0, len(params_list), _batch_size):
+        _batch = [{"jsonrpc": "2.0", "id": j, "method": method, "params": params}
+                  for j, params in enumerate(params_list[i:i + _batch_size])]
+        _response = w3[chain].provider.make_batch_request(_batch)
+        if not isinstance(_response, list):
+            raise ValueError(f"RPC provider for chain {chain} rejected batch request: {_response}")
+        # batch responses may be returned in any order
+        _id_to_response = {r["id"]: r for r in _response}
+        for j in range(0, len(_batch)):
+            if "error" in _id_to_response[j]:
+                raise ValueError(f"RPC error in {method} on chain {chain}: {_id_to_response[j]['error']}")
+            results.append(_id_to_response[j]["result"])
+    return results
+
+
+@functools.lru_cache(maxsize=None)
 def get_abi(filepath):
     with open(filepath) as f:
         abi_json = json.load(f)
     return abi_json
 
 
-ERC20_ABI = get_abi(os.path.join("web3_api", "ref", "token_abi.json"))
+# ABIs are loaded on first use, see __getattr__
+ABI_FILES = {
+    "ERC20_ABI": os.path.join(os.path.dirname(__file__), "ref", "token_abi.json"),
+    "MULTICALL3_ABI": os.path.join(os.path.dirname(__file__), "ref", "multicall3_abi.json"),
+}
+ERC20_SYMBOL_SELECTOR = Web3.keccak(text="symbol()")[:4]
+ERC20_DECIMALS_SELECTOR = Web3.keccak(text="decimals()")[:4]
+ERC20_BALANCE_OF_SELECTOR = Web3.keccak(text="balanceOf(address)")[:4]
+MULTICALL3_GET_ETH_BALANCE_SELECTOR = Web3.keccak(text="getEthBalance(address)")[:4]
+
+
+def __getattr__(name):
+    if name in ABI_FILES:
+        return get_abi(ABI_FILES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def decode_token_symbol(return_data: bytes):
+    # most tokens return an abi-encoded string, but some (e.g. MKR) return a bytes32
+    try:
+        return decode_single("string", return_data)
+    except (DecodingError, UnicodeDecodeError):
+        return return_data[:32].rstrip(b"\x00").decode("utf-8", errors="ignore")
 
 
 class TokenAmount:
@@ -130,10 +208,12 @@ class PunkSummary:
 
 class Web3Query:
 
-    supportedChains = w3.keys()
+    supportedChains = SUPPORTED_CHAINS
     supportedExchanges = [{"dex": "sushiswap", "chain": "ETH"}]
     _chainAddrToSymbolDecimalsCache = defaultdict(dict)
-    _chainAddrToSymbolDecimalsCache["ETH"]["0x0000000000000000000000000000000000000000"] = ("ETH", 18)
+    for _chain in get_registry():
+        _chainAddrToSymbolDecimalsCache[_chain.name]["0x0000000000000000000000000000000000000000"] = \
+            (_chain.gas_asset, _chain.gas_asset_decimals)
 
     def __init__(self):
         # initialize etherscan web3_api
@@ -150,39 +230,26 @@ class Web3Query:
                       fee in chain fee currency
         :return: transaction fee in usd
         """
-        cache_key = chain + tx_hash + "usd_" + str(convert_to_usd)
+        cache_key = fee_cache_key(chain, tx_hash, convert_to_usd)
         if (not overwrite_cache):
             # check if cached value
             # print("getting key: " + cache_key)
             _cached_val = db.get(cache_key)
             if (not _cached_val == False):
+                Metrics.cache_hit("txfee")
                 return _cached_val
+        Metrics.cache_miss("txfee")
 
 
-        if chain not in Web3Query.supportedChains:
-            raise KeyError(f"RPC for chain {chain} not supported!")
-        # get gas used
-        _tx_receipt = w3[chain].eth.get_transaction_receipt(tx_hash)
-        gas_used = _tx_receipt.gasUsed
-        gas_price = w3[chain].eth.get_transaction(tx_hash).gasPrice
-        # base currency fee
-        base_currency_fee = gas_used * gas_price / EVM_DECIMALS
+        # base currency fee, looked up (and cached, with its block) as a batch of one
+        base_currency_fee = Web3Query.get_tx_fees([tx_hash], chain, overwrite_cache)[tx_hash]
         if not convert_to_usd:
-            print("caching key: " + cache_key + " to " + str(base_currency_fee))
-            db.set(cache_key, base_currency_fee)
-            db.dump()
             return base_currency_fee
         # convert to usd via gql dex price at this block
-        gas_asset_price_usd = None
+        _block_number = block_db.get(chain + "_txblock_" + tx_hash.lower())
         try:
-            if chain == "ETH":
-                gas_asset_price_usd = float(SubgraphQuery.get_eth_price_at_block(
-                    _tx_receipt.blockNumber)
-                )
-            elif chain == "BSC":
-                gas_asset_price_usd = float(SubgraphQuery.get_bnb_price_at_bsc_block(
-                    _tx_receipt.blockNumber)
-                )
+            # the override table is checked first, the subgraph is only queried for blocks it does not cover
+            gas_asset_price_usd = SubgraphQuery.get_gas_asset_price_at_block(chain, _block_number)
         except ValueError as e:
             print(f"Error while getting gas asset price for tx: {tx_hash}. \n" +
                   "May be a gap in BSC pancakeswap v1 vs. v2 subgraphs. \n" +
@@ -194,6 +261,153 @@ class Web3Query:
         db.dump()
         return base_currency_fee_usd
 
+    @staticmethod
+    def get_tx_fees(tx_hashes: list, chain: str, overwrite_cache: bool = False):
+        """
+        This function returns the fees of many txs in the chain fee currency (caches).
+        Blocks of txs not seen before (see remember_tx_block) are looked up first, in batched
+        eth_getTransactionByHash requests, which also give the gasPrice of pre-London txs. Receipts of txs
+        sharing a block are then fetched a block at a time via eth_getBlockReceipts, the others in batched
+        eth_getTransactionReceipt requests. Caches are dumped once per call.
+        :param tx_hashes: list of str hashes of txs to retrieve
+        :param chain: str indicating which chain to query.
+                      supported chains defined in Web3Query.supportedChains
+        :param overwrite_cache: bool=False will re-fetch every fee if True
+        :return: dict mapping each tx hash to its fee in chain fee currency
+        """
+        if chain not in Web3Query.supportedChains:
+            raise KeyError(f"RPC for chain {chain} not supported!")
+        result = dict()
+        unresolved = []
+        # dict.fromkeys de-duplicates while keeping order
+        for tx_hash in dict.fromkeys(tx_hashes):
+            if not overwrite_cache:
+                _cached_val = db.get(fee_cache_key(chain, tx_hash, False))
+                if not _cached_val == False:
+                    result[tx_hash] = _cached_val
+                    continue
+            unresolved.append(tx_hash)
+        Metrics.cache_hit("txfee", len(result))
+        Metrics.cache_miss("txfee", len(unresolved))
+        if len(unresolved) == 0:
+            return result
+        # resolve the block of every tx, looking up the txs whose block is not known yet
+        tx_hash_to_block = {tx_hash: block_db.get(chain + "_txblock_" + tx_hash.lower()) for tx_hash in unresolved}
+        tx_hash_to_gas_price = dict()
+        _unknown = [tx_hash for tx_hash, _block_number in tx_hash_to_block.items() if _block_number == False]
+        for tx_hash, _tx in zip(_unknown, rpc_batch_request(chain, "eth_getTransactionByHash",
+                                                            [[tx_hash] for tx_hash in _unknown])):
+            if _tx is None or _tx["blockNumber"] is None:
+                raise ValueError(f"Tx {tx_hash} not found in a block on chain {chain}")
+            tx_hash_to_block[tx_hash] = int(_tx["blockNumber"], 16)
+            tx_hash_to_gas_price[tx_hash] = int(_tx["gasPrice"], 16)
+            Web3Query.remember_tx_block(tx_hash, chain, tx_hash_to_block[tx_hash])
+        block_to_tx_hashes = defaultdict(list)
+        for tx_hash, _block_number in tx_hash_to_block.items():
+            block_to_tx_hashes[_block_number].append(tx_hash)
+        receipts = dict()
+        _blocks = [block for block, _tx_hashes in block_to_tx_hashes.items()
+                   if len(_tx_hashes) >= BLOCK_RECEIPTS_MIN_TXS]
+        if len(_blocks) > 0:
+            try:
+                _block_receipts = rpc_batch_request(chain, "eth_getBlockReceipts", [[hex(b)] for b in _blocks])
+                _wanted = set(tx_hash.lower() for tx_hash in unresolved)
+                for _receipts in _block_receipts:
+                    for _receipt in (_receipts or []):
+                        if _receipt["transactionHash"].lower() in _wanted:
+                            receipts[_receipt["transactionHash"].lower()] = _receipt
+            except ValueError:
+                print(f"[WARN] eth_getBlockReceipts not supported by {chain} provider, fetching receipts per tx")
+        # everything else is fetched per tx, in batches
+        _remaining = [tx_hash for tx_hash in unresolved if tx_hash.lower() not in receipts]
+        for tx_hash, _receipt in zip(_remaining,
+                                     rpc_batch_request(chain, "eth_getTransactionReceipt",
+                                                       [[tx_hash] for tx_hash in _remaining])):
+            if _receipt is None:
+                raise ValueError(f"Receipt for tx {tx_hash} not found on chain {chain}")
+            receipts[tx_hash.lower()] = _receipt
+        # pre-London receipts have no effectiveGasPrice, so gasPrice must come from the tx itself
+        _legacy = [tx_hash for tx_hash in unresolved if receipts[tx_hash.lower()].get("effectiveGasPrice") is None
+                   and tx_hash not in tx_hash_to_gas_price]
+        for tx_hash, _tx in zip(_legacy, rpc_batch_request(chain, "eth_getTransactionByHash",
+                                                           [[tx_hash] for tx_hash in _legacy])):
+            tx_hash_to_gas_price[tx_hash] = int(_tx["gasPrice"], 16)
+        _decimals = get_chain(chain).gas_asset_decimals
+        for tx_hash in unresolved:
+            _receipt = receipts[tx_hash.lower()]
+            if _receipt.get("effectiveGasPrice") is not None:
+                _gas_price = int(_receipt["effectiveGasPrice"], 16)
+            else:
+                _gas_price = tx_hash_to_gas_price[tx_hash]
+            result[tx_hash] = Units.from_base_units(int(_receipt["gasUsed"], 16) * _gas_price, _decimals)
+            Web3Query.remember_tx_block(tx_hash, chain, int(_receipt["blockNumber"], 16))
+            db.set(fee_cache_key(chain, tx_hash, False), result[tx_hash])
+        print(f"[INFO] cached {len(unresolved)} {chain} tx fees")
+        db.dump()
+        block_db.dump()
+        return result
+
+    @staticmethod
+    def get_receipt_fee_wei(tx_receipt, chain: str, tx_hash: str):
+        """
+        Returns the fee paid by a tx in wei, from its receipt alone when possible
+        :param tx_receipt: receipt of tx, as returned by web3
+        :param chain: str chain on which tx resides
+        :param tx_hash: str hash of tx, only used for pre-London receipts
+        :return: int fee in wei
+        """
+        _effective_gas_price = tx_receipt.get("effectiveGasPrice")
+        if _effective_gas_price is not None:
+            # older web3 formatters leave effectiveGasPrice hex-encoded
+            if isinstance(_effective_gas_price, str):
+                _effective_gas_price = int(_effective_gas_price, 16)
+            return tx_receipt["gasUsed"] * _effective_gas_price
+        # pre-London receipts have no effectiveGasPrice, so gasPrice must come from the tx itself
+        return tx_receipt["gasUsed"] * w3[chain].eth.get_transaction(tx_hash).gasPrice
+
+    @staticmethod
+    def remember_tx_block(tx_hash: str, chain: str, block_number: int):
+        """
+        Remembers which block a tx was included in, so fees of txs sharing a block can later
+        be fetched together. Caller is responsible for dumping block_db.
+        """
+        block_db.set(chain + "_txblock_" + tx_hash.lower(), block_number)
+
+    @staticmethod
+    def cache_tx_fee_from_receipt(tx_hash: str, chain: str, tx_receipt):
+        """
+        Caches the chain fee currency fee of a tx whose receipt was fetched for another purpose, keyed by its
+        normalized hash as fees of ledger fee txs are looked up (see fee_index.normalize_fee_tx).
+        Caller is responsible for dumping db and block_db.
+        """
+        tx_hash = normalize_fee_tx(tx_hash)
+        Web3Query.remember_tx_block(tx_hash, chain, tx_receipt["blockNumber"])
+        db.set(fee_cache_key(chain, tx_hash, False), Units.from_base_units(Web3Query.get_receipt_fee_wei(tx_receipt, chain, tx_hash),
+                                                                           get_chain(chain).gas_asset_decimals))
+
+    @staticmethod
+    def multicall(calls: list, chain: str, block_identifier="latest"):
+        """
+        Executes many read-only contract calls as a few aggregated eth_calls via Multicall3
+        :param calls: list of (target address, calldata bytes) tuples
+        :param chain: str chain on which to execute the calls
+        :param block_identifier: (optional) block number at which to execute the calls
+        :return: list of return data bytes (None if a call reverted or returned nothing),
+                 in the same order as calls
+        """
+        if chain not in Web3Query.supportedChains:
+            raise KeyError(f"RPC for chain {chain} not supported!")
+        _chain = get_chain(chain)
+        _multicall = w3[chain].eth.contract(address=_chain.multicall_address, abi=get_abi(ABI_FILES["MULTICALL3_ABI"]))
+        results = []
+        for i in range(0, len(calls), _chain.multicall_batch_size):
+            _calls = [(Web3.toChecksumAddress(target), True, call_data)
+                      for target, call_data in calls[i:i + _chain.multicall_batch_size]]
+            _results = _multicall.functions.aggregate3(_calls).call(block_identifier=block_identifier)
+            for success, return_data in _results:
+                results.append(return_data if (success and len(return_data) > 0) else None)
+        return results
+
     @staticmethod
     def get_token_symbol_and_decimals(addr: str, chain: str):
         """
@@ -204,31 +418,136 @@ class Web3Query:
                     symbol: string symbol of token (e.g. UNI, ETH, etc.)
                     decimals: int representing number of decimals for token
         """
+        return Web3Query.get_tokens_symbol_and_decimals([addr], chain)[addr]
+
+    @staticmethod
+    def get_tokens_symbol_and_decimals(addrs: list, chain: str):
+        """
+        Returns token symbol and decimals for many addresses (caches).
+        Tokens not yet cached are queried together in aggregated Multicall3 eth_calls.
+        :param addrs: list of str Addresses of tokens (e.g. [0x1234...fff, ...])
+        :param chain: chain on which tokens reside (e.g. ETH, BSC, etc.)
+        :return: dict mapping each address to a tuple of (symbol, decimals)
+        """
         if chain not in Web3Query.supportedChains:
             raise KeyError(f"RPC for chain {chain} not supported!")
-        # look for cached result
-        try:
-            return Web3Query._chainAddrToSymbolDecimalsCache[chain][addr]
-        except KeyError:
-            pass  # has not yet been cached
-        _contract = w3["ETH"].eth.contract(
-            address=Web3.toChecksumAddress(addr),
-            abi=ERC20_ABI)
-        _return = (
-            _contract.functions.symbol().call(),
-            _contract.functions.decimals().call())
-        # cache the result
-        Web3Query._chainAddrToSymbolDecimalsCache[chain][addr] = _return
-        return _return
+        result = dict()
+        unresolved = []
+        # dict.fromkeys de-duplicates while keeping order
+        for addr in dict.fromkeys(addrs):
+            # look for cached result, in-process first
+            try:
+                result[addr] = Web3Query._chainAddrToSymbolDecimalsCache[chain][addr]
+                Metrics.cache_hit("token_memory")
+                continue
+            except KeyError:
+                Metrics.cache_miss("token_memory")
+            _cached_val = token_db.get(chain + addr.lower())
+            if not _cached_val == False:
+                result[addr] = tuple(_cached_val)
+                Web3Query._chainAddrToSymbolDecimalsCache[chain][addr] = result[addr]
+                Metrics.cache_hit("token")
+                continue
+            Metrics.cache_miss("token")
+            unresolved.append(addr)
+        if len(unresolved) == 0:
+            return result
+        # query symbol() and decimals() of every unresolved token at once
+        calls = []
+        for addr in unresolved:
+            calls.append((addr, ERC20_SYMBOL_SELECTOR))
+            calls.append((addr, ERC20_DECIMALS_SELECTOR))
+        return_data = Web3Query.multicall(calls, chain)
+        for i, addr in enumerate(unresolved):
+            _symbol_data = return_data[2 * i]
+            _decimals_data = return_data[2 * i + 1]
+            if _symbol_data is None or _decimals_data is None:
+                raise ValueError(f"Unable to get symbol and decimals of token {addr} on chain {chain}")
+            _return = (decode_token_symbol(_symbol_data), int.from_bytes(_decimals_data[:32], "big"))
+            # cache the result
+            result[addr] = _return
+            Web3Query._chainAddrToSymbolDecimalsCache[chain][addr] = _return
+            token_db.set(chain + addr.lower(), list(_return))
+        token_db.dump()
+        return result
+
+    @staticmethod
+    def get_balances_at_block(wallets: list, token_addrs: list, chain: str, block_number: int):
+        """
+        Returns native and ERC-20 balances of many wallets at a block, via aggregated Multicall3 eth_calls
+        (one eth_call per multicall_batch_size balances of the chain, whatever the number of tokens)
+        :param wallets: list of str wallet addresses
+        :param token_addrs: list of str token addresses
+        :param chain: str chain on which to query balances
+        :param block_number: int snapshot block
+        :return: dict mapping (wallet, token addr) to int raw balance (not scaled by decimals);
+                 native balances are keyed by token addr None; None balance if the call failed
+        """
+        keys = []
+        calls = []
+        for wallet in wallets:
+            _wallet_arg = encode_single("address", Web3.toChecksumAddress(wallet))
+            # Multicall3 reads native balances itself
+            keys.append((wallet, None))
+            calls.append((get_chain(chain).multicall_address, MULTICALL3_GET_ETH_BALANCE_SELECTOR + _wallet_arg))
+            for token_addr in token_addrs:
+                keys.append((wallet, token_addr))
+                calls.append((token_addr, ERC20_BALANCE_OF_SELECTOR + _wallet_arg))
+        return_data = Web3Query.multicall(calls, chain, block_number)
+        return {key: int.from_bytes(_data[:32], "big") if _data is not None else None
+                for key, _data in zip(keys, return_data)}
+
+    @staticmethod
+    def get_block_timestamps(block_hashes: list, chain: str):
+        """
+        Returns block timestamps for many block hashes (caches).
+        Blocks not yet cached are fetched in batched eth_getBlockByHash requests, without tx bodies.
+        :param block_hashes: list of block hashes (str or bytes)
+        :param chain: str chain on which blocks reside
+        :return: dict mapping each block hash (hex str) to its int unix timestamp
+        """
+        if chain not in Web3Query.supportedChains:
+            raise KeyError(f"RPC for chain {chain} not supported!")
+        result = dict()
+        unresolved = []
+        # dict.fromkeys de-duplicates while keeping order
+        for block_hash in dict.fromkeys(Web3.toHex(block_hash) for block_hash in block_hashes):
+            _cached_val = block_db.get(chain + block_hash)
+            if not _cached_val == False:
+                result[block_hash] = _cached_val
+                continue
+            unresolved.append(block_hash)
+        Metrics.cache_hit("block_timestamp", len(result))
+        Metrics.cache_miss("block_timestamp", len(unresolved))
+        if len(unresolved) == 0:
+            return result
+        # False -> only tx hashes, not full tx bodies
+        _blocks = rpc_batch_request(chain, "eth_getBlockByHash", [[block_hash, False] for block_hash in unresolved])
+        for block_hash, _block in zip(unresolved, _blocks):
+            if _block is None:
+                raise ValueError(f"Block {block_hash} not found on chain {chain}")
+            result[block_hash] = int(_block["timestamp"], 16)
+            block_db.set(chain + block_hash, result[block_hash])
+        block_db.dump()
+        return result
+
+    @staticmethod
+    def format_block_datetimes(timestamps: list):
+        """
+        Formats unix timestamps as date strings, all at once
+        :param timestamps: list of int unix timestamps
+        :return: list of str dates (e.g. 01/31/2021 01:02:03 PM)
+        """
+        # block timestamps are UTC; the previous per-call local offset arithmetic resolved to UTC
+        # as well, but drifted by an hour whenever daylight savings time differed from today
+        _dates = pd.to_datetime(pd.Series(timestamps, dtype="int64"), unit="s")
+        return _dates.dt.strftime("%m/%d/%Y %I:%M:%S %p").tolist()
 
     @staticmethod
     def get_block_datetime(block_hash: str, chain: str):
-        # NOTE: currently doesn't account for daylight savings time well
-        timestamp = w3[chain].eth.get_block(block_hash)["timestamp"]
-        utc_offset = time.localtime().tm_gmtoff / 3600
-        dt_utc = datetime.datetime.fromtimestamp(timestamp) #  , tz=pytz.utc)
-        dt_local = dt_utc - datetime.timedelta(hours=utc_offset)
-        return dt_local.strftime("%m/%d/%Y %I:%M:%S %p")
+        block_hash = Web3.toHex(block_hash)
+        timestamp = Web3Query.get_block_timestamps([block_hash], chain)[block_hash]
+        return Web3Query.format_block_datetimes([timestamp])[0]
 
     @staticmethod
     def get_swap_summary(tx_hash: str, exchange: Exchange):
@@ -236,61 +555,121 @@ class Web3Query:
         This function tries to return a swap tx's summary given a tx_hash
         :param tx_hash: str hash of tx to retrieve
         :param exchange: Exchange which tx performed a swap on
-        :return: tbd
+        :return: SwapSummary, or None if tx was reverted
         """
-        try:
-            # transaction
-            _tx = w3[exchange.chain].eth.get_transaction(tx_hash)
-            # receipt for logs and block (for time)
-            _tx_receipt = w3[exchange.chain].eth.get_transaction_receipt(tx_hash)
+        return Web3Query.get_swap_summaries([(tx_hash, exchange)])[0]
+
+    @staticmethod
+    @Metrics.timed("swap_summaries")
+    def get_swap_summaries(swaps: list):
+        """
+        This function tries to return the summaries of many swap txs.
+        Token metadata and block timestamps of all swaps are resolved in bulk.
+        :param swaps: list of (tx_hash, Exchange) tuples
+        :return: list of SwapSummary (None for reverted txs), in the same order as swaps
+        """
+        # pass 1: fetch every tx and receipt, and collect what must be resolved per chain
+        fetched = []
+        chain_to_token_addrs = defaultdict(list)
+        chain_to_block_hashes = defaultdict(list)
+        for i, (tx_hash, exchange) in enumerate(swaps):
+            print(f"...fetching tx {i + 1} of {len(swaps)}")
+            try:
+                # transaction
+                _tx = w3[exchange.chain].eth.get_transaction(tx_hash)
+                # receipt for logs and block (for time)
+                _tx_receipt = w3[exchange.chain].eth.get_transaction_receipt(tx_hash)
+            except ValueError as e:
+                print(f"Error while getting tx summary for tx:: {tx_hash}. \n" +
+                      "Ensure tx is a valid swap on a valid exchange. \n")
+                raise e
+            # the swap's receipt already has everything needed for its fee
+            Web3Query.cache_tx_fee_from_receipt(tx_hash, exchange.chain, _tx_receipt)
             if _tx_receipt["status"] == 0:
                 print(f"WARNING: tx {tx_hash} was reverted by EVM, skipping...")
-                return None
-            _logs = _tx_receipt.logs
-            _date_time = Web3Query.get_block_datetime(_tx_receipt.blockHash, exchange.chain)
-            if exchange.name == "sushiswap" and exchange.chain == "ETH" and exchange.method == "Swap ETH For Exact Tokens":
-                _amount_eth = _logs[0]["data"]
-                _amount_eth = int(_amount_eth, 16) / 1e18
-                _eth_price = float(SubgraphQuery.get_eth_price_at_block(_tx_receipt.blockNumber))
-                _total_eth_usd = _amount_eth * _eth_price
-                # token addr is arg 3 of 4, prepend w 0x
-                _token_addr = "0x" + _tx["input"][-40:]
-                # get token symbol and decimals
-                _token_symbol, _token_decimals = Web3Query.get_token_symbol_and_decimals(_token_addr, exchange.chain)
-                _amount_token = int("0x" + _logs[-1]["data"][2+64*2:2+64*3], 16) / (pow(10, _token_decimals))
-                swap_summary = SwapSummary(
-                    sent=TokenAmount("ETH", "0x0", _amount_eth, _eth_price, _total_eth_usd),
-                    received=TokenAmount(_token_symbol, _token_addr, _amount_token, "", "equal"),
-                    book_fee_with="buy",
-                    fee_chain=exchange.chain,
-                    tx_hash=tx_hash,
-                    date_time=_date_time
-                )
-            if exchange.name == "sushiswap" and exchange.chain == "ETH" and exchange.method == "Swap Exact Tokens For ETH":
-                # token addr is address of log 0
-                _token_addr = _logs[0]["address"]
-                # get token symbol and decimals
-                _token_symbol, _token_decimals = Web3Query.get_token_symbol_and_decimals(_token_addr, exchange.chain)
-                _amount_token = int(_logs[0]["data"], 16) / (pow(10, _token_decimals))
-                # get received eth amount and calc usd values
-                _amount_eth = int(_logs[-1]["data"], 16) / 1e18
-                _eth_price = float(SubgraphQuery.get_eth_price_at_block(_tx_receipt.blockNumber))
-                _total_eth_usd = _amount_eth * _eth_price
-                swap_summary = SwapSummary(
-                    sent=TokenAmount(_token_symbol, _token_addr, _amount_token, "", "equal"),
-                    received=TokenAmount("ETH", "0x0", _amount_eth, _eth_price, _total_eth_usd),
-                    book_fee_with="sell",
-                    fee_chain=exchange.chain,
-                    tx_hash=tx_hash,
-                    date_time=_date_time
-                )
-            return swap_summary
-        except ValueError as e:
-            print(f"Error while getting tx summary for tx:: {tx_hash}. \n" +
-                  "Ensure tx is a valid swap on a valid exchange. \n")
-            raise e
+                fetched.append(None)
+                continue
+            _token_addr = Web3Query._get_swap_token_addr(_tx, _tx_receipt, exchange)
+            if _token_addr is not None:
+                chain_to_token_addrs[exchange.chain].append(_token_addr)
+            chain_to_block_hashes[exchange.chain].append(_tx_receipt.blockHash)
+            fetched.append((_tx, _tx_receipt, _token_addr))
+        db.dump()
+        block_db.dump()
+        # pass 2: resolve token metadata and block dates per chain, in bulk
+        chain_to_tokens = dict()
+        for chain, addrs in chain_to_token_addrs.items():
+            chain_to_tokens[chain] = Web3Query.get_tokens_symbol_and_decimals(addrs, chain)
+        block_hash_to_date_time = dict()
+        for chain, block_hashes in chain_to_block_hashes.items():
+            _timestamps = Web3Query.get_block_timestamps(block_hashes, chain)
+            _date_times = Web3Query.format_block_datetimes(list(_timestamps.values()))
+            for block_hash, _date_time in zip(_timestamps.keys(), _date_times):
+                block_hash_to_date_time[(chain, block_hash)] = _date_time
+        # pass 3: build summaries
+        summaries = []
+        for (tx_hash, exchange), _fetched in zip(swaps, fetched):
+            if _fetched is None:
+                summaries.append(None)
+                continue
+            _tx, _tx_receipt, _token_addr = _fetched
+            _token = chain_to_tokens[exchange.chain][_token_addr] if _token_addr is not None else None
+            _date_time = block_hash_to_date_time[(exchange.chain, Web3.toHex(_tx_receipt.blockHash))]
+            try:
+                summaries.append(Web3Query._build_swap_summary(tx_hash, exchange, _tx_receipt, _token_addr,
+                                                               _token, _date_time))
+            except ValueError as e:
+                print(f"Error while getting tx summary for tx:: {tx_hash}. \n" +
+                      "Ensure tx is a valid swap on a valid exchange. \n")
+                raise e
+        return summaries
+
+    @staticmethod
+    def _get_swap_token_addr(tx, tx_receipt, exchange: Exchange):
+        if exchange.name == "sushiswap" and exchange.chain == "ETH" and exchange.method == "Swap ETH For Exact Tokens":
+            # token addr is arg 3 of 4, prepend w 0x
+            return "0x" + tx["input"][-40:]
+        if exchange.name == "sushiswap" and exchange.chain == "ETH" and exchange.method == "Swap Exact Tokens For ETH":
+            # token addr is address of log 0
+            return tx_receipt.logs[0]["address"]
         return None
 
+    @staticmethod
+    def _build_swap_summary(tx_hash: str, exchange: Exchange, tx_receipt, token_addr: str, token: tuple,
+                            date_time: str):
+        _logs = tx_receipt.logs
+        if exchange.name == "sushiswap" and exchange.chain == "ETH" and exchange.method == "Swap ETH For Exact Tokens":
+            _amount_eth = _logs[0]["data"]
+            _amount_eth = Units.from_base_units(int(_amount_eth, 16), EVM_DECIMALS)
+            _eth_price = SubgraphQuery.get_gas_asset_price_at_block("ETH", tx_receipt.blockNumber)
+            _total_eth_usd = _amount_eth * _eth_price
+            _token_symbol, _token_decimals = token
+            _amount_token = Units.from_base_units(int("0x" + _logs[-1]["data"][2+64*2:2+64*3], 16), _token_decimals)
+            return SwapSummary(
+                sent=TokenAmount("ETH", "0x0", _amount_eth, _eth_price, _total_eth_usd),
+                received=TokenAmount(_token_symbol, token_addr, _amount_token, "", "equal"),
+                book_fee_with="buy",
+                fee_chain=exchange.chain,
+                tx_hash=tx_hash,
+                date_time=date_time
+            )
+        if exchange.name == "sushiswap" and exchange.chain == "ETH" and exchange.method == "Swap Exact Tokens For ETH":
+            _token_symbol, _token_decimals = token
+            _amount_token = Units.from_base_units(int(_logs[0]["data"], 16), _token_decimals)
+            # get received eth amount and calc usd values
+            _amount_eth = Units.from_base_units(int(_logs[-1]["data"], 16), EVM_DECIMALS)
+            _eth_price = SubgraphQuery.get_gas_asset_price_at_block("ETH", tx_receipt.blockNumber)
+            _total_eth_usd = _amount_eth * _eth_price
+            return SwapSummary(
+                sent=TokenAmount(_token_symbol, token_addr, _amount_token, "", "equal"),
+                received=TokenAmount("ETH", "0x0", _amount_eth, _eth_price, _total_eth_usd),
+                book_fee_with="sell",
+                fee_chain=exchange.chain,
+                tx_hash=tx_hash,
+                date_time=date_time
+            )
+        raise ValueError(f"Unsupported swap {exchange.name} {exchange.chain} {exchange.method}")
+
     @staticmethod
     def get_punk_summary(tx_hash: str, method: str):
         """
@@ -314,7 +693,7 @@ class Web3Query:
                 return None
             _logs = _tx_receipt.logs
             if method == "Offer Punk For Sale" or method == "Offer Punk For Sale To Address":
-                val_eth = int(_logs[0]["data"], 16) / 1e18
+                val_eth = Units.from_base_units(int(_logs[0]["data"], 16), EVM_DECIMALS)
                 punk_id = int.from_bytes(_logs[0]['topics'][1], "big")
                 _to_address = ""
                 if method == "Offer Punk For Sale To Address":